@@ -35,13 +35,24 @@ class AgentAlertManager(object):
         for aggregate_type in AggregateStatusType._str_map.keys():
             agent.aparam_aggstatus[aggregate_type] = DeviceStatusType.STATUS_UNKNOWN
         agent.aparam_set_aggstatus = self.aparam_set_aggstatus
-    
+
+        # One long-lived publisher for all the alerts of the agent.
+        self._alert_publisher = AlertPublisher()
+
+    def alert_batch(self):
+        """
+        Context coalescing the alerts raised by several process_alerts calls,
+        e.g. for all the values of a sample, into one publish cycle.
+        """
+        return self._alert_publisher.batch()
+
     def process_alerts(self, **kwargs):
 
         log.debug("process_alerts: aparam_alerts=%s; kwargs=%s", self._agent.aparam_alerts, kwargs)
 
-        for a in self._agent.aparam_alerts:
-            a.eval_alert(**kwargs)
+        with self._alert_publisher.batch():
+            for a in self._agent.aparam_alerts:
+                a.eval_alert(**kwargs)
 
         # update the aggreate status for this device
         self._process_aggregate_alerts()
@@ -168,6 +179,7 @@ class AgentAlertManager(object):
                     if cls == 'LateDataAlert':
                         alert_def['get_state'] = self._agent._fsm.get_current_state                    
                     alert = eval('%s(**alert_def)' % cls)
+                    alert._publisher = self._alert_publisher
                     self._agent.aparam_alerts.append(alert)
                 except Exception as ex:
                     log.error('Agent %s error constructing alert %s. Exception: %s.',
@@ -194,6 +206,7 @@ class AgentAlertManager(object):
         """
         """
         [a.stop() for a in self._agent.aparam_alerts]
+        self._alert_publisher.close()
         
     def aparam_set_aggstatus(self, params):
         return -1
@@ -12,10 +12,12 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 # Basic Pyon imports
-from pyon.public import log
+from pyon.public import log, CFG
 
 # Standard imports.
 import uuid
+import logging
+import collections
 
 # 3rd party.
 import gevent
@@ -35,13 +37,29 @@ from ion.agents.populate_rdt import populate_rdt
 
 class AgentStreamPublisher(object):
     """
+    Samples are buffered per stream, oldest first, in a ring buffer of at most
+    MAX_BUFFERED_SAMPLES; when it is full the oldest sample is dropped.  Without
+    a publication rate every sample is published as it arrives.  With one, the
+    buffer is published by the rate loop, and also as soon as it holds
+    PUBLISH_COUNT samples or PUBLISH_BYTES bytes of values, or its oldest sample
+    is PUBLISH_AGE seconds old (0 disables a threshold).
     """
+    MAX_BUFFERED_SAMPLES = CFG.get_safe('agent.stream_buffer.max_samples', 10000)
+    PUBLISH_COUNT = CFG.get_safe('agent.stream_buffer.publish_count', 0)
+    PUBLISH_BYTES = CFG.get_safe('agent.stream_buffer.publish_bytes', 0)
+    PUBLISH_AGE = CFG.get_safe('agent.stream_buffer.publish_age', 0)
+
     def __init__(self, agent):
         self._agent = agent
         self._stream_defs = {}
+        self._rdt_templates = {}
         self._publishers = {}
         self._stream_greenlets = {}
         self._stream_buffers = {}
+        self._buffer_bytes = {}
+        self._buffer_stats = {}
+        self._age_timers = {}
+        self._overflowing = set()
         self._connection_ID = None
         self._connection_index = {}
         
@@ -72,6 +90,8 @@ class AgentStreamPublisher(object):
                     stream_def = config['stream_definition_ref']
                     self._stream_defs[stream_name] = stream_def
                     rdt = RecordDictionaryTool(stream_definition_id=stream_def)    
+                # Granules are built from an empty copy of this one.
+                self._rdt_templates[stream_name] = rdt
                 self._agent.aparam_streams[stream_name] = rdt.fields
                 self._agent.aparam_pubrate[stream_name] = 0
             except Exception as e:
@@ -94,7 +114,10 @@ class AgentStreamPublisher(object):
                                     stream_id=stream_id, stream_route=route)
                 self._publishers[stream_name] = publisher
                 self._stream_greenlets[stream_name] = None
-                self._stream_buffers[stream_name] = []
+                self._stream_buffers[stream_name] = collections.deque(maxlen=self.MAX_BUFFERED_SAMPLES)
+                self._buffer_bytes[stream_name] = 0
+                self._buffer_stats[stream_name] = collections.Counter()
+                self._age_timers[stream_name] = None
         
             except Exception as e:
                 errmsg = 'Instrument agent %s' % self._agent._proc_name
@@ -111,8 +134,8 @@ class AgentStreamPublisher(object):
         
         try:
             stream_name = sample['stream_name']
-            self._stream_buffers[stream_name].insert(0, sample)
-            if not self._stream_greenlets[stream_name]:
+            self._buffer_sample(stream_name, sample)
+            if self._publish_due(stream_name):
                 self._publish_stream_buffer(stream_name)
 
         except KeyError:
@@ -127,16 +150,90 @@ class AgentStreamPublisher(object):
         for sample in sample_list:
             try:
                 stream_name = sample['stream_name']
-                self._stream_buffers[stream_name].insert(0, sample)
+                self._buffer_sample(stream_name, sample)
                 streams.add(stream_name)
             except KeyError:
                 log.warning('Instrument agent %s received sample with bad stream name %s.',
                           self._agent._proc_name, stream_name)
 
         for stream_name in streams:
-            if not self._stream_greenlets[stream_name]:
+            if self._publish_due(stream_name):
                 self._publish_stream_buffer(stream_name)
 
+    def _buffer_sample(self, stream_name, sample):
+        """
+        Appends a sample to the stream buffer, dropping the oldest one if it is full.
+        """
+        buf = self._stream_buffers[stream_name]
+        stats = self._buffer_stats[stream_name]
+        nbytes = self._sample_size(sample) if self.PUBLISH_BYTES > 0 else 0
+
+        if len(buf) == buf.maxlen:
+            # The deque drops the oldest sample on append.
+            self._buffer_bytes[stream_name] -= self._sample_size(buf[0]) if nbytes else 0
+            stats['dropped'] += 1
+            if stream_name not in self._overflowing:
+                self._overflowing.add(stream_name)
+                stats['overflows'] += 1
+                log.warning('Instrument agent %s stream %s buffer is full (%i samples), dropping the oldest samples. '
+                            '%i samples dropped so far.', self._agent._proc_name, stream_name,
+                            buf.maxlen, stats['dropped'])
+
+        elif not buf and self.PUBLISH_AGE > 0 and self._stream_greenlets[stream_name] \
+                and not self._age_timers[stream_name]:
+            self._age_timers[stream_name] = gevent.spawn_later(self.PUBLISH_AGE, self._publish_aged, stream_name)
+
+        buf.append(sample)
+        self._buffer_bytes[stream_name] += nbytes
+        stats['buffered'] += 1
+
+    def _publish_due(self, stream_name):
+        """
+        True if the stream buffer has to be published now rather than by the rate loop.
+        """
+        if not self._stream_greenlets[stream_name]:
+            return True
+        if self.PUBLISH_COUNT > 0 and len(self._stream_buffers[stream_name]) >= self.PUBLISH_COUNT:
+            return True
+        if self.PUBLISH_BYTES > 0 and self._buffer_bytes[stream_name] >= self.PUBLISH_BYTES:
+            return True
+        return False
+
+    def _publish_aged(self, stream_name):
+        # The buffer may have been published since this timer was set.
+        if self._age_timers.get(stream_name) is gevent.getcurrent():
+            self._publish_stream_buffer(stream_name)
+
+    @staticmethod
+    def _sample_size(sample):
+        """
+        Approximate size in bytes of the values of a sample.
+        """
+        nbytes = 0
+        for val in sample.get('values', []):
+            value = val.get('value') if isinstance(val, dict) else val
+            if isinstance(value, basestring):
+                nbytes += len(value)
+            elif isinstance(value, (list, tuple)):
+                nbytes += 8 * len(value)
+            else:
+                nbytes += 8
+        return nbytes
+
+    def buffer_stats(self, stream_name=None):
+        """
+        Returns the buffer counters of a stream, or a dict of them for all the streams:
+        samples buffered, published and dropped, the number of times the buffer overflowed,
+        and the samples and bytes currently waiting.
+        """
+        if stream_name is None:
+            return {name: self.buffer_stats(name) for name in self._stream_buffers}
+        stats = self._buffer_stats[stream_name]
+        return {'buffered': stats['buffered'], 'published': stats['published'],
+                'dropped': stats['dropped'], 'overflows': stats['overflows'],
+                'waiting': len(self._stream_buffers[stream_name]),
+                'waiting_bytes': self._buffer_bytes[stream_name]}
+
 
     def aparam_set_streams(self, params):
         return -1
@@ -187,30 +284,30 @@ class AgentStreamPublisher(object):
         """
 
         try:
-            buf_len = len(self._stream_buffers[stream_name])
-            if buf_len == 0:
+            self._age_timers[stream_name] = None
+            buf = self._stream_buffers[stream_name]
+            if not buf:
                 return
 
-            stream_def = self._stream_defs[stream_name]
-            if isinstance(stream_def, str):
-                rdt = RecordDictionaryTool(stream_definition_id=stream_def)
-            else:
-                rdt = RecordDictionaryTool(stream_definition=stream_def)
-                
+            rdt = self._rdt_templates[stream_name].empty_copy()
             publisher = self._publishers[stream_name]
-                
-            vals = []
-            for x in xrange(buf_len):
-                vals.append(self._stream_buffers[stream_name].pop())
+
+            # Oldest first.
+            vals = list(buf)
+            buf.clear()
+            self._buffer_bytes[stream_name] = 0
+            self._overflowing.discard(stream_name)
     
             rdt = populate_rdt(rdt, vals)
             
-            log.info('Outgoing granule: %s',
-                     ['%s: %s'%(k,v) for k,v in rdt.iteritems()])
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('Outgoing granule: %s',
+                          ['%s: %s'%(k,v) for k,v in rdt.iteritems()])
             g = rdt.to_granule(data_producer_id=self._agent.resource_id, connection_id=self._connection_ID.hex,
                     connection_index=str(self._connection_index[stream_name]))
             
             publisher.publish(g)
+            self._buffer_stats[stream_name]['published'] += len(vals)
             log.info('Instrument agent %s published data granule on stream %s.',
                 self._agent._proc_name, stream_name)
             log.info('Connection id: %s, connection index: %i.',
@@ -11,11 +11,13 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 # Pyon imports
-from pyon.public import IonObject, log
+from pyon.public import IonObject, log, CFG
 
 # Standard imports.
 import time
 import copy
+import collections
+from contextlib import contextmanager
 
 # gevent.
 import gevent
@@ -32,6 +34,122 @@ from pyon.event.event import EventPublisher
 from pyon.agent.agent import ResourceAgentState
 
 
+class AlertPublisher(object):
+    """
+    Publishes the alert events of an agent through one long-lived
+    EventPublisher. Alerts raised inside a batch are sent together when the
+    outermost batch ends, keeping only the last event of each alert.
+    An alert publishing more than FLAP_LIMIT events within FLAP_INTERVAL
+    seconds is held back and its latest event sent once the interval allows
+    it (0 disables the limit).
+    """
+    FLAP_INTERVAL = CFG.get_safe('agent.alerts.flap_interval', 10)
+    FLAP_LIMIT = CFG.get_safe('agent.alerts.flap_limit', 10)
+
+    def __init__(self, event_publisher=None, flap_interval=None, flap_limit=None):
+        self._event_publisher = event_publisher
+        self._owns_publisher = event_publisher is None
+        self._flap_interval = self.FLAP_INTERVAL if flap_interval is None else flap_interval
+        self._flap_limit = self.FLAP_LIMIT if flap_limit is None else flap_limit
+        self._batch_depth = 0
+        self._batched = collections.OrderedDict()   # alert -> event data
+        self._held = collections.OrderedDict()      # alert -> event data
+        self._sent_times = {}                       # alert -> publish times
+        self._sent_sub_types = {}                   # alert -> last sub_type sent
+        self._release_gl = None
+        self.published = 0
+        self.held = 0
+
+    def __deepcopy__(self, memo):
+        # Alerts copied by the alert manager keep the agent publisher.
+        return self
+
+    @contextmanager
+    def batch(self):
+        """
+        Coalesce the alerts published in the block into one publish cycle.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def publish(self, event_data):
+        key = (event_data.get('origin'), event_data.get('name'))
+        if self._batch_depth:
+            coalesced = self._batched.pop(key, None)
+            self._batched[key] = (event_data, coalesced is not None)
+        else:
+            self._send(key, event_data)
+
+    def flush(self):
+        """
+        Send the events of the current batch.
+        """
+        batched = self._batched
+        self._batched = collections.OrderedDict()
+        for key, (event_data, coalesced) in batched.iteritems():
+            # An alert that flapped back to the state last sent is not resent.
+            if coalesced and self._sent_sub_types.get(key) == event_data.get('sub_type'):
+                continue
+            self._send(key, event_data)
+
+    def _send(self, key, event_data):
+        now = time.time()
+        if self._flap_interval and self._flap_limit:
+            times = self._sent_times.setdefault(key, collections.deque())
+            while times and times[0] <= now - self._flap_interval:
+                times.popleft()
+            if len(times) >= self._flap_limit:
+                self._held[key] = event_data
+                self.held += 1
+                if self._release_gl is None:
+                    self._release_gl = gevent.spawn_later(times[0] + self._flap_interval - now,
+                                                          self._release_held)
+                return
+            times.append(now)
+
+        # A newer event supersedes one held back for the same alert.
+        self._held.pop(key, None)
+        self._sent_sub_types[key] = event_data.get('sub_type')
+        if self._event_publisher is None:
+            self._event_publisher = EventPublisher()
+        try:
+            self._event_publisher.publish_event(**event_data)
+            self.published += 1
+        except Exception as ex:
+            log.error('Could not publish alert %s. Exception: %s', event_data.get('name'), str(ex))
+
+    def _release_held(self):
+        self._release_gl = None
+        held = self._held
+        self._held = collections.OrderedDict()
+        for key, event_data in held.iteritems():
+            self._send(key, event_data)
+
+    def close(self):
+        if self._release_gl:
+            self._release_gl.kill()
+            self._release_gl = None
+        self._held.clear()
+        if self._owns_publisher and self._event_publisher is not None:
+            self._event_publisher.close()
+            self._event_publisher = None
+
+_default_publisher = None
+
+def get_alert_publisher():
+    """
+    Publisher of the alerts not owned by an agent alert manager.
+    """
+    global _default_publisher
+    if _default_publisher is None:
+        _default_publisher = AlertPublisher()
+    return _default_publisher
+
 class BaseAlert(object):
     """
     Base class for all alert types.
@@ -110,6 +228,7 @@ class BaseAlert(object):
         self._status = None
         self._prev_status = None
         self._current_value = None
+        self._publisher = None
 
     def get_status(self):
         """
@@ -158,8 +277,7 @@ class BaseAlert(object):
         """
         event_data = self.make_event_data()
         log.trace("publishing alert: %s", event_data)
-        pub = EventPublisher()
-        pub.publish_event(**event_data)
+        (self._publisher or get_alert_publisher()).publish(event_data)
 
     def stop(self):
         """
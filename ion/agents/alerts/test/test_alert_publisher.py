@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.alerts.test.test_alert_publisher
+@file ion/agents/alerts/test/test_alert_publisher.py
+@brief Unit tests for batched and rate limited alert publication.
+"""
+
+__license__ = 'Apache 2.0'
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+import gevent
+
+from pyon.util.unit_test import PyonTestCase
+
+from interface.objects import StreamAlertType, AggregateStatusType
+
+from ion.agents.alerts.alerts import AlertPublisher, IntervalAlert
+
+WARNING = StreamAlertType._str_map[StreamAlertType.WARNING]
+ALL_CLEAR = StreamAlertType._str_map[StreamAlertType.ALL_CLEAR]
+
+
+class LocalEventSink(object):
+    """
+    Stand-in EventPublisher keeping the published events.
+    """
+    def __init__(self):
+        self.events = []
+        self.closed = False
+
+    def publish_event(self, **kwargs):
+        self.events.append(kwargs)
+
+    def close(self):
+        self.closed = True
+
+
+@attr('UNIT', group='sa')
+class TestAlertPublisher(PyonTestCase):
+
+    def make_alert(self, publisher, name='current_warning_interval'):
+        alert = IntervalAlert(name=name, description='Current is above normal range.',
+                              aggregate_type=AggregateStatusType.AGGREGATE_DATA,
+                              alert_type=StreamAlertType.WARNING, resource_id='abc123',
+                              origin_type='InstrumentDevice', stream_name='fakestreamname',
+                              value_id='port_current', lower_bound=10.5, lower_rel_op='<')
+        alert._publisher = publisher
+        return alert
+
+    def eval_values(self, alert, values):
+        for value in values:
+            alert.eval_alert(stream_name='fakestreamname', value=value, value_id='port_current')
+
+    def test_publisher_created_once(self):
+        sink = LocalEventSink()
+        with patch('ion.agents.alerts.alerts.EventPublisher', return_value=sink) as event_publisher:
+            publisher = AlertPublisher(flap_interval=0)
+            alerts = [self.make_alert(publisher, 'alert_%s' % i) for i in range(3)]
+            for alert in alerts:
+                self.eval_values(alert, [20, 5, 20, 5])
+            publisher.close()
+
+        self.assertEquals(event_publisher.call_count, 1)
+        self.assertEquals(len(sink.events), 12)
+        self.assertTrue(sink.closed)
+
+    def test_batch_coalesces(self):
+        sink = LocalEventSink()
+        publisher = AlertPublisher(sink, flap_interval=0)
+        alert = self.make_alert(publisher)
+
+        with publisher.batch():
+            self.eval_values(alert, [20, 5, 20, 5])
+        self.assertEquals([e['sub_type'] for e in sink.events], [WARNING])
+
+        # Flapping back to the state already sent publishes nothing.
+        with publisher.batch():
+            self.eval_values(alert, [20, 5])
+        self.assertEquals(len(sink.events), 1)
+
+        with publisher.batch():
+            with publisher.batch():
+                self.eval_values(alert, [20])
+            self.assertEquals(len(sink.events), 1)
+        self.assertEquals([e['sub_type'] for e in sink.events], [WARNING, ALL_CLEAR])
+
+    def test_event_storm(self):
+        sink = LocalEventSink()
+        publisher = AlertPublisher(sink, flap_interval=0.2, flap_limit=3)
+        alert = self.make_alert(publisher)
+        other = self.make_alert(publisher, 'other_alert')
+
+        self.eval_values(alert, [20, 5] * 50)
+        self.eval_values(other, [5])
+        self.assertEquals(len(sink.events), 4)
+        self.assertEquals(publisher.held, 97)
+
+        # The latest held event goes out once the interval passed.
+        gevent.sleep(0.3)
+        self.assertEquals(len(sink.events), 5)
+        self.assertEquals(sink.events[-1]['name'], 'current_warning_interval')
+        self.assertEquals(sink.events[-1]['sub_type'], WARNING)
+        publisher.close()
@@ -11,6 +11,7 @@ __license__ = 'Apache 2.0'
 
 import time
 import thread
+import select
 
 # We import "regular" zmq, not the patched version because
 # we handle the nonblocking sockets directly as they need to work
@@ -23,6 +24,35 @@ from pyon.core.exception import InstDriverClientTimeoutError
 
 
 EXCEPTION_FACTORY = ExceptionFactory()
+
+# Longest wait of the event thread before it checks its stop flag.
+EVENT_WAIT_TIMEOUT = .5
+
+def wait_readable(sock, timeout):
+    """
+    Wait until a message can be received from a zmq socket.
+    zmq.Poller reports messages already queued on the socket. Otherwise
+    wait on the socket notification descriptor with select, which yields
+    to other greenlets when select is gevent patched and blocks only the
+    calling thread when it is not.
+    @param sock The zmq socket.
+    @param timeout Seconds to wait.
+    @retval True if a message is ready, False on timeout.
+    """
+    poller = zmq.Poller()
+    poller.register(sock, zmq.POLLIN)
+    fd = sock.getsockopt(zmq.FD)
+    deadline = time.time() + timeout
+    while True:
+        if poller.poll(0):
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        # The descriptor only signals that the socket state changed,
+        # loop to ask the poller again.
+        select.select([fd], [], [], remaining)
+
 class DriverClient(object):
     """
     Base class for driver clients, subclassed for specific messaging
@@ -132,22 +162,23 @@ class ZmqDriverClient(DriverClient):
                   driver_client.event_host_string)
 
             driver_client.stop_event_thread = False
-            #last_time = time.time()
             while not driver_client.stop_event_thread:
                 try:
-                    evt = sock.recv_pyobj(flags=zmq.NOBLOCK)
-                    log.debug('got event: %s' % str(evt))
-                    if driver_client.evt_callback:
-                        driver_client.evt_callback(evt)
-                except zmq.ZMQError:
-                    time.sleep(.5)
+                    if not wait_readable(sock, EVENT_WAIT_TIMEOUT):
+                        continue
+                    # Dispatch every event already queued before waiting again.
+                    while not driver_client.stop_event_thread:
+                        evt = sock.recv_pyobj(flags=zmq.NOBLOCK)
+                        log.debug('got event: %s' % str(evt))
+                        if driver_client.evt_callback:
+                            driver_client.evt_callback(evt)
+                except zmq.ZMQError, e:
+                    # No more queued events, anything else is retried later.
+                    if e.errno != zmq.EAGAIN:
+                        time.sleep(EVENT_WAIT_TIMEOUT)
                 except Exception, e:
                     log.error('Driver client error reading from zmq event socket: ' + str(e))
                     log.error('Driver client error type: ' + str(type(e)))                    
-                #cur_time = time.time()
-                #if cur_time - last_time > 5:
-                #    log.info('event thread listening')
-                #    last_time = cur_time
             sock.close()
             context.term()
             log.info('Client event socket closed.')
@@ -214,16 +245,20 @@ class ZmqDriverClient(DriverClient):
         start_reply = time.time()
         while True:
             try:
-                # Attempt reply recv. Retry if necessary.
+                # Wait for the reply until the driver timeout.
+                remaining = driver_timeout - (time.time() - start_reply)
+                if remaining <= 0 or not wait_readable(self.zmq_cmd_socket, remaining):
+                    raise InstDriverClientTimeoutError()
                 reply = self.zmq_cmd_socket.recv_pyobj(flags=zmq.NOBLOCK)
                 # Reply recieved, break and return.
                 break
-            except zmq.ZMQError:
-                # Socket not ready with the reply. Sleep and retry later.
-                time.sleep(.5)
-                delta = time.time() - start_reply
-                if delta >= driver_timeout:
-                    raise InstDriverClientTimeoutError()
+            except zmq.ZMQError, e:
+                # Socket reported ready but had no reply, wait again.
+                if e.errno != zmq.EAGAIN:
+                    time.sleep(.5)
+
+            except InstDriverClientTimeoutError:
+                raise
 
             except Exception,e:
                 log.error('Driver client error reading from zmq socket: ' + str(e))
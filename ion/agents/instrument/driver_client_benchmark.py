@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.instrument.driver_client_benchmark
+@file ion/agents/instrument/driver_client_benchmark.py
+@brief Command and event latency benchmark for ZmqDriverClient.
+
+Runs ZmqDriverClient against a local echo driver process, no driver egg
+or container is needed.
+
+    bin/python ion/agents/instrument/driver_client_benchmark.py --commands 200 --events 1000
+"""
+
+__license__ = 'Apache 2.0'
+
+import multiprocessing
+import time
+
+import numpy
+import zmq
+
+from ion.agents.instrument.driver_client import ZmqDriverClient
+
+
+def run_echo_driver(cmd_port, event_port):
+    """
+    Serve the driver process commands used by the benchmark until
+    stop_driver_process is received. process_echo replies with its data,
+    test_events publishes each event with its publish time.
+    """
+    context = zmq.Context()
+    cmd_sock = context.socket(zmq.REP)
+    cmd_sock.bind('tcp://127.0.0.1:%i' % cmd_port)
+    evt_sock = context.socket(zmq.PUB)
+    evt_sock.bind('tcp://127.0.0.1:%i' % event_port)
+    while True:
+        msg = cmd_sock.recv_pyobj()
+        cmd = msg['cmd']
+        if cmd == 'process_echo':
+            cmd_sock.send_pyobj(msg['kwargs'].get('data'))
+        elif cmd == 'test_events':
+            events = msg['kwargs'].get('events', [])
+            cmd_sock.send_pyobj(len(events))
+            for evt in events:
+                evt_sock.send_pyobj({'value': evt, 'time': time.time()})
+        elif cmd == 'stop_driver_process':
+            cmd_sock.send_pyobj('driver stopping')
+            break
+        else:
+            cmd_sock.send_pyobj(('BadRequest', 'Unknown command %s' % cmd, None))
+    cmd_sock.close()
+    evt_sock.close()
+    context.term()
+
+
+class DriverClientBenchmark(object):
+    """
+    Measures the command round trip and the event delivery latency of a
+    ZmqDriverClient talking to a local echo driver process.
+    """
+    def __init__(self, commands=100, events=100, cmd_port=5556, event_port=5557):
+        self.commands = commands
+        self.events = events
+        self.cmd_port = cmd_port
+        self.event_port = event_port
+        self.event_latencies = []
+
+    def evt_callback(self, evt):
+        self.event_latencies.append(time.time() - evt['time'])
+
+    def wait_subscribed(self, client, timeout=10):
+        """
+        PUB drops events until the SUB socket is connected, publish
+        until the first one arrives.
+        """
+        deadline = time.time() + timeout
+        while not self.event_latencies:
+            if time.time() > deadline:
+                raise RuntimeError('Driver client event socket not connected.')
+            client.cmd_dvr('test_events', events=['subscribe'])
+            time.sleep(.1)
+        del self.event_latencies[:]
+
+    def run(self):
+        driver = multiprocessing.Process(target=run_echo_driver, args=(self.cmd_port, self.event_port))
+        driver.start()
+        client = ZmqDriverClient('127.0.0.1', self.cmd_port, self.event_port)
+        client.start_messaging(self.evt_callback)
+        try:
+            self.wait_subscribed(client)
+
+            cmd_latencies = []
+            start = time.time()
+            for i in xrange(self.commands):
+                sent = time.time()
+                client.cmd_dvr('process_echo', data=i)
+                cmd_latencies.append(time.time() - sent)
+            cmd_elapsed = time.time() - start
+
+            start = time.time()
+            client.cmd_dvr('test_events', events=range(self.events))
+            deadline = start + 60
+            while len(self.event_latencies) < self.events and time.time() < deadline:
+                time.sleep(.01)
+            evt_elapsed = time.time() - start
+        finally:
+            client.done()
+            driver.join(10)
+
+        cmd_latencies = numpy.array(cmd_latencies) * 1000.
+        evt_latencies = numpy.array(self.event_latencies or [0.]) * 1000.
+        return {
+            'commands'          : self.commands,
+            'commands_per_s'    : self.commands / cmd_elapsed,
+            'cmd_latency_p50_ms': float(numpy.percentile(cmd_latencies, 50)),
+            'cmd_latency_p99_ms': float(numpy.percentile(cmd_latencies, 99)),
+            'events'            : len(self.event_latencies),
+            'events_per_s'      : len(self.event_latencies) / evt_elapsed,
+            'evt_latency_p50_ms': float(numpy.percentile(evt_latencies, 50)),
+            'evt_latency_p99_ms': float(numpy.percentile(evt_latencies, 99)),
+        }
+
+    @classmethod
+    def format_report(cls, report):
+        return '\n'.join([
+            '%(commands)s commands  %(commands_per_s).1f commands/s' % report,
+            '  command latency p50 %(cmd_latency_p50_ms).3fms  p99 %(cmd_latency_p99_ms).3fms' % report,
+            '%(events)s events  %(events_per_s).1f events/s' % report,
+            '  event latency p50 %(evt_latency_p50_ms).3fms  p99 %(evt_latency_p99_ms).3fms' % report])
+
+
+if __name__ == '__main__': # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description='ZmqDriverClient latency benchmark')
+    parser.add_argument('--commands', type=int, default=100, help='echo commands sent (default: 100)')
+    parser.add_argument('--events', type=int, default=100, help='events published (default: 100)')
+    parser.add_argument('--cmd-port', type=int, default=5556, help='echo driver command port (default: 5556)')
+    parser.add_argument('--event-port', type=int, default=5557, help='echo driver event port (default: 5557)')
+    opts = parser.parse_args()
+
+    benchmark = DriverClientBenchmark(commands=opts.commands, events=opts.events,
+                                      cmd_port=opts.cmd_port, event_port=opts.event_port)
+    print DriverClientBenchmark.format_report(benchmark.run())
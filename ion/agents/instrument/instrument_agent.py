@@ -1206,11 +1206,12 @@ class InstrumentAgent(ResourceAgent):
         try:
             stream_name = val['stream_name']
             values = val['values']
-            for v in values:
-                value = v['value']
-                value_id = v['value_id']
-                self._aam.process_alerts(stream_name=stream_name,
-                                         value=value, value_id=value_id)
+            with self._aam.alert_batch():
+                for v in values:
+                    value = v['value']
+                    value_id = v['value_id']
+                    self._aam.process_alerts(stream_name=stream_name,
+                                             value=value, value_id=value_id)
         except Exception as ex:
             log.error('Insturment agent %s could not process alerts for driver tomato %s',
                       self._proc_name, str(val))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.instrument.test.test_agent_stream_publisher
+@file ion/agents/instrument/test/test_agent_stream_publisher.py
+@brief Unit tests for the stream buffers of AgentStreamPublisher.
+"""
+
+__license__ = 'Apache 2.0'
+
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+from pyon.util.unit_test import PyonTestCase
+
+from ion.agents.agent_stream_publisher import AgentStreamPublisher
+
+
+@attr('UNIT', group='sa')
+class TestAgentStreamPublisher(PyonTestCase):
+
+    def setUp(self):
+        agent = Mock()
+        agent.CFG = {'stream_config': {'parsed': {'stream_definition_ref': 'sdef_id',
+                                                  'exchange_point': 'xp',
+                                                  'routing_key': 'rk',
+                                                  'stream_id': 'stream_id'}}}
+        agent.aparam_streams = {}
+        agent.aparam_pubrate = {}
+
+        for name in ('RecordDictionaryTool', 'StreamPublisher', 'populate_rdt'):
+            patcher = patch('ion.agents.agent_stream_publisher.%s' % name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.populate_rdt.side_effect = lambda rdt, vals: rdt
+
+        patcher = patch.object(AgentStreamPublisher, 'MAX_BUFFERED_SAMPLES', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.asp = AgentStreamPublisher(agent)
+        self.asp.reset_connection()
+        self.publisher = self.StreamPublisher.return_value
+
+    def _samples(self, n):
+        return [{'stream_name': 'parsed', 'values': [{'value_id': 'temp', 'value': i}]} for i in xrange(n)]
+
+    def test_publish_without_rate(self):
+        samples = self._samples(2)
+        self.asp.on_sample(samples[0])
+        self.asp.on_sample_mult(samples[1:])
+        self.assertEquals(self.publisher.publish.call_count, 2)
+        # The template is only loaded once.
+        self.assertEquals(self.RecordDictionaryTool.call_count, 1)
+        self.assertEquals(self.RecordDictionaryTool.return_value.empty_copy.call_count, 2)
+        self.assertEquals(self.asp.buffer_stats('parsed')['published'], 2)
+
+    def test_overflow(self):
+        # A rate loop is running, samples wait for it.
+        self.asp._stream_greenlets['parsed'] = Mock()
+        samples = self._samples(5)
+        self.asp.on_sample_mult(samples)
+        self.assertFalse(self.publisher.publish.called)
+        stats = self.asp.buffer_stats('parsed')
+        self.assertEquals((stats['waiting'], stats['dropped'], stats['overflows']), (3, 2, 1))
+
+        self.asp._publish_stream_buffer('parsed')
+        self.populate_rdt.assert_called_once_with(self.RecordDictionaryTool.return_value.empty_copy.return_value,
+                                                  samples[2:])
+        self.asp.on_sample_mult(self._samples(4))
+        stats = self.asp.buffer_stats()['parsed']
+        self.assertEquals((stats['buffered'], stats['published'], stats['dropped'], stats['overflows']),
+                          (9, 3, 3, 2))
+
+    def test_count_threshold(self):
+        self.asp._stream_greenlets['parsed'] = Mock()
+        with patch.object(AgentStreamPublisher, 'PUBLISH_COUNT', 2):
+            samples = self._samples(3)
+            self.asp.on_sample(samples[0])
+            self.assertFalse(self.publisher.publish.called)
+            self.asp.on_sample(samples[1])
+            self.assertEquals(self.publisher.publish.call_count, 1)
+            self.asp.on_sample(samples[2])
+            self.assertEquals(self.asp.buffer_stats('parsed')['waiting'], 1)
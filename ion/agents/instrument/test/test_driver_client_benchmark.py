@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.instrument.test.test_driver_client_benchmark
+@file ion/agents/instrument/test/test_driver_client_benchmark.py
+@brief Runs the driver client latency benchmark against the echo driver.
+"""
+
+__license__ = 'Apache 2.0'
+
+from nose.plugins.attrib import attr
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.public import log
+
+from ion.agents.instrument.driver_client_benchmark import DriverClientBenchmark
+
+
+@attr('UTIL', group='mi')
+class TestDriverClientBenchmark(PyonTestCase):
+
+    def test_benchmark(self):
+        benchmark = DriverClientBenchmark(commands=20, events=50, cmd_port=5656, event_port=5657)
+        report = benchmark.run()
+        log.info('\n%s', DriverClientBenchmark.format_report(report))
+
+        self.assertEquals(report['events'], 50)
+        # Replies and events are no longer picked up on a half second sleep.
+        self.assertTrue(report['cmd_latency_p50_ms'] < 250)
+        self.assertTrue(report['evt_latency_p50_ms'] < 250)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.instrument.test.test_populate_rdt
+@file ion/agents/instrument/test/test_populate_rdt.py
+@brief Unit tests for populating RDTs with particles.
+"""
+
+__license__ = 'Apache 2.0'
+
+import base64
+
+import numpy
+from nose.plugins.attrib import attr
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType, ArrayType, CategoryType
+
+from pyon.util.unit_test import PyonTestCase
+
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.agents.populate_rdt import populate_rdt
+from ion.agents.populate_rdt_benchmark import baseline_populate_rdt
+
+
+# Driver particles from ion/agents/instrument/test/test_particle_conversion.py
+SBE37_PARSED = [{u'quality_flag': u'ok',
+                 u'preferred_timestamp': u'port_timestamp',
+                 u'stream_name': u'parsed',
+                 u'port_timestamp': 3578927139.3578925,
+                 u'pkt_format_id': u'JSON_Data',
+                 u'pkt_version': 1,
+                 u'values': [{u'value_id': u'temp', u'value': 68.5895},
+                             {u'value_id': u'conductivity', u'value': 26.72304},
+                             {u'value_id': u'pressure', u'value': 733.303}],
+                 u'driver_timestamp': 3578927139.4226017}]
+
+SBE37_RAW = [{u'quality_flag': u'ok',
+              u'preferred_timestamp': u'port_timestamp',
+              u'stream_name': u'raw',
+              u'port_timestamp': 3578927113.3578925,
+              u'pkt_format_id': u'JSON_Data',
+              u'pkt_version': 1,
+              u'values': [{u'binary': True, u'value_id': u'raw', u'value': u'ZAA='},
+                          {u'value_id': u'length', u'value': 2},
+                          {u'value_id': u'type', u'value': 1},
+                          {u'value_id': u'checksum', u'value': None}],
+              u'driver_timestamp': 3578927113.75216}]
+
+def vel3d_particle(driver_timestamp, internal_timestamp, port_timestamp, fractional_second, mag_comp_y, pitch, roll):
+    return {"driver_timestamp": driver_timestamp,
+            "internal_timestamp": internal_timestamp,
+            "pkt_format_id": "JSON_Data",
+            "pkt_version": 1,
+            "port_timestamp": port_timestamp,
+            "preferred_timestamp": "port_timestamp",
+            "quality_flag": "ok",
+            "stream_name": "vel3d_b_sample",
+            "values": [
+                {"value": internal_timestamp, "value_id": "date_time_string"},
+                {"value": fractional_second, "value_id": "fractional_second"},
+                {"value": "8000", "value_id": "velocity_beam_a"},
+                {"value": "8000", "value_id": "velocity_beam_b"},
+                {"value": "8000", "value_id": "velocity_beam_c"},
+                {"value": "8000", "value_id": "velocity_beam_d"},
+                {"value": 999.0, "value_id": "turbulent_velocity_east"},
+                {"value": 999.0, "value_id": "turbulent_velocity_north"},
+                {"value": 999.0, "value_id": "turbulent_velocity_up"},
+                {"value": 2.16, "value_id": "temperature"},
+                {"value": 1.0, "value_id": "mag_comp_x"},
+                {"value": mag_comp_y, "value_id": "mag_comp_y"},
+                {"value": pitch, "value_id": "pitch"},
+                {"value": roll, "value_id": "roll"}]}
+
+VEL3D = [vel3d_particle(3579022766.361967, 3579047922.0, 3579022762.357902, 5, -0.0, -7.9, -78.2),
+         vel3d_particle(3579022768.101987, 3579047923.0, 3579022764.357902, 6, -0.01, -8.0, -78.0)]
+
+
+class FakeRDT(dict):
+    temporal_parameter = 'time'
+    fields = ('time', 'temp', 'raw', 'quality_flag')
+
+    def __contains__(self, key):
+        return key in self.fields
+
+
+@attr('UNIT', group='sa')
+class TestPopulateRDT(PyonTestCase):
+
+    def build_pdict(self, quantities, arrays):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=numpy.float64)), is_temporal=True)
+        for name in quantities:
+            pdict.add_context(ParameterContext(name, param_type=QuantityType(value_encoding=numpy.float64), fill_value=-9999.))
+        for name in arrays:
+            pdict.add_context(ParameterContext(name, param_type=ArrayType()))
+        pdict.add_context(ParameterContext('preferred_timestamp', param_type=CategoryType(categories={0:'port_timestamp', 1:'driver_timestamp', 2:'internal_timestamp', 3:'time', -99:'empty'}), fill_value=-99))
+        return pdict
+
+    def assertPopulatedAlike(self, pdict, particles):
+        expected = baseline_populate_rdt(RecordDictionaryTool(param_dictionary=pdict), particles)
+        actual = populate_rdt(RecordDictionaryTool(param_dictionary=pdict), particles)
+        self.assertEquals(sorted(actual.fields), sorted(expected.fields))
+        for field in expected.fields:
+            if expected[field] is None:
+                self.assertIsNone(actual[field], field)
+            else:
+                numpy.testing.assert_array_equal(actual[field], expected[field], field)
+
+    def test_fixture_particles(self):
+        ctd = self.build_pdict(['port_timestamp', 'driver_timestamp', 'temp', 'conductivity', 'pressure', 'length', 'type', 'checksum'],
+                               ['quality_flag', 'raw'])
+        self.assertPopulatedAlike(ctd, SBE37_PARSED)
+        self.assertPopulatedAlike(ctd, SBE37_RAW)
+        # Parsed and raw particles together leave every field but time sparse.
+        self.assertPopulatedAlike(ctd, SBE37_PARSED + SBE37_RAW + SBE37_PARSED)
+
+        vel3d = self.build_pdict(['port_timestamp', 'internal_timestamp', 'driver_timestamp', 'date_time_string', 'fractional_second',
+                                  'turbulent_velocity_east', 'turbulent_velocity_north', 'turbulent_velocity_up',
+                                  'temperature', 'mag_comp_x', 'mag_comp_y', 'pitch', 'roll'],
+                                 ['quality_flag', 'velocity_beam_a', 'velocity_beam_b', 'velocity_beam_c', 'velocity_beam_d'])
+        self.assertPopulatedAlike(vel3d, VEL3D)
+        self.assertPopulatedAlike(vel3d, VEL3D[:1])
+        self.assertPopulatedAlike(vel3d, [])
+
+    def test_columns(self):
+        particles = [
+            {'driver_timestamp': 10.0, 'quality_flag': 'ok', 'stream_name': 'parsed',
+             'values': [{'value_id': 'temp', 'value': 1.5}, {'value_id': 'conductivity', 'value': 3.0}]},
+            {'driver_timestamp': 11.0, 'stream_name': 'raw',
+             'values': [{'value_id': 'raw', 'value': base64.b64encode('abc'), 'binary': True}]},
+            {'driver_timestamp': 12.0, 'quality_flag': 'ok',
+             'values': [{'value_id': 'raw', 'value': base64.b64encode('xyz'), 'binary': True},
+                        {'value_id': 'raw', 'value': 'plain'},
+                        {'value_id': 'temp', 'value': 2.5}]},
+        ]
+        rdt = populate_rdt(FakeRDT(), particles)
+
+        self.assertEquals(sorted(rdt.keys()), ['quality_flag', 'raw', 'temp', 'time'])
+        self.assertEquals(rdt['time'].tolist(), [10.0, 11.0, 12.0])
+        self.assertEquals(rdt['temp'].tolist(), [1.5, None, 2.5])
+        # The last value of a field in a particle is kept, binary values are decoded.
+        self.assertEquals(rdt['raw'].tolist(), [None, 'abc', 'plain'])
+        self.assertEquals(rdt['quality_flag'].tolist(), ['ok', None, 'ok'])
+
+    def test_empty(self):
+        rdt = populate_rdt(FakeRDT(), [])
+        self.assertEquals(rdt.keys(), ['time'])
+        self.assertEquals(len(rdt['time']), 0)
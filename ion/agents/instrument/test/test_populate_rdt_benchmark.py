@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+'''
+@file ion/agents/instrument/test/test_populate_rdt_benchmark.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from nose.plugins.attrib import attr
+
+from ion.agents.populate_rdt_benchmark import PopulateRDTBenchmark
+
+
+@attr('UTIL',group='sa')
+class PopulateRDTBenchmarkTest(PyonTestCase):
+    def test_benchmark(self):
+        report = PopulateRDTBenchmark(particles=1000, repeat=20).run()
+        log.info('\n%s', PopulateRDTBenchmark.format_report(report))
+
+        self.assertTrue(report['matches'])
+        for stream in PopulateRDTBenchmark.STREAMS:
+            self.assertLess(report['streams'][stream]['columns_s'], report['streams'][stream]['baseline_s'], stream)
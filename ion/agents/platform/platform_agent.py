@@ -959,13 +959,14 @@ class PlatformAgent(ResourceAgent):
         call is done for each value in the vals list. A future version may include
         a more elaborated algorithm to analyze the sequence for alert purposes.
         """
-        for value in vals:
-            if value is not None:
-                log.trace('%r: to call process_alerts: stream_name=%r '
-                          'value_id=%r value=%s',
-                          self._platform_id, stream_name, param_name, value)
-                self._aam.process_alerts(stream_name=stream_name,
-                                         value=value, value_id=param_name)
+        with self._aam.alert_batch():
+            for value in vals:
+                if value is not None:
+                    log.trace('%r: to call process_alerts: stream_name=%r '
+                              'value_id=%r value=%s',
+                              self._platform_id, stream_name, param_name, value)
+                    self._aam.process_alerts(stream_name=stream_name,
+                                             value=value, value_id=param_name)
 
     def _async_driver_event_agent_event(self, event):
         """
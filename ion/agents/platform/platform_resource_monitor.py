@@ -16,12 +16,20 @@ import logging
 
 from ion.agents.platform.resource_monitor import ResourceMonitor
 from ion.agents.platform.resource_monitor import _STREAM_NAME
+from ion.agents.platform.resource_monitor import next_deadline
 from ion.agents.platform.platform_driver_event import AttributeValueDriverEvent
 
-from gevent import Greenlet, sleep
+from gevent import Greenlet
 from gevent.coros import RLock
+from gevent.event import Event
 
 import pprint
+import time
+
+
+# Monitors whose deadlines are within this many seconds of each other are
+# polled together in a single request.
+_DEADLINE_SLACK = 0.05
 
 
 class PlatformResourceMonitor(object):
@@ -35,8 +43,9 @@ class PlatformResourceMonitor(object):
         @param attr_info Attribute information
         @param get_attribute_values Function to retrieve attribute
                  values for the specific platform, called like this:
-                 get_attribute_values([attr_id], from_time)
-                 for each attr_id in the platform.
+                 get_attribute_values([(attr_id, from_time), ...])
+                 with the attributes of all the monitors due at the
+                 same time.
         @param notify_driver_event Callback to notify whenever a value is
                 retrieved.
         """
@@ -64,6 +73,14 @@ class PlatformResourceMonitor(object):
         self._pub_rate = None
         self._publisher_active = False
 
+        # a single scheduler greenlet polls the monitors and dispatches the
+        # publication at their deadlines:
+        self._scheduler_active = False
+        self._stop_event = Event()
+
+        # number of get_attribute_values calls made by the scheduler
+        self.request_count = 0
+
         # for debugging purposes
         self._pp = pprint.PrettyPrinter()
 
@@ -137,9 +154,9 @@ class PlatformResourceMonitor(object):
 
     def start_resource_monitoring(self):
         """
-        Starts greenlets to periodically retrieve values of the attributes
-        associated with my platform, and to generate aggregated events that
-        will be used by the platform agent to create and publish
+        Starts the greenlet that periodically retrieves values of the
+        attributes associated with my platform, and generates aggregated
+        events that will be used by the platform agent to create and publish
         corresponding granules.
         """
 
@@ -149,19 +166,20 @@ class PlatformResourceMonitor(object):
         self._init_buffers()
 
         # attributes are grouped by similar monitoring rate so a single
-        # greenlet is used for each group:
+        # request is made for each group, or for all the groups due at
+        # the same time:
         groups = self._group_by_monitoring_rate()
         for rate_secs, attr_defns in groups.iteritems():
-            self._start_monitor_greenlet(rate_secs, attr_defns)
+            self._create_monitor(rate_secs, attr_defns)
 
         if self._monitors:
-            self._start_publisher_greenlet()
+            self._start_scheduler_greenlet()
 
-    def _start_monitor_greenlet(self, rate_secs, attr_defns):
+    def _create_monitor(self, rate_secs, attr_defns):
         """
-        Creates and starts a ResourceMonitor
+        Creates a ResourceMonitor, to be polled by the scheduler greenlet.
         """
-        log.debug("%r: _start_monitor_greenlet rate_secs=%s attr_defns=%s",
+        log.debug("%r: _create_monitor rate_secs=%s attr_defns=%s",
                   self._platform_id, rate_secs, attr_defns)
 
         resmon = ResourceMonitor(self._platform_id,
@@ -169,15 +187,14 @@ class PlatformResourceMonitor(object):
                                  self._get_attribute_values,
                                  self._receive_from_monitor)
         self._monitors[rate_secs] = resmon
-        resmon.start()
 
     def stop_resource_monitoring(self):
         """
-        Stops the publisher greenlet and all the monitoring greenlets.
+        Stops the scheduler greenlet.
         """
         log.debug("%r: stopping resource monitoring", self._platform_id)
 
-        self._stop_publisher_greenlet()
+        self._stop_scheduler_greenlet()
 
         for resmon in self._monitors.itervalues():
             resmon.stop()
@@ -247,38 +264,84 @@ class PlatformResourceMonitor(object):
         min_monitoring_rate_secs = min(self._monitors.keys())
         self._pub_rate = min_monitoring_rate_secs
 
-    def _start_publisher_greenlet(self):
-        assert self._publisher_active is False
+    def _start_scheduler_greenlet(self):
+        assert self._scheduler_active is False
         self._set_publisher_rate()
 
+        self._scheduler_active = True
         self._publisher_active = True
-        runnable = Greenlet(self._run_publisher)
+        self._stop_event.clear()
+        runnable = Greenlet(self._run_scheduler)
         runnable.start()
-        log.debug("%r: publisher greenlet started, dispatch rate=%s",
+        log.debug("%r: scheduler greenlet started, monitoring rates=%s, "
+                  "dispatch rate=%s",
+                  self._platform_id, sorted(self._monitors.keys()), self._pub_rate)
+
+    def _run_scheduler(self):
+        """
+        The target run function for the scheduler greenlet.
+
+        Deadlines are aligned to the start time. At each wakeup the monitors
+        that are due are polled with a single get_attribute_values call and
+        then the publication is dispatched if it is due.
+        """
+        start = time.time()
+        deadlines = dict((rate_secs, start + rate_secs) for rate_secs in self._monitors)
+        pub_deadline = start + self._pub_rate
+
+        while self._scheduler_active:
+            next_wakeup = min(min(deadlines.itervalues()), pub_deadline)
+
+            # wait until the next deadline while promptly reacting to
+            # request for termination:
+            self._stop_event.wait(max(0, next_wakeup - time.time()))
+            if not self._scheduler_active:
+                break
+
+            due_time = time.time() + _DEADLINE_SLACK
+            due = [rate_secs for rate_secs, deadline in deadlines.iteritems()
+                   if deadline <= due_time]
+            if due:
+                try:
+                    self._poll_monitors([self._monitors[rate_secs] for rate_secs in due])
+                except:
+                    log.exception("%r: exception in _poll_monitors", self._platform_id)
+                for rate_secs in due:
+                    deadlines[rate_secs] = next_deadline(deadlines[rate_secs], rate_secs)
+
+            if pub_deadline <= due_time:
+                # dispatch publication (if still active):
+                with self._lock:
+                    if self._publisher_active:
+                        self._dispatch_publication()
+                pub_deadline = next_deadline(pub_deadline, self._pub_rate)
+
+        log.debug("%r: scheduler greenlet stopped. _pub_rate=%s",
                   self._platform_id, self._pub_rate)
 
-    def _run_publisher(self):
+    def _poll_monitors(self, monitors):
         """
-        The target run function for the publisher greenlet.
+        Retrieves the values of the attributes of all the given monitors
+        with a single get_attribute_values call, and hands each monitor
+        the values of its own attributes.
         """
-        while self._publisher_active:
-
-            # loop to incrementally sleep up to self._pub_rate while promptly
-            # reacting to request for termination
-            slept = 0
-            while self._publisher_active and slept < self._pub_rate:
-                # sleep in increments of 0.5 secs
-                incr = min(0.5, self._pub_rate - slept)
-                sleep(incr)
-                slept += incr
-
-            # dispatch publication (if still active):
-            with self._lock:
-                if self._publisher_active:
-                    self._dispatch_publication()
+        requests = [(resmon, resmon.get_attrs_to_request()) for resmon in monitors]
+        attrs = [attr for _, resmon_attrs in requests for attr in resmon_attrs]
 
-        log.debug("%r: publisher greenlet stopped. _pub_rate=%s",
-                  self._platform_id, self._pub_rate)
+        log.debug("%r: _poll_monitors: rates=%s attrs=%s",
+                  self._platform_id, [resmon.rate_secs for resmon in monitors], attrs)
+
+        self.request_count += 1
+        retrieved_vals = self._get_attribute_values(attrs)
+
+        for resmon, resmon_attrs in requests:
+            if retrieved_vals is None:
+                resmon_vals = None
+            else:
+                resmon_vals = dict((attr_id, retrieved_vals[attr_id])
+                                   for attr_id, _ in resmon_attrs
+                                   if attr_id in retrieved_vals)
+            resmon.process_retrieved_values(resmon_attrs, resmon_vals)
 
     def _dispatch_publication(self):
         """
@@ -375,7 +438,10 @@ class PlatformResourceMonitor(object):
 
         self._notify_driver_event(driver_event)
 
-    def _stop_publisher_greenlet(self):
-        if self._publisher_active:
-            log.debug("%r: stopping publisher greenlet", self._platform_id)
-            self._publisher_active = False
+    def _stop_scheduler_greenlet(self):
+        if self._scheduler_active:
+            log.debug("%r: stopping scheduler greenlet", self._platform_id)
+            with self._lock:
+                self._publisher_active = False
+            self._scheduler_active = False
+            self._stop_event.set()
@@ -19,7 +19,9 @@ from ion.agents.platform.platform_driver_event import AttributeValueDriverEvent
 from ion.agents.platform.util import ntp_2_ion_ts
 
 import logging
-from gevent import Greenlet, sleep
+import time
+from gevent import Greenlet
+from gevent.event import Event
 
 import pprint
 
@@ -80,6 +82,7 @@ class ResourceMonitor(object):
                          self._platform_id, attr_defn)
 
         self._active = False
+        self._stop_event = Event()
 
         # for debugging purposes
         self._pp = pprint.PrettyPrinter()
@@ -92,12 +95,22 @@ class ResourceMonitor(object):
             self.__class__.__name__,
             self._platform_id, self._rate_secs, str(self._attr_ids))
 
+    @property
+    def rate_secs(self):
+        return self._rate_secs
+
+    @property
+    def attr_ids(self):
+        return self._attr_ids
+
     def start(self):
         """
         Starts greenlet for resource monitoring.
+        Not needed when the monitor is polled by PlatformResourceMonitor.
         """
         log.debug("%r: starting resource monitoring %s", self._platform_id, self)
         self._active = True
+        self._stop_event.clear()
         runnable = Greenlet(self._run)
         runnable.start()
 
@@ -105,15 +118,13 @@ class ResourceMonitor(object):
         """
         The target function for the greenlet.
         """
+        # deadlines are aligned to the start time so the retrieval time does
+        # not accumulate into the monitoring rate:
+        deadline = time.time() + self._rate_secs
         while self._active:
-            slept = 0
-            # loop to incrementally sleep up to rate_secs while promptly
-            # reacting to request for termination
-            while self._active and slept < self._rate_secs:
-                # sleep in increments of 0.5 secs
-                incr = min(0.5, self._rate_secs - slept)
-                sleep(incr)
-                slept += incr
+            # wait until the deadline while promptly reacting to request
+            # for termination:
+            self._stop_event.wait(max(0, deadline - time.time()))
 
             if self._active:
                 try:
@@ -121,6 +132,8 @@ class ResourceMonitor(object):
                 except:
                     log.exception("exception in _retrieve_attribute_values")
 
+            deadline = next_deadline(deadline, self._rate_secs)
+
         log.debug("%r: monitoring greenlet stopped. rate_secs=%s; attr_ids=%s",
                   self._platform_id, self._rate_secs, self._attr_ids)
 
@@ -129,6 +142,21 @@ class ResourceMonitor(object):
         Retrieves the attribute values using the given function and calls
         _values_retrieved.
         """
+        attrs = self.get_attrs_to_request()
+
+        log.debug("%r: _retrieve_attribute_values: attrs=%s",
+                  self._platform_id, attrs)
+
+        retrieved_vals = self._get_attribute_values(attrs)
+
+        self.process_retrieved_values(attrs, retrieved_vals)
+
+    def get_attrs_to_request(self):
+        """
+        Determines the from_time for each of my attributes.
+
+        @return [(attr_id, from_time), ...]
+        """
 
         # TODO: note that the "from_time" parameters for the request below
         # as well as the expected response are influenced by the RSN case
@@ -153,11 +181,17 @@ class ResourceMonitor(object):
 
             attrs.append((attr_id, from_time))
 
-        log.debug("%r: _retrieve_attribute_values: attrs=%s",
-                  self._platform_id, attrs)
+        return attrs
 
-        retrieved_vals = self._get_attribute_values(attrs)
+    def process_retrieved_values(self, attrs, retrieved_vals):
+        """
+        Validates the values retrieved for the given request and calls
+        _values_retrieved with the attributes having reported values.
 
+        @param attrs          [(attr_id, from_time), ...] as requested
+        @param retrieved_vals { attr_id: [(val, ts), ...], ... }, or None
+                              in case of lost connection.
+        """
         if retrieved_vals is None:
             # lost connection; nothing else to do here:
             return
@@ -264,3 +298,16 @@ class ResourceMonitor(object):
     def stop(self):
         log.debug("%r: stopping resource monitoring %s", self._platform_id, self)
         self._active = False
+        self._stop_event.set()
+
+
+def next_deadline(deadline, rate_secs):
+    """
+    Returns the first deadline after the current time in the sequence
+    deadline + k * rate_secs, skipping any cycle that was missed.
+    """
+    deadline += rate_secs
+    now = time.time()
+    if deadline <= now:
+        deadline += ((now - deadline) // rate_secs + 1) * rate_secs
+    return deadline
@@ -13,6 +13,7 @@ __license__ = 'Apache 2.0'
 #
 # bin/nosetests -v ion/agents/platform/test/test_platform_resource_monitor.py:Test.test_attr_grouping_by_similar_rate
 # bin/nosetests -v ion/agents/platform/test/test_platform_resource_monitor.py:Test.test_aggregation_for_granule
+# bin/nosetests -v ion/agents/platform/test/test_platform_resource_monitor.py:Test.test_scheduler_with_simulator
 
 
 from pyon.public import log
@@ -21,8 +22,12 @@ from pyon.util.unit_test import IonUnitTestCase
 
 from ion.agents.platform.platform_resource_monitor import PlatformResourceMonitor
 from ion.agents.platform.util.network_util import NetworkUtil
+from ion.agents.platform.util import ion_ts_2_ntp
+from ion.agents.platform.rsn.simulator.oms_simulator import CIOMSSimulator
 
+import copy
 import pprint
+import gevent
 
 
 @attr('UNIT', group='sa')
@@ -168,3 +173,47 @@ class Test(IonUnitTestCase):
             [(None, 9000),  (3000, 9001), (None, 9002)],
             MVPC_temperature
         )
+
+    def test_scheduler_with_simulator(self):
+        platform_id = "Node1D"
+        # same attributes with rates scaled down to keep the test short:
+        # input_voltage and input_bus_current every 1 sec, MVPC_pressure_1
+        # and MVPC_temperature every 2 secs.
+        attrs = copy.deepcopy(self._get_attrs(platform_id))
+        for attr_defn in attrs.itervalues():
+            attr_defn['monitor_cycle_seconds'] = float(attr_defn['monitor_cycle_seconds']) / 5
+
+        oms = CIOMSSimulator()
+        requests = []
+
+        def get_attribute_values(attrs):
+            # as done by RSNPlatformDriver.get_attribute_values
+            requests.append([attr_id for attr_id, _ in attrs])
+            attrs_ntp = [(attr_id, ion_ts_2_ntp(from_time)) for attr_id, from_time in attrs]
+            return oms.get_platform_attribute_values(platform_id, attrs_ntp)[platform_id]
+
+        events = []
+        prm = PlatformResourceMonitor(platform_id, attrs, get_attribute_values, events.append)
+        prm.start_resource_monitoring()
+        try:
+            gevent.sleep(2.5)
+        finally:
+            prm.stop_resource_monitoring()
+
+        log.debug("requests=\n%s", self._pp.pformat(requests))
+
+        # at 1 sec only the 1 sec group is due, at 2 secs both groups are
+        # requested in a single call:
+        self.assertEquals(prm.request_count, 2)
+        self.assertEquals(len(requests), 2)
+        self.assertEquals(set(requests[0]), set(["input_voltage", "input_bus_current"]))
+        self.assertEquals(set(requests[1]), set(attrs.keys()))
+
+        # one publication per second with the values of all attributes:
+        self.assertEquals(len(events), 2)
+        for driver_event in events:
+            self.assertEquals(set(driver_event.vals_dict.keys()), set(attrs.keys()))
+
+        # no more requests once stopped:
+        gevent.sleep(1.2)
+        self.assertEquals(prm.request_count, 2)
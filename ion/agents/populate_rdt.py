@@ -14,38 +14,59 @@ import numpy
 import base64
 
 def populate_rdt(rdt, vals):
-    
-    
+    """
+    Sets each RDT field once from a list of particles.
+
+    The particles are transposed into a column (a list with one slot per
+    particle) for each field of the RDT, whether a field is in the RDT is
+    only asked the first time it is seen. Binary values are base64 decoded
+    a column at a time once the particles are transposed.
+    """
     array_size = len(vals)
-    data_arrays = {}    
-        
+    temporal_parameter = rdt.temporal_parameter
+
     # Populate the temporal parameter.
-    data_arrays[rdt.temporal_parameter] = [None] * array_size
-        
-    
+    columns = {temporal_parameter: [None] * array_size}   # field -> column
+    binary = {}                                            # field -> indexes of binary values
+    skipped = set()                                        # fields not in the rdt
+
     for i, particle in enumerate(vals):
         for k,v in particle.iteritems():
             if k == 'values':
                 for value_dict in v:
                     value_id = value_dict['value_id']
-                    value = value_dict['value']
-                    if value_id in rdt:
-                        if value_id not in data_arrays:
-                            data_arrays[value_id] = [None] * array_size
-                        if 'binary' in value_dict:
-                            value = base64.b64decode(value)
-                        data_arrays[value_id][i] = value
-            
+                    column = columns.get(value_id)
+                    if column is None:
+                        if value_id in skipped or value_id not in rdt:
+                            skipped.add(value_id)
+                            continue
+                        column = columns[value_id] = [None] * array_size
+                    # The last value of a field in a particle is kept.
+                    column[i] = value_dict['value']
+                    if 'binary' in value_dict:
+                        binary.setdefault(value_id, set()).add(i)
+                    elif binary and value_id in binary:
+                        binary[value_id].discard(i)
+
             elif k == 'driver_timestamp':
-                data_arrays[rdt.temporal_parameter][i] = v
-            
-            elif k in rdt:
-                if k not in data_arrays:
-                    data_arrays[k] = [None] * array_size
-                data_arrays[k][i] = v
-                
-    for k,v in data_arrays.iteritems():
-        rdt[k] = numpy.array(v)
+                columns[temporal_parameter][i] = v
+
+            else:
+                column = columns.get(k)
+                if column is None:
+                    if k in skipped or k not in rdt:
+                        skipped.add(k)
+                        continue
+                    column = columns[k] = [None] * array_size
+                column[i] = v
+
+    for k, indexes in binary.iteritems():
+        column = columns[k]
+        for i in indexes:
+            column[i] = base64.b64decode(column[i])
+
+    for k, column in columns.iteritems():
+        rdt[k] = numpy.array(column)
     
     return rdt
                 
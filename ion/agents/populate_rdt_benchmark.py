@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+'''
+@file ion/agents/populate_rdt_benchmark.py
+@description populate_rdt throughput benchmark
+
+Populates an in memory stand-in for a RecordDictionaryTool from batches of
+parsed (VEL3D) and raw (SBE37, base64 encoded) driver particles with the
+loop populate_rdt used before the particles were transposed into columns
+and with populate_rdt, no container is needed.
+
+    bin/python ion/agents/populate_rdt_benchmark.py --particles 1000 --repeat 20
+'''
+
+from ion.agents.populate_rdt import populate_rdt
+
+import base64
+import numpy
+import time
+
+
+def baseline_populate_rdt(rdt, vals):
+    '''
+    populate_rdt before the particles were transposed into columns, kept as
+    the reference output and timing.
+    '''
+    array_size = len(vals)
+    data_arrays = {}
+    data_arrays[rdt.temporal_parameter] = [None] * array_size
+    for i, particle in enumerate(vals):
+        for k,v in particle.iteritems():
+            if k == 'values':
+                for value_dict in v:
+                    value_id = value_dict['value_id']
+                    value = value_dict['value']
+                    if value_id in rdt:
+                        if value_id not in data_arrays:
+                            data_arrays[value_id] = [None] * array_size
+                        if 'binary' in value_dict:
+                            value = base64.b64decode(value)
+                        data_arrays[value_id][i] = value
+            elif k == 'driver_timestamp':
+                data_arrays[rdt.temporal_parameter][i] = v
+            elif k in rdt:
+                if k not in data_arrays:
+                    data_arrays[k] = [None] * array_size
+                data_arrays[k][i] = v
+    for k,v in data_arrays.iteritems():
+        rdt[k] = numpy.array(v)
+    return rdt
+
+
+class ParticleRDT(dict):
+    '''
+    In memory stand-in for a RecordDictionaryTool, membership is checked the
+    way RecordDictionaryTool.__contains__ does
+    '''
+    temporal_parameter = 'time'
+
+    def __init__(self, fields):
+        dict.__init__(self)
+        self._rd = dict.fromkeys(fields)
+        self._available_fields = None
+
+    def __contains__(self, key):
+        if self._available_fields:
+            return key in self._rd and key in self._available_fields
+        return key in self._rd
+
+
+VEL3D_VALUES = ['date_time_string', 'fractional_second', 'velocity_beam_a', 'velocity_beam_b', 'velocity_beam_c', 'velocity_beam_d',
+                'turbulent_velocity_east', 'turbulent_velocity_north', 'turbulent_velocity_up',
+                'temperature', 'mag_comp_x', 'mag_comp_y', 'pitch', 'roll']
+VEL3D_FIELDS = ['time', 'port_timestamp', 'internal_timestamp', 'driver_timestamp', 'quality_flag', 'preferred_timestamp'] + VEL3D_VALUES
+RAW_FIELDS = ['time', 'port_timestamp', 'driver_timestamp', 'quality_flag', 'preferred_timestamp', 'raw', 'length', 'type', 'checksum']
+
+
+def vel3d_particles(count):
+    particles = []
+    for i in xrange(count):
+        particle = {'driver_timestamp'    : 3579022766. + i,
+                    'internal_timestamp'  : 3579047922. + i,
+                    'port_timestamp'      : 3579022762. + i,
+                    'pkt_format_id'       : 'JSON_Data',
+                    'pkt_version'         : 1,
+                    'preferred_timestamp' : 'port_timestamp',
+                    'quality_flag'        : 'ok',
+                    'stream_name'         : 'vel3d_b_sample'}
+        particle['values'] = [{'value_id': value_id, 'value': float(i + j)} for j, value_id in enumerate(VEL3D_VALUES)]
+        particles.append(particle)
+    return particles
+
+
+def raw_particles(count, size=64):
+    particles = []
+    for i in xrange(count):
+        data = ''.join(chr((i + j) % 256) for j in xrange(size))
+        particles.append({'driver_timestamp'    : 3578927113. + i,
+                          'port_timestamp'      : 3578927113. + i,
+                          'pkt_format_id'       : 'JSON_Data',
+                          'pkt_version'         : 1,
+                          'preferred_timestamp' : 'port_timestamp',
+                          'quality_flag'        : 'ok',
+                          'stream_name'         : 'raw',
+                          'values'              : [{'value_id': 'raw', 'value': base64.b64encode(data), 'binary': True},
+                                                   {'value_id': 'length', 'value': size},
+                                                   {'value_id': 'type', 'value': 1},
+                                                   {'value_id': 'checksum', 'value': None}]})
+    return particles
+
+
+class PopulateRDTBenchmark(object):
+    '''
+    Runs a single benchmark configuration:
+      particles - Particles of each stream per batch
+      repeat    - Batches populated with each implementation
+    '''
+    STREAMS = ('parsed', 'raw')
+
+    def __init__(self, particles=1000, repeat=20):
+        self.particles = particles
+        self.repeat    = repeat
+
+    def populate(self, function, fields, particles):
+        '''
+        Returns the last populated rdt and the time it took
+        '''
+        start = time.time()
+        for i in xrange(self.repeat):
+            rdt = function(ParticleRDT(fields), particles)
+        return rdt, time.time() - start
+
+    @classmethod
+    def same(cls, rdt, other):
+        if sorted(rdt) != sorted(other):
+            return False
+        return all(rdt[k].dtype == other[k].dtype and rdt[k].tolist() == other[k].tolist() for k in rdt)
+
+    def run(self):
+        report = {'particles': self.particles, 'repeat': self.repeat, 'matches': True, 'streams': {}}
+        for stream, fields, particles in [('parsed', VEL3D_FIELDS, vel3d_particles(self.particles)),
+                                          ('raw', RAW_FIELDS, raw_particles(self.particles))]:
+            baseline, baseline_elapsed = self.populate(baseline_populate_rdt, fields, particles)
+            columns, columns_elapsed = self.populate(populate_rdt, fields, particles)
+            report['matches'] = report['matches'] and self.same(baseline, columns)
+            report['streams'][stream] = {'baseline_s' : baseline_elapsed,
+                                         'columns_s'  : columns_elapsed,
+                                         'speedup'    : baseline_elapsed / max(columns_elapsed, 1e-9)}
+        return report
+
+    @classmethod
+    def format_report(cls, report):
+        lines = ['%(repeat)s batches of %(particles)s particles, fields match: %(matches)s' % report]
+        for stream in cls.STREAMS:
+            lines.append('  %-6s baseline %.4fs  columns %.4fs  speedup %.2fx' % ((stream,) + tuple(report['streams'][stream][k] for k in ('baseline_s', 'columns_s', 'speedup'))))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__': # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description='populate_rdt throughput benchmark')
+    parser.add_argument('--particles', type=int, default=1000, help='particles of each stream per batch (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=20, help='batches populated with each implementation (default: 20)')
+    opts = parser.parse_args()
+
+    print PopulateRDTBenchmark.format_report(PopulateRDTBenchmark(particles=opts.particles, repeat=opts.repeat).run())
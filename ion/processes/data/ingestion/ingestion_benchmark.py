@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/ingestion/ingestion_benchmark.py
+@description Ingestion throughput benchmark with synthetic granules
+
+Drives ScienceGranuleIngestionWorker.recv_packet with synthetic granules
+persisted to local file-backed coverages, no broker or container is needed.
+
+    bin/python ion/processes/data/ingestion/ingestion_benchmark.py --granules 500 --records 10 --parameters 20
+
+The granules are built from a synthetic parameter dictionary or from a
+parameter dictionary dump (--pdict) exported from a preloaded system with
+IngestionBenchmark.export_pdict. They carry the parameter dictionary instead
+of a stream definition as there's no pubsub to read stream definitions from.
+Batches are only flushed on size (and at the end of the run), the worker's
+flush loop isn't running.
+'''
+
+from pyon.core.exception import NotFound
+from pyon.core.interceptor.encode import encode_ion, decode_ion
+from pyon.util.log import log
+
+from ion.processes.data.ingestion.science_granule_ingestion_worker import ScienceGranuleIngestionWorker
+from ion.services.dm.utility.coverage_pool import CoveragePool
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.services.dm.utility.granule_utils import time_series_domain
+from ion.util.stored_values import CachedStoredValueManager, StoredValueCache
+
+from coverage_model import SimplexCoverage, ParameterDictionary, ParameterContext
+from coverage_model import QuantityType, ArrayType, CategoryType, ConstantType, SparseConstantType, BooleanType
+from coverage_model.parameter_types import ParameterFunctionType
+
+from gevent.queue import Queue
+from uuid import uuid4
+
+import gevent
+import msgpack
+import numpy as np
+import shutil
+import tempfile
+import time
+
+
+class LocalObjectStore(object):
+    '''
+    In memory stand-in for the container's object store holding the lookup documents
+    '''
+    def __init__(self, docs=None):
+        self.docs = docs or {}
+
+    def read_doc(self, doc_key):
+        try:
+            return self.docs[doc_key]
+        except KeyError:
+            raise NotFound('No document %s' % doc_key)
+
+
+class LocalContainer(object):
+    def __init__(self, docs=None):
+        self.object_store = LocalObjectStore(docs)
+
+
+class NullPublisher(object):
+    ''' Counts the events the worker would publish '''
+    def __init__(self):
+        self.published = 0
+
+    def publish_event(self, *args, **kwargs):
+        self.published += 1
+
+    def close(self):
+        pass
+
+
+class BenchmarkIngestionWorker(ScienceGranuleIngestionWorker):
+    '''
+    Ingestion worker writing to coverages registered with the benchmark
+    instead of the datasets found in the resource registry.
+    '''
+    def __init__(self, *args, **kwargs):
+        ScienceGranuleIngestionWorker.__init__(self, *args, **kwargs)
+        self.stream_datasets = {}
+        self.qc_alerts = 0
+
+    def _new_dataset(self, stream_id):
+        return self.stream_datasets.get(stream_id)
+
+    def flag_qc_parameter(self, dataset_id, parameter, temporal_values, configuration):
+        self.qc_alerts += 1
+
+
+class IngestionBenchmark(object):
+    '''
+    Runs a single benchmark configuration:
+      streams        - Number of streams (and datasets) ingested
+      granules       - Granules published per stream
+      records        - Records per granule
+      parameters     - Quantity parameters of the synthetic parameter dictionary
+      rate           - Granules per second over all the streams, None publishes as fast as possible
+      lookups        - Lookup parameters filled from the lookup documents
+      qc             - QC parameters (named *_glblrng_qc) evaluated by the worker
+      qc_failures    - Fraction of QC values flagged as failed
+      batch_granules - Worker batching, 1 persists every granule
+      pdict          - ParameterDictionary (or dump) used instead of the synthetic one
+    '''
+    STEPS = ('checks', 'insert', 'keys', 'save', 'index', 'notify')
+
+    def __init__(self, streams=1, granules=100, records=10, parameters=10, rate=None, lookups=0, qc=0, qc_failures=0., batch_granules=1, pdict=None, root_dir=None):
+        self.streams        = streams
+        self.granules       = granules
+        self.records        = records
+        self.parameters     = parameters
+        self.rate           = rate
+        self.lookups        = lookups
+        self.qc             = qc
+        self.qc_failures    = qc_failures
+        self.batch_granules = batch_granules
+        self.root_dir       = root_dir
+        if isinstance(pdict, dict):
+            pdict = ParameterDictionary.load(pdict)
+        if pdict is not None:
+            # There's no object store, document lookups are served from the benchmark's lookup document
+            for name in pdict.keys():
+                if getattr(pdict.get_context(name), 'document_key', None):
+                    pdict.get_context(name).document_key = ''
+        self.pdict          = pdict or self.synthetic_pdict(parameters, lookups, qc)
+
+    #--------------------------------------------------------------------------------
+    # Parameter dictionaries
+    #--------------------------------------------------------------------------------
+
+    @classmethod
+    def synthetic_pdict(cls, parameters=10, lookups=0, qc=0):
+        pdict = ParameterDictionary()
+        t_ctxt = ParameterContext('time', param_type=QuantityType(value_encoding=np.dtype('float64')))
+        t_ctxt.uom = 'seconds since 1900-01-01'
+        pdict.add_context(t_ctxt, is_temporal=True)
+        for i in xrange(parameters):
+            ctxt = ParameterContext('param_%s' % i, param_type=QuantityType(value_encoding=np.dtype('float32')), fill_value=-9999.)
+            ctxt.uom = '1'
+            pdict.add_context(ctxt)
+        for i in xrange(lookups):
+            ctxt = ParameterContext('lookup_%s' % i, param_type=SparseConstantType(base_type=ConstantType(value_encoding='float64'), fill_value=-9999.))
+            ctxt.uom = '1'
+            ctxt.lookup_value = 'lookup_%s' % i
+            ctxt.document_key = ''
+            pdict.add_context(ctxt)
+        for i in xrange(qc):
+            ctxt = ParameterContext('param_%s_glblrng_qc' % i, param_type=QuantityType(value_encoding=np.dtype('int8')), fill_value=-99)
+            ctxt.uom = '1'
+            pdict.add_context(ctxt)
+        return pdict
+
+    @classmethod
+    def export_pdict(cls, name, path):
+        '''
+        Saves a preloaded parameter dictionary for the benchmark, needs a
+        running container with the preload.
+        '''
+        from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
+        pdict = DatasetManagementService.get_parameter_dictionary_by_name(name)
+        with open(path, 'wb') as f:
+            f.write(msgpack.packb(pdict.dump(), default=encode_ion))
+
+    @classmethod
+    def read_pdict(cls, path):
+        with open(path, 'rb') as f:
+            return ParameterDictionary.load(msgpack.unpackb(f.read(), object_hook=decode_ion))
+
+    def lookup_document(self):
+        ''' The document holding a value for every lookup parameter '''
+        doc = {}
+        for name in self.pdict.keys():
+            context = self.pdict.get_context(name)
+            if getattr(context, 'lookup_value', None):
+                doc[context.lookup_value] = 1.
+        return doc
+
+    #--------------------------------------------------------------------------------
+    # Synthetic granules
+    #--------------------------------------------------------------------------------
+
+    def fill_parameter(self, rdt, name, t):
+        context = rdt.context(name)
+        ptype = context.param_type
+        records = t.shape[0]
+        if getattr(context, 'lookup_value', None) or isinstance(ptype, ParameterFunctionType):
+            # Filled by the worker or computed on demand
+            return
+        if name.endswith('_qc'):
+            values = np.ones(records, dtype=np.int8)
+            values[np.random.random(records) < self.qc_failures] = 0
+            rdt[name] = values
+        elif isinstance(ptype, QuantityType):
+            if np.dtype(ptype.value_encoding).kind in 'SUO':
+                rdt[name] = ['value'] * records
+            else:
+                rdt[name] = np.sin(np.pi * 2 * t / 60)
+        elif isinstance(ptype, ArrayType):
+            rdt[name] = np.array([range(4)] * records)
+        elif isinstance(ptype, CategoryType):
+            rdt[name] = [context.categories.keys()[0]] * records
+        elif isinstance(ptype, BooleanType):
+            rdt[name] = np.ones(records, dtype=bool)
+        elif isinstance(ptype, (ConstantType, SparseConstantType)):
+            rdt[name] = [1] * records
+
+    def build_granule(self, granule_index, connection_id):
+        start = granule_index * self.records
+        t = np.arange(start, start + self.records, dtype=np.float64)
+        rdt = RecordDictionaryTool(param_dictionary=self.pdict)
+        rdt[rdt.temporal_parameter] = t
+        for name in rdt.fields:
+            if name != rdt.temporal_parameter:
+                self.fill_parameter(rdt, name, t)
+        return rdt.to_granule(connection_id=connection_id, connection_index=str(granule_index))
+
+    #--------------------------------------------------------------------------------
+    # Benchmark
+    #--------------------------------------------------------------------------------
+
+    def setup(self):
+        self._tmp_dir = None
+        if self.root_dir is None:
+            self._tmp_dir = self.root_dir = tempfile.mkdtemp(prefix='ingestion_benchmark_')
+
+        worker = BenchmarkIngestionWorker()
+        worker.CACHE_LIMIT = max(self.streams, worker.CACHE_LIMIT)
+        worker.event_publisher = NullPublisher()
+        worker.qc_publisher = NullPublisher()
+        lookup_document = self.lookup_document()
+        worker.stored_value_manager = CachedStoredValueManager(LocalContainer({'benchmark_lookups':lookup_document}))
+        worker.lookup_docs = ['benchmark_lookups'] if lookup_document else []
+        worker.new_lookups = Queue()
+        worker.input_product = ''
+        worker.qc_enabled = True
+        worker.ignore_gaps = True
+        worker.batch_granules = self.batch_granules
+        worker.collect_timings = True
+        worker.connection_id = ''
+        worker.connection_index = None
+
+        self.coverages = []
+        self.stream_ids = []
+        sdom, tdom = time_series_domain()
+        for i in xrange(self.streams):
+            stream_id, dataset_id = uuid4().hex, uuid4().hex
+            coverage = SimplexCoverage(self.root_dir, uuid4().hex, 'Ingestion benchmark %s' % i, parameter_dictionary=self.pdict, temporal_domain=tdom, spatial_domain=sdom, inline_data_writes=True)
+            CoveragePool.register(dataset_id, coverage, mode='a', simplex=True)
+            worker.stream_datasets[stream_id] = dataset_id
+            worker._datasets[stream_id] = dataset_id
+            worker._coverages[stream_id] = coverage
+            self.coverages.append(coverage)
+            self.stream_ids.append(stream_id)
+        self.worker = worker
+        return worker
+
+    def teardown(self):
+        for coverage in self.worker._coverages.values():
+            CoveragePool.release(coverage, discard=True)
+        self.worker._coverages.clear()
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def run(self):
+        '''
+        Runs the benchmark and returns its report
+        '''
+        self.setup()
+        try:
+            return self._run()
+        finally:
+            self.teardown()
+
+    def _run(self):
+        worker = self.worker
+        StoredValueCache.clear()
+        # Granules are built ahead of time so only the ingestion is measured
+        granules = [(stream_id, self.build_granule(i, stream_id)) for i in xrange(self.granules) for stream_id in self.stream_ids]
+        interval = 1. / self.rate if self.rate else 0
+        latencies = []
+
+        start = time.time()
+        for i, (stream_id, granule) in enumerate(granules):
+            if interval:
+                delay = start + i * interval - time.time()
+                if delay > 0:
+                    gevent.sleep(delay)
+            received = time.time()
+            worker.recv_packet(granule, None, stream_id)
+            latencies.append(time.time() - received)
+        worker.flush_all()
+        elapsed = time.time() - start
+
+        total_granules = len(granules)
+        total_records = total_granules * self.records
+        stored = sum(coverage.num_timesteps for coverage in self.coverages)
+        if stored != total_records:
+            log.warning('Ingested %s records, %s were published', stored, total_records)
+
+        latencies = np.array(latencies) * 1000.
+        report = {
+            'granules'       : total_granules,
+            'records'        : total_records,
+            'elapsed'        : elapsed,
+            'granules_per_s' : total_granules / elapsed,
+            'records_per_s'  : total_records / elapsed,
+            'latency_p50_ms' : float(np.percentile(latencies, 50)),
+            'latency_p99_ms' : float(np.percentile(latencies, 99)),
+            'qc_alerts'      : worker.qc_alerts,
+            'steps'          : {},
+        }
+        if worker.time_stats.get_count():
+            for step in self.STEPS:
+                report['steps'][step] = worker.time_stats.to_string(step)
+            report['steps']['total'] = str(worker.time_stats)
+        return report
+
+    @classmethod
+    def format_report(cls, report):
+        lines = ['%(granules)s granules, %(records)s records in %(elapsed).3fs' % report,
+                 '  %(granules_per_s).1f granules/s  %(records_per_s).1f records/s' % report,
+                 '  recv_packet latency p50 %(latency_p50_ms).3fms  p99 %(latency_p99_ms).3fms' % report,
+                 '  QC alerts %(qc_alerts)s' % report]
+        for step in cls.STEPS + ('total',):
+            if step in report['steps']:
+                lines.append('  add_granule %-6s %s' % (step, report['steps'][step]))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__': # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingestion throughput benchmark')
+    parser.add_argument('--streams', type=int, default=1, help='streams ingested (default: 1)')
+    parser.add_argument('--granules', type=int, default=100, help='granules per stream (default: 100)')
+    parser.add_argument('--records', type=int, nargs='+', default=[10], help='records per granule, several values run several benchmarks (default: 10)')
+    parser.add_argument('--parameters', type=int, default=10, help='parameters of the synthetic parameter dictionary (default: 10)')
+    parser.add_argument('--rate', type=float, default=None, help='granules per second (default: as fast as possible)')
+    parser.add_argument('--lookups', type=int, default=0, help='lookup parameters (default: 0)')
+    parser.add_argument('--qc', type=int, default=0, help='QC parameters (default: 0)')
+    parser.add_argument('--qc-failures', type=float, default=0., help='fraction of failed QC values (default: 0)')
+    parser.add_argument('--batch', type=int, default=1, help='granules per ingestion batch (default: 1)')
+    parser.add_argument('--pdict', help='parameter dictionary dump saved with IngestionBenchmark.export_pdict')
+    opts = parser.parse_args()
+
+    pdict = IngestionBenchmark.read_pdict(opts.pdict) if opts.pdict else None
+    for records in opts.records:
+        benchmark = IngestionBenchmark(streams=opts.streams, granules=opts.granules, records=records, parameters=opts.parameters, rate=opts.rate,
+                                       lookups=opts.lookups, qc=opts.qc, qc_failures=opts.qc_failures, batch_granules=opts.batch, pdict=pdict)
+        print IngestionBenchmark.format_report(benchmark.run())
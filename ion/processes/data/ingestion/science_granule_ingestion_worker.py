@@ -13,10 +13,12 @@ from pyon.ion.event import handle_stream_exception, EventPublisher
 from pyon.ion.event import EventSubscriber
 from pyon.public import log, RT, PRED, CFG, OT
 from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from interface.objects import Granule
 from ion.core.process.transform import TransformStreamListener, TransformStreamProcess
 from ion.util.time_utils import TimeUtils
-from ion.util.stored_values import StoredValueManager
+from ion.util.time_index import TimeIndex
+from ion.util.stored_values import CachedStoredValueManager, StoredValueCache
 from interface.services.dm.iingestion_worker import BaseIngestionWorker
 from pyon.ion.stream import StreamSubscriber
 from gevent.coros import RLock
@@ -34,12 +36,80 @@ import time
 import uuid
 import numpy as np
 from gevent.queue import Queue
+from gevent.event import Event
 
 REPORT_FREQUENCY=100
 MAX_RETRY_TIME=3600
 
+
+class GranuleBatch(object):
+    '''
+    Granules received on a single stream that have not been persisted yet.
+
+    Every granule in a batch has the same signature (the fields carrying
+    values and the values of the sparse constant fields) so that the batch
+    can be written to the coverage as though it were one granule.
+    '''
+    def __init__(self, signature, gap_found=False):
+        self.signature = signature
+        self.gap_found = gap_found
+        self.rdts = []
+        self.records = 0
+        self.nbytes = 0
+        self.created = time.time()
+
+    @classmethod
+    def signature_of(cls, rdt):
+        fields = frozenset(rdt.iterkeys())
+        sparse = []
+        for field in sorted(fields):
+            if isinstance(rdt.context(field).param_type, SparseConstantType):
+                values = rdt[field]
+                value = np.asanyarray(values[-1]).tolist() if values is not None and len(values) else None
+                sparse.append((field, value))
+        return fields, tuple(sparse)
+
+    @classmethod
+    def nbytes_of(cls, rdt):
+        nbytes = 0
+        for k,v in rdt.iteritems():
+            nbytes += getattr(v[:], 'nbytes', 0)
+        return nbytes
+
+    def add(self, rdt):
+        self.rdts.append(rdt)
+        self.records += len(rdt)
+        self.nbytes += self.nbytes_of(rdt)
+
+    def age(self):
+        ''' Milliseconds since the first granule was added to the batch '''
+        return (time.time() - self.created) * 1000.
+
+    def merge(self):
+        '''
+        Concatenates the batch into a single record dictionary
+        '''
+        if len(self.rdts) == 1:
+            return self.rdts[0]
+        first, last = self.rdts[0], self.rdts[-1]
+        rdt = RecordDictionaryTool(param_dictionary=first._pdict)
+        rdt._stream_def = first._stream_def
+        rdt._available_fields = first._available_fields
+        rdt._stream_config = first._stream_config
+        rdt._locator = first._locator
+        rdt._shp = (self.records,)
+        for field in self.signature[0]:
+            rdt._set(field, np.concatenate([np.atleast_1d(r[field]) for r in self.rdts]))
+        rdt.connection_id = last.connection_id
+        rdt.connection_index = last.connection_index
+        return rdt
+
+
 class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker):
     CACHE_LIMIT=CFG.get_safe('container.ingestion_cache',5)
+    BATCH_GRANULES=10       # Granules per batch, 1 disables batching
+    BATCH_BYTES=1 << 20     # Approximate bytes of values per batch
+    BATCH_WINDOW=250        # Milliseconds a batch may stay pending
 
     def __init__(self, *args,**kwargs):
         TransformStreamListener.__init__(self, *args, **kwargs)
@@ -55,7 +125,26 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
         self._bad_coverages = {}
 
+        #--------------------------------------------------------------------------------
+        # Batching
+        # - Pending batches of granules per stream
+        #--------------------------------------------------------------------------------
+        self._batches = {}
+        self._ready = collections.deque()   # (stream_id, batch) taken off _batches, not persisted yet
+        self.batch_lock = RLock()
+        self.persist_lock = RLock()
+        self.batch_granules = self.BATCH_GRANULES
+        self.batch_bytes = self.BATCH_BYTES
+        self.batch_window = self.BATCH_WINDOW
+        self.flush_thread = None
+        self._stop_flushing = Event()
+        self.ignore_gaps = False
+        self.connection_id = ''
+        self.connection_index = None
+
         self.time_stats = Accumulator(format='%3f')
+        # Gather the add_granule step timings even when not debugging
+        self.collect_timings = False
         # unique ID to identify this worker in log msgs
         self._id = uuid.uuid1()
 
@@ -84,12 +173,16 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         self.add_endpoint(self._rpc_server)
 
         self.event_publisher = EventPublisher(OT.DatasetModified)
-        self.stored_value_manager = StoredValueManager(self.container)
+        self.stored_value_manager = CachedStoredValueManager(self.container)
 
         self.lookup_docs = self.CFG.get_safe('process.lookup_docs',[])
         self.input_product = self.CFG.get_safe('process.input_product','')
         self.qc_enabled = self.CFG.get_safe('process.qc_enabled', True)
         self.ignore_gaps = self.CFG.get_safe('service.ingestion.ignore_gaps', False)
+        self.batch_granules = self.CFG.get_safe('service.ingestion.batch_granules', self.BATCH_GRANULES)
+        self.batch_bytes = self.CFG.get_safe('service.ingestion.batch_bytes', self.BATCH_BYTES)
+        self.batch_window = self.CFG.get_safe('service.ingestion.batch_window', self.BATCH_WINDOW)
+        self.collect_timings = self.CFG.get_safe('service.ingestion.collect_timings', False)
         self.new_lookups = Queue()
         self.lookup_monitor = EventSubscriber(event_type=OT.ExternalReferencesUpdatedEvent, callback=self._add_lookups, auto_delete=True)
         self.add_endpoint(self.lookup_monitor)
@@ -100,15 +193,12 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         self.start_listener()
 
     def on_quit(self): #pragma no cover
-        self.event_publisher.close()
-        self.qc_publisher.close()
         if self.subscriber_thread:
             self.stop_listener()
+        self.event_publisher.close()
+        self.qc_publisher.close()
         for stream, coverage in self._coverages.iteritems():
-            try:
-                coverage.close(timeout=5)
-            except:
-                log.exception('Problems closing the coverage')
+            CoveragePool.release(coverage)
         self._coverages.clear()
         TransformStreamListener.on_quit(self)
         BaseIngestionWorker.on_quit(self)
@@ -118,17 +208,25 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         # We use a lock here to prevent possible race conditions from starting multiple listeners and coverage clobbering
         with self.thread_lock:
             self.subscriber_thread = self._process.thread_manager.spawn(self.subscriber.listen, thread_name='%s-subscriber' % self.id)
+            if self.batch_granules > 1:
+                self._stop_flushing.clear()
+                self.flush_thread = self._process.thread_manager.spawn(self.flush_loop, thread_name='%s-flush' % self.id)
 
     def stop_listener(self):
         # Avoid race conditions with coverage operations (Don't start a listener at the same time as closing one)
         with self.thread_lock:
             self.subscriber.close()
             self.subscriber_thread.join(timeout=10)
+            if self.flush_thread is not None:
+                self._stop_flushing.set()
+                self.flush_thread.join(timeout=10)
+                self.flush_thread = None
+            try:
+                self.flush_all()
+            except:
+                log.exception('Problems flushing the pending granules')
             for stream, coverage in self._coverages.iteritems():
-                try:
-                    coverage.close(timeout=5)
-                except:
-                    log.exception('Problems closing the coverage')
+                CoveragePool.release(coverage)
             self._coverages.clear()
             self.subscriber_thread = None
 
@@ -142,6 +240,10 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             self.start_listener()
 
 
+    def _stat(self):
+        self._stats['lookup_values'] = StoredValueCache.stats()
+        return self._stats
+
     def _add_lookups(self, event, *args, **kwargs):
         if event.origin == self.input_product:
             if isinstance(event.reference_keys, list):
@@ -174,7 +276,7 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
     def get_coverage(self, stream_id):
         '''
-        Memoization (LRU) of _get_coverage
+        Memoization (LRU) of the writable coverage handles acquired from the coverage pool
         '''
         try:
             result = self._coverages.pop(stream_id)
@@ -182,12 +284,12 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             dataset_id = self.get_dataset(stream_id)
             if dataset_id is None:
                 return None
-            result = DatasetManagementService._get_simplex_coverage(dataset_id, mode='a')
+            result = CoveragePool.acquire(dataset_id, mode='a', simplex=True)
             if result is None:
                 return None
             if len(self._coverages) >= self.CACHE_LIMIT:
                 k, coverage = self._coverages.popitem(0)
-                coverage.close(timeout=5)
+                CoveragePool.release(coverage)
         self._coverages[stream_id] = result
         return result
 
@@ -197,8 +299,8 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             dataset_id = self.get_dataset(stream_id)
             sdom, tdom = time_series_domain()
             new_cov = DatasetManagementService._create_simplex_coverage(dataset_id, old_cov.parameter_dictionary, sdom, tdom, old_cov._persistence_layer.inline_data_writes)
-            old_cov.close()
-            result = new_cov
+            CoveragePool.release(old_cov, discard=True)
+            result = CoveragePool.register(dataset_id, new_cov, mode='a', simplex=True)
         except KeyError:
             result = self.get_coverage(stream_id)
         self._coverages[stream_id] = result
@@ -283,16 +385,93 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             log.debug('Empty granule for stream %s', stream_id)
             return
 
-        self.persist_or_timeout(stream_id, rdt)
+        if self.batch_granules > 1:
+            self.enqueue_granule(stream_id, rdt)
+        else:
+            self.persist_or_timeout(stream_id, rdt)
 
-    def persist_or_timeout(self, stream_id, rdt):
+    def enqueue_granule(self, stream_id, rdt):
+        '''
+        Adds the granule to the pending batch for the stream. The batch is
+        persisted once it reaches the configured number of granules or bytes,
+        or by the flush loop once it has been pending for the batch window.
+        '''
+        with self.batch_lock:
+            gap_found = False
+            if not self.ignore_gaps:
+                gap_found = self.has_gap(rdt.connection_id, rdt.connection_index)
+                if gap_found:
+                    log.error('Gap Found!   New connection: (%s,%s)\tOld Connection: (%s,%s)', rdt.connection_id, rdt.connection_index, self.connection_id, self.connection_index)
+            self.update_connection_index(rdt.connection_id, rdt.connection_index)
+
+            signature = GranuleBatch.signature_of(rdt)
+            batch = self._batches.get(stream_id)
+            if batch is not None and (gap_found or batch.signature != signature):
+                # The granule can't be written together with the pending ones
+                self._take_batch(stream_id)
+                batch = None
+            if batch is None:
+                batch = GranuleBatch(signature, gap_found)
+                self._batches[stream_id] = batch
+            batch.add(rdt)
+
+            if len(batch.rdts) >= self.batch_granules or batch.nbytes >= self.batch_bytes:
+                self._take_batch(stream_id)
+        self.persist_ready()
+
+    def _take_batch(self, stream_id):
+        ''' Moves the pending batch for the stream, if any, to the batches to persist, the batch lock must be held '''
+        batch = self._batches.pop(stream_id, None)
+        if batch is not None:
+            self._ready.append((stream_id, batch))
+
+    def persist_ready(self):
+        '''
+        Persists the batches taken off the pending ones in the order they were
+        taken. The batch lock isn't held, granules keep being enqueued while
+        the coverage is written.
+        '''
+        with self.persist_lock:
+            while self._ready:
+                stream_id, batch = self._ready.popleft()
+                self.persist_or_timeout(stream_id, batch.merge(), gap_found=batch.gap_found)
+
+    def flush_batch(self, stream_id):
+        ''' Persists the pending batch for the stream, if any '''
+        with self.batch_lock:
+            self._take_batch(stream_id)
+        self.persist_ready()
+
+    def flush_expired(self):
+        ''' Persists the batches that have been pending longer than the batch window '''
+        with self.batch_lock:
+            for stream_id, batch in self._batches.items():
+                if batch.age() >= self.batch_window:
+                    self._take_batch(stream_id)
+        self.persist_ready()
+
+    def flush_all(self):
+        with self.batch_lock:
+            for stream_id in self._batches.keys():
+                self._take_batch(stream_id)
+        self.persist_ready()
+
+    def flush_loop(self):
+        interval = self.batch_window / 2000.
+        while not self._stop_flushing.wait(timeout=interval):
+            try:
+                self.flush_expired()
+            except:
+                log.exception('Problems flushing the pending granules')
+
+    def persist_or_timeout(self, stream_id, rdt, gap_found=None):
         """ retry writing coverage multiple times and eventually time out """
         done = False
         timeout = 2
         start = time.time()
         while not done:
             try:
-                self.add_granule(stream_id, rdt)
+                self.add_granule(stream_id, rdt, gap_found=gap_found)
                 done = True
             except:
                 log.exception('An issue with coverage, retrying after a bit')
@@ -303,7 +482,7 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
                 if stream_id in self._coverages:
                     log.info('Popping coverage for stream %s', stream_id)
-                    self._coverages.pop(stream_id)
+                    CoveragePool.release(self._coverages.pop(stream_id), discard=True)
 
                 gevent.sleep(timeout)
                 if timeout > (60 * 5):
@@ -397,10 +576,15 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             ntp_time = TimeUtils.ts_to_units(coverage.get_parameter_context('ingestion_timestamp').uom, t_now)
             coverage.set_parameter_values(param_name='ingestion_timestamp', tdoa=slice_, value=ntp_time)
     
-    def add_granule(self,stream_id, rdt):
-        ''' Appends the granule's data to the coverage and persists it. '''
+    def add_granule(self,stream_id, rdt, gap_found=None):
+        '''
+        Appends the granule's data to the coverage and persists it.
+        gap_found is None when the gap analysis hasn't already been made for
+        the granule (e.g. when it is a batch of granules).
+        '''
         debugging = log.isEnabledFor(DEBUG)
-        timer = Timer() if debugging else None
+        timing = debugging or self.collect_timings
+        timer = Timer() if timing else None
         if stream_id in self._bad_coverages:
             log.info('Message attempting to be inserted into bad coverage: %s',
                      DatasetManagementService._get_coverage_path(self.get_dataset(stream_id)))
@@ -408,10 +592,15 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         #--------------------------------------------------------------------------------
         # Gap Analysis
         #--------------------------------------------------------------------------------
+        # Batched granules had their gap analysis, and the connection index
+        # moved past them, when they were enqueued, the gap was logged then
+        update_index = gap_found is None
         if not self.ignore_gaps:
-            gap_found = self.has_gap(rdt.connection_id, rdt.connection_index)
+            if gap_found is None:
+                gap_found = self.has_gap(rdt.connection_id, rdt.connection_index)
+                if gap_found:
+                    log.error('Gap Found!   New connection: (%s,%s)\tOld Connection: (%s,%s)', rdt.connection_id, rdt.connection_index, self.connection_id, self.connection_index)
             if gap_found:
-                log.error('Gap Found!   New connection: (%s,%s)\tOld Connection: (%s,%s)', rdt.connection_id, rdt.connection_index, self.connection_id, self.connection_index)
                 self.gap_coverage(stream_id)
 
 
@@ -449,25 +638,31 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
         self.insert_sparse_values(coverage,rdt,stream_id)
         
-        if debugging:
+        if timing:
             timer.complete_step('checks') # lightweight ops, should be zero
         
         self.expand_coverage(coverage, elements, stream_id)
         
-        if debugging:
+        if timing:
             timer.complete_step('insert')
 
         self.insert_values(coverage, rdt, stream_id)
         
-        if debugging:
+        if timing:
             timer.complete_step('keys')
         
         DatasetManagementService._save_coverage(coverage)
         
-        if debugging:
+        if timing:
             timer.complete_step('save')
         
         start_index = coverage.num_timesteps - elements
+        if elements:
+            self.update_time_index(coverage, rdt[rdt.temporal_parameter], start_index)
+
+        if timing:
+            timer.complete_step('index')
+
         self.dataset_changed(dataset_id,coverage.num_timesteps,(start_index,start_index+elements))
 
         if not self.ignore_gaps and gap_found:
@@ -475,21 +670,33 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
         self.evaluate_qc(rdt, dataset_id)
         
-        if debugging:
+        if timing:
             timer.complete_step('notify')
             self._add_timing_stats(timer)
 
-        self.update_connection_index(rdt.connection_id, rdt.connection_index)
+        if update_index:
+            self.update_connection_index(rdt.connection_id, rdt.connection_index)
+
+    def update_time_index(self, coverage, values, start_index):
+        '''
+        Keeps the coverage's time index up to date, the index is only an
+        optimization for readers (which read the time values without it) so
+        failures are logged and ignored.
+        '''
+        try:
+            TimeIndex.update(coverage, values, start_index)
+        except Exception:
+            log.warning('Unable to update the time index for coverage %s', coverage.persistence_dir, exc_info=True)
 
     def _add_timing_stats(self, timer):
         """ add stats from latest coverage operation to Accumulator and periodically log results """
         self.time_stats.add(timer)
-        if self.time_stats.get_count() % REPORT_FREQUENCY>0:
+        if not log.isEnabledFor(DEBUG) or self.time_stats.get_count() % REPORT_FREQUENCY>0:
             return
 
         if log.isEnabledFor(TRACE):
             # report per step
-            for step in 'checks', 'insert', 'keys', 'save', 'notify':
+            for step in 'checks', 'insert', 'keys', 'save', 'index', 'notify':
                 log.debug('%s step %s times: %s', self._id, step, self.time_stats.to_string(step))
         # report totals
         log.debug('%s total times: %s', self._id, self.time_stats)
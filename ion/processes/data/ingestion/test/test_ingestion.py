@@ -7,7 +7,13 @@
 
 from pyon.util.unit_test import PyonTestCase
 from ion.processes.data.ingestion.science_granule_ingestion_worker import ScienceGranuleIngestionWorker
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType, SparseConstantType
 from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+import gevent
+import numpy as np
 
 
 @attr('UNIT',group='dm')
@@ -39,5 +45,100 @@ class IngestionTest(PyonTestCase):
         self.assertFalse(ingestion.has_gap('',''))
         self.assertFalse(ingestion.has_gap('',''))
 
+    def build_rdt(self, t, lat=45., connection_id='', connection_index=''):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=np.float64)), is_temporal=True)
+        pdict.add_context(ParameterContext('temp', param_type=QuantityType(value_encoding=np.float32)))
+        pdict.add_context(ParameterContext('lat', param_type=SparseConstantType(value_encoding=np.float64)))
+        rdt = RecordDictionaryTool(param_dictionary=pdict)
+        rdt['time'] = t
+        rdt['temp'] = t * 2
+        rdt['lat'] = [lat] * len(t)
+        rdt.connection_id = connection_id
+        rdt.connection_index = connection_index
+        return rdt
+
+    def test_ingestion_batching(self):
+        ingestion = ScienceGranuleIngestionWorker()
+        ingestion.batch_granules = 3
+        ingestion.persist_or_timeout = Mock()
+
+        ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10)))
+        ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10,20)))
+        self.assertFalse(ingestion.persist_or_timeout.called)
+
+        # The batch is persisted without holding the batch lock
+        def lock_free():
+            if ingestion.batch_lock.acquire(blocking=False):
+                ingestion.batch_lock.release()
+                return True
+            return False
+        ingestion.persist_or_timeout.side_effect = lambda *args, **kwargs: self.assertTrue(gevent.spawn(lock_free).get())
+        ingestion.enqueue_granule('stream', self.build_rdt(np.arange(20,30)))
+        self.assertEquals(ingestion.persist_or_timeout.call_count, 1)
+        self.assertFalse(ingestion._ready)
+
+        stream_id, rdt = ingestion.persist_or_timeout.call_args[0]
+        self.assertEquals(stream_id, 'stream')
+        self.assertEquals(len(rdt), 30)
+        np.testing.assert_array_equal(rdt['time'], np.arange(30))
+        np.testing.assert_array_equal(rdt['temp'], np.arange(30) * 2)
+        np.testing.assert_array_equal(rdt['lat'], [45.] * 30)
+
+    def test_ingestion_batch_boundaries(self):
+        ingestion = ScienceGranuleIngestionWorker()
+        ingestion.batch_granules = 10
+        ingestion.batch_window = 0
+        ingestion.persist_or_timeout = Mock()
+
+        # A change in a sparse value closes the pending batch
+        ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10)))
+        ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10,20), lat=46.))
+        self.assertEquals(ingestion.persist_or_timeout.call_count, 1)
+        stream_id, rdt = ingestion.persist_or_timeout.call_args[0]
+        np.testing.assert_array_equal(rdt['time'], np.arange(10))
+
+        # Expired batches are flushed
+        ingestion.flush_expired()
+        self.assertEquals(ingestion.persist_or_timeout.call_count, 2)
+        stream_id, rdt = ingestion.persist_or_timeout.call_args[0]
+        np.testing.assert_array_equal(rdt['lat'], [46.] * 10)
+        self.assertFalse(ingestion._batches)
+
+    def test_ingestion_batch_gaps(self):
+        ingestion = ScienceGranuleIngestionWorker()
+        ingestion.batch_granules = 10
+        # Everything below persist_or_timeout/add_granule is stubbed out
+        coverage = Mock(num_timesteps=0)
+        ingestion.get_dataset = Mock(return_value='dataset')
+        ingestion.get_coverage = Mock(return_value=coverage)
+        for method in ('insert_sparse_values', 'expand_coverage', 'insert_values', 'update_time_index',
+                       'dataset_changed', 'evaluate_qc', 'gap_coverage', 'splice_coverage'):
+            setattr(ingestion, method, Mock())
+
+        with patch('ion.processes.data.ingestion.science_granule_ingestion_worker.DatasetManagementService'), \
+                patch('ion.processes.data.ingestion.science_granule_ingestion_worker.log') as log_mock:
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10), connection_id='c1', connection_index='0'))
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(10,20), connection_id='c1', connection_index='1'))
+            # The sparse value changes, the pending batch is persisted
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(20,30), lat=46., connection_id='c1', connection_index='2'))
+            self.assertEquals(ingestion.insert_values.call_count, 1)
+            # Persisting the batch doesn't move the connection index back
+            self.assertEquals((ingestion.connection_id, ingestion.connection_index), ('c1', 2))
 
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(30,40), lat=46., connection_id='c1', connection_index='3'))
+            ingestion.flush_all()
+            self.assertEquals(ingestion.insert_values.call_count, 2)
+            self.assertFalse(ingestion.gap_coverage.called)
+            self.assertFalse(ingestion.splice_coverage.called)
 
+            # A new connection is one gap
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(40,50), lat=46., connection_id='c2', connection_index='0'))
+            ingestion.enqueue_granule('stream', self.build_rdt(np.arange(50,60), lat=46., connection_id='c2', connection_index='1'))
+            ingestion.flush_all()
+            self.assertEquals(ingestion.gap_coverage.call_count, 1)
+            self.assertEquals(ingestion.splice_coverage.call_count, 1)
+            # The gap is logged against the connection before it
+            self.assertEquals(log_mock.error.call_count, 1)
+            self.assertEquals(log_mock.error.call_args[0][1:], ('c2', '0', 'c1', 3))
+            self.assertEquals((ingestion.connection_id, ingestion.connection_index), ('c2', 1))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/ingestion/test/test_ingestion_benchmark.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from nose.plugins.attrib import attr
+
+from ion.processes.data.ingestion.ingestion_benchmark import IngestionBenchmark
+
+
+@attr('UTIL',group='dm')
+class IngestionBenchmarkTest(PyonTestCase):
+    def test_benchmark(self):
+        benchmark = IngestionBenchmark(streams=2, granules=10, records=5, parameters=4, lookups=1, qc=1, qc_failures=1.)
+        report = benchmark.run()
+        log.info('\n%s', IngestionBenchmark.format_report(report))
+
+        self.assertEquals(report['granules'], 20)
+        self.assertEquals(report['records'], 100)
+        self.assertEquals(report['qc_alerts'], 20)
+        self.assertTrue(report['latency_p50_ms'] <= report['latency_p99_ms'])
+        self.assertEquals(set(report['steps']), set(IngestionBenchmark.STEPS + ('total',)))
+        self.assertEquals(sum(coverage.num_timesteps for coverage in benchmark.coverages), 100)
+
+    def test_batched_benchmark(self):
+        benchmark = IngestionBenchmark(granules=12, records=5, parameters=2, batch_granules=5)
+        report = benchmark.run()
+        self.assertEquals(sum(coverage.num_timesteps for coverage in benchmark.coverages), 60)
+        # 2 full batches and the remainder flushed at the end
+        self.assertEquals(benchmark.worker.time_stats.get_count(), 3)
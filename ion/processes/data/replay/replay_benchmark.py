@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/replay/replay_benchmark.py
+@description Replay stride resolution benchmark
+
+Compares resolving stride timestamps to coverage indices one at a time
+(ReplayProcess.get_time_idx) with the vectorized ReplayProcess.get_time_idxs
+over an in memory time axis, no coverage or container is needed.
+
+    bin/python ion/processes/data/replay/replay_benchmark.py --values 86400 --stride 60
+'''
+
+from ion.processes.data.replay.replay_process import ReplayProcess
+
+import numpy as np
+import time
+
+
+class TimeContext(object):
+    def __init__(self, uom):
+        self.uom = uom
+
+
+class TimeCoverage(object):
+    '''
+    In memory stand-in for a coverage holding only its time values, counts the reads
+    '''
+    temporal_parameter_name = 'time'
+
+    def __init__(self, times, uom='seconds'):
+        self.times = times
+        self.context = TimeContext(uom)
+        self.reads = 0
+
+    @property
+    def num_timesteps(self):
+        return self.times.shape[0]
+
+    def get_parameter_context(self, name):
+        return self.context
+
+    def get_parameter_values(self, name, *args, **kwargs):
+        self.reads += 1
+        return self.times
+
+
+class StrideBenchmark(object):
+    '''
+    Runs a single benchmark configuration:
+      values - Time values of the coverage, one per second
+      stride - Seconds between the requested timestamps
+    '''
+    def __init__(self, values=86400, stride=60.):
+        self.values = values
+        self.stride = stride
+
+    def run(self):
+        coverage = TimeCoverage(np.arange(0, self.values, 1.))
+        requested = np.arange(0, self.values, self.stride)
+
+        start = time.time()
+        per_timestamp = sorted(set(ReplayProcess.get_time_idx(coverage, i) for i in requested))
+        per_timestamp_elapsed = time.time() - start
+        per_timestamp_reads, coverage.reads = coverage.reads, 0
+
+        start = time.time()
+        vectorized = sorted(set(ReplayProcess.get_time_idxs(coverage, requested)))
+        vectorized_elapsed = time.time() - start
+
+        return {
+            'values'               : self.values,
+            'timestamps'           : len(requested),
+            'matches'              : per_timestamp == vectorized,
+            'per_timestamp_s'      : per_timestamp_elapsed,
+            'per_timestamp_reads'  : per_timestamp_reads,
+            'vectorized_s'         : vectorized_elapsed,
+            'vectorized_reads'     : coverage.reads,
+            'speedup'              : per_timestamp_elapsed / max(vectorized_elapsed, 1e-9),
+        }
+
+    @classmethod
+    def format_report(cls, report):
+        return '\n'.join([
+            '%(timestamps)s timestamps over %(values)s values, indices match: %(matches)s' % report,
+            '  per timestamp %(per_timestamp_s).4fs (%(per_timestamp_reads)s reads)' % report,
+            '  vectorized    %(vectorized_s).4fs (%(vectorized_reads)s reads)' % report,
+            '  speedup       %(speedup).1fx' % report])
+
+
+if __name__ == '__main__': # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay stride resolution benchmark')
+    parser.add_argument('--values', type=int, default=86400, help='time values of the coverage (default: 86400)')
+    parser.add_argument('--stride', type=float, nargs='+', default=[60.], help='seconds between requested timestamps, several values run several benchmarks (default: 60)')
+    opts = parser.parse_args()
+
+    for stride in opts.stride:
+        print StrideBenchmark.format_report(StrideBenchmark(values=opts.values, stride=stride).run())
@@ -14,6 +14,7 @@ from pyon.util.log import log
 
 from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
 from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from ion.util.time_utils import TimeUtils
 
 from coverage_model import utils
@@ -44,6 +45,9 @@ class ReplayProcess(BaseReplayProcess):
         start_time: 0         # Start time (index value) to be replayed
         end_time:   0         # End time (index value) to be replayed
         parameters: []        # List of parameters to form in the granule
+        max_points: None      # Decimates the data to at most max_points records
+        bucket_time: None     # Decimates the data to one record per bucket_time seconds
+        aggregate: mean       # Aggregation of the decimated buckets (min, max, mean, first, last)
       
 
     '''
@@ -55,9 +59,14 @@ class ReplayProcess(BaseReplayProcess):
     end_time        = None
     stride_time     = None
     parameters      = None
+    tdoa            = None
+    max_points      = None
+    bucket_time     = None
+    aggregate       = 'mean'
     stream_id       = ''
     stream_def_id   = ''
 
+    AGGREGATES      = ('min', 'max', 'mean', 'first', 'last')
 
     def __init__(self, *args, **kwargs):
         super(ReplayProcess,self).__init__(*args,**kwargs)
@@ -83,6 +92,9 @@ class ReplayProcess(BaseReplayProcess):
         self.parameters      = self.CFG.get_safe('process.query.parameters',None)
         self.publish_limit   = self.CFG.get_safe('process.query.publish_limit', 10)
         self.tdoa            = self.CFG.get_safe('process.query.tdoa',None)
+        self.max_points      = self.CFG.get_safe('process.query.max_points', None)
+        self.bucket_time     = self.CFG.get_safe('process.query.bucket_time', None)
+        self.aggregate       = self.CFG.get_safe('process.query.aggregate', 'mean')
         self.stream_id       = self.CFG.get_safe('process.publish_streams.output', '')
         self.stream_def      = pubsub.read_stream_definition(stream_id=self.stream_id)
         self.stream_def_id   = self.stream_def._id
@@ -108,9 +120,44 @@ class ReplayProcess(BaseReplayProcess):
         idx = TimeUtils.get_relative_time(coverage, units)
         return idx
 
+    @classmethod
+    def get_time_idxs(cls, coverage, timevals):
+        '''
+        Resolves an array of timestamps to coverage indices with a single read of the time values
+        '''
+        temporal_variable = coverage.temporal_parameter_name
+        uom = coverage.get_parameter_context(temporal_variable).uom
+
+        units = [TimeUtils.ts_to_units(uom, timeval) for timeval in timevals]
+
+        idxs = TimeUtils.get_relative_times(coverage, units)
+        return idxs
+
 
     @classmethod
-    def _coverage_to_granule(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, parameters=None, stream_def_id=None, tdoa=None):
+    def _coverage_to_granule(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, parameters=None, stream_def_id=None, tdoa=None, max_points=None, bucket_time=None, aggregate='mean'):
+        slice_ = cls._get_slice(coverage, start_time, end_time, stride_time, fuzzy_stride, tdoa)
+        return cls._slice_to_rdt(coverage, slice_, parameters, stream_def_id, max_points, bucket_time, aggregate)
+
+    @classmethod
+    def _coverage_to_granules(cls, coverage, publish_limit, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, parameters=None, stream_def_id=None, tdoa=None, max_points=None, bucket_time=None, aggregate='mean'):
+        '''
+        Generator of record dictionaries holding at most publish_limit records each,
+        the coverage is only read for a slab when the slab is requested.
+        Decimated data is produced as a single record dictionary.
+        '''
+        slice_ = cls._get_slice(coverage, start_time, end_time, stride_time, fuzzy_stride, tdoa)
+        if cls._empty_slice(slice_):
+            log.warning('Requested empty set of data.  %s', slice_)
+            return
+        if max_points or bucket_time:
+            yield cls._slice_to_rdt(coverage, slice_, parameters, stream_def_id, max_points, bucket_time, aggregate)
+            return
+        for slab in cls._slabs(slice_, coverage.num_timesteps, publish_limit):
+            yield cls._slice_to_rdt(coverage, slab, parameters, stream_def_id)
+
+    @classmethod
+    def _get_slice(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, tdoa=None):
         slice_ = slice(None) # Defaults to all values
 
 
@@ -125,11 +172,10 @@ class ReplayProcess(BaseReplayProcess):
         if tdoa is not None and isinstance(tdoa,slice):
             slice_ = tdoa
         
-        elif stride_time is not None and not fuzzy_stride: # SLOW 
+        elif stride_time is not None and not fuzzy_stride:
             ugly_range = np.arange(start_time, end_time, stride_time)
-            idx_values = [cls.get_time_idx(coverage,i) for i in ugly_range]
-            idx_values = list(set(idx_values)) # Removing duplicates - also mixes the order of the list!!!
-            idx_values.sort()
+            idx_values = cls.get_time_idxs(coverage, ugly_range)
+            idx_values = sorted(set(idx_values)) # Removing duplicates
             slice_ = [idx_values]
 
 
@@ -142,6 +188,38 @@ class ReplayProcess(BaseReplayProcess):
             slice_ = slice(start_time,end_time,stride_time)
             log.info('Slice: %s', slice_)
 
+        return slice_
+
+    @classmethod
+    def _empty_slice(cls, slice_):
+        if isinstance(slice_, slice):
+            return slice_.start == slice_.stop and slice_.start is not None
+        return not len(slice_[0])
+
+    @classmethod
+    def _slabs(cls, slice_, num_timesteps, publish_limit):
+        '''
+        Splits a coverage slice (or index list) into consecutive slices of at most publish_limit records
+        '''
+        if not isinstance(slice_, slice):
+            idx_values = slice_[0]
+            for i in xrange(0, len(idx_values), publish_limit):
+                yield [idx_values[i:i+publish_limit]]
+            return
+
+        start, stop, step = slice_.indices(num_timesteps)
+        for i in xrange(start, stop, step * publish_limit):
+            end = i + step * publish_limit
+            if step > 0:
+                end = min(end, stop)
+            else:
+                end = max(end, stop)
+                if end < 0:
+                    end = None
+            yield slice(i, end, step)
+
+    @classmethod
+    def _slice_to_rdt(cls, coverage, slice_, parameters=None, stream_def_id=None, max_points=None, bucket_time=None, aggregate='mean'):
         if stream_def_id:
             rdt = RecordDictionaryTool(stream_definition_id=stream_def_id)
         else:
@@ -152,22 +230,142 @@ class ReplayProcess(BaseReplayProcess):
         else:
             fields = rdt.fields
 
-        if slice_.start == slice_.stop and slice_.start is not None:
+        if cls._empty_slice(slice_):
             log.warning('Requested empty set of data.  %s', slice_)
             return rdt
         
-        # Do time first
         tname = coverage.temporal_parameter_name
-        cls.map_cov_rdt(coverage,rdt,tname, slice_)
+        starts = None
+        if max_points or bucket_time:
+            slice_, starts = cls._decimate(coverage, slice_, max_points, bucket_time, aggregate)
+
+        # Do time first
+        cls.map_cov_rdt(coverage,rdt,tname, slice_, starts, cls._time_aggregate(aggregate))
 
         for field in fields:
             if field == tname:
                 continue
-            cls.map_cov_rdt(coverage,rdt,field, slice_)
+            cls.map_cov_rdt(coverage,rdt,field, slice_, starts, aggregate)
         return rdt
 
+    #--------------------------------------------------------------------------------
+    # Decimation
+    #--------------------------------------------------------------------------------
+
     @classmethod
-    def map_cov_rdt(cls, coverage, rdt, field, slice_):
+    def _decimate(cls, coverage, slice_, max_points=None, bucket_time=None, aggregate='mean'):
+        '''
+        Returns the slice to read and the start indices (in the values read) of
+        the buckets to aggregate, None if there's nothing to aggregate.
+        The data is split either in max_points buckets of equal size or in
+        buckets of bucket_time seconds.
+        '''
+        if aggregate not in cls.AGGREGATES:
+            raise BadRequest('Unknown aggregate %s, expected one of %s' % (aggregate, ', '.join(cls.AGGREGATES)))
+        if max_points and bucket_time:
+            raise BadRequest('max_points and bucket_time are mutually exclusive')
+        if max_points:
+            validate_is_instance(max_points, Number, 'max_points must be a number.')
+            max_points = int(max_points)
+            if max_points < 1:
+                raise BadRequest('max_points must be positive')
+            if aggregate == 'first' and isinstance(slice_, slice):
+                # No need to read the records that are dropped
+                return cls._strided_slice(slice_, coverage.num_timesteps, max_points), None
+            num_values = utils.slice_shape(slice_, (coverage.num_timesteps,))[0]
+            return slice_, cls._point_buckets(num_values, max_points)
+
+        validate_is_instance(bucket_time, Number, 'bucket_time must be a number.')
+        if bucket_time <= 0:
+            raise BadRequest('bucket_time must be positive')
+        tname = coverage.temporal_parameter_name
+        uom = coverage.get_parameter_context(tname).uom
+        # Bucket width in the units of the time parameter
+        width = TimeUtils.ts_to_units(uom, bucket_time) - TimeUtils.ts_to_units(uom, 0)
+        times = np.atleast_1d(coverage.get_parameter_values(tname, tdoa=slice_))
+        return slice_, cls._time_buckets(times, width)
+
+    @classmethod
+    def _strided_slice(cls, slice_, num_timesteps, max_points):
+        start, stop, step = slice_.indices(num_timesteps)
+        if step < 0:
+            return slice_
+        count = len(xrange(start, stop, step))
+        if count <= max_points:
+            return slice_
+        step *= int(np.ceil(count / float(max_points)))
+        return slice(start, stop, step)
+
+    @classmethod
+    def _point_buckets(cls, num_values, max_points):
+        if num_values <= max_points:
+            return None
+        return np.unique(np.linspace(0, num_values, max_points, endpoint=False).astype(np.int64))
+
+    @classmethod
+    def _time_buckets(cls, times, width):
+        if not times.shape[0]:
+            return None
+        keys = np.floor((times - times[0]) / width)
+        return np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+
+    @classmethod
+    def _time_aggregate(cls, aggregate):
+        '''
+        A decimated record is stamped with the mean time of its bucket for mean,
+        the time of its last record for last and the time of its first record otherwise.
+        '''
+        if aggregate in ('mean', 'last'):
+            return aggregate
+        return 'first'
+
+    @classmethod
+    def _aggregate(cls, values, starts, aggregate, fill_value=None):
+        '''
+        Aggregates each bucket of values (along the first axis), non numeric
+        values are decimated to the first record of each bucket.
+        Fill values and NaNs are left out of min, max and mean, a bucket
+        holding nothing else (or nothing at all) aggregates to fill_value.
+        Without a fill value it aggregates to NaN, integer min and max are
+        then returned as floats.
+        '''
+        if aggregate == 'last':
+            return values[np.append(starts[1:], values.shape[0]) - 1]
+        if aggregate == 'first' or values.dtype.kind not in 'iuf':
+            return values[starts]
+
+        valid = np.ones(values.shape, dtype=bool)
+        if values.dtype.kind == 'f':
+            valid &= ~np.isnan(values)
+        if fill_value is not None:
+            valid &= values != fill_value
+        counts = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        # reduceat gives an empty bucket (a repeated start) the record at its start
+        sizes = np.diff(np.append(starts, values.shape[0]))
+        counts[sizes == 0] = 0
+        empty = fill_value if fill_value is not None else np.nan
+
+        if aggregate in ('min', 'max'):
+            if values.dtype.kind == 'f':
+                limits = (np.inf, -np.inf)
+            else:
+                limits = (np.iinfo(values.dtype).max, np.iinfo(values.dtype).min)
+            if aggregate == 'min':
+                reduced = np.minimum.reduceat(np.where(valid, values, limits[0]), starts, axis=0)
+            else:
+                reduced = np.maximum.reduceat(np.where(valid, values, limits[1]), starts, axis=0)
+            if counts.all():
+                return reduced
+            if fill_value is None and values.dtype.kind != 'f':
+                # NaN can't be cast to an integer
+                return np.where(counts > 0, reduced, np.nan)
+            return np.where(counts > 0, reduced, empty).astype(values.dtype)
+
+        sums = np.add.reduceat(np.where(valid, values, 0).astype(np.float64), starts, axis=0)
+        return np.where(counts > 0, sums / np.maximum(counts, 1), empty)
+
+    @classmethod
+    def map_cov_rdt(cls, coverage, rdt, field, slice_, starts=None, aggregate='mean'):
         log.trace( 'Slice is %s' , slice_)
         try:
             n = coverage.get_parameter_values(field,tdoa=slice_)
@@ -184,7 +382,10 @@ class ReplayProcess(BaseReplayProcess):
                 n = np.append(n,fill_arr)
             elif coverage.get_data_extents(field)[0] > coverage.num_timesteps:
                 raise CorruptionError('The coverage is corrupted:\n\tfield: %s\n\textents: %s\n\ttimesteps: %s' % (field, coverage.get_data_extents(field), coverage.num_timesteps))
-            rdt[field] = np.atleast_1d(n)
+            n = np.atleast_1d(n)
+            if starts is not None:
+                n = cls._aggregate(n, starts, aggregate, coverage.get_parameter_context(field).fill_value)
+            rdt[field] = n
         else:
             rdt[field] = [n]
     
@@ -194,17 +395,15 @@ class ReplayProcess(BaseReplayProcess):
         as a value in lieu of publishing it on a stream
         '''
         try: 
-            coverage = DatasetManagementService._get_coverage(self.dataset_id,mode='r')
-            if coverage.num_timesteps == 0:
-                log.info('Reading from an empty coverage')
-                rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
-            else: 
-                rdt = self._coverage_to_granule(coverage=coverage,start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters,tdoa=self.tdoa)
+            with CoveragePool.coverage(self.dataset_id, mode='r') as coverage:
+                if coverage.num_timesteps == 0:
+                    log.info('Reading from an empty coverage')
+                    rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
+                else: 
+                    rdt = self._coverage_to_granule(coverage=coverage,start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters,tdoa=self.tdoa, max_points=self.max_points, bucket_time=self.bucket_time, aggregate=self.aggregate)
         except:
             log.exception('Problems reading from the coverage')
             raise BadRequest('Problems reading from the coverage')
-        finally:
-            coverage.close(timeout=5)
         return rdt.to_granule()
 
 
@@ -220,11 +419,16 @@ class ReplayProcess(BaseReplayProcess):
 
     def replay(self):
         self.publishing.set() # Minimal state, supposed to prevent two instances of the same process from replaying on the same stream
-        for rdt in self._replay():
-            if self.end.is_set():
-                return
-            self.play.wait()
-            self.output.publish(rdt.to_granule())
+        granules = self._replay()
+        try:
+            for rdt in granules:
+                if self.end.is_set():
+                    return
+                self.play.wait()
+                self.output.publish(rdt.to_granule())
+        finally:
+            # A stopped replay gives the coverage handle back now, not when the generator is collected
+            granules.close()
 
         self.publishing.clear()
         return 
@@ -243,32 +447,29 @@ class ReplayProcess(BaseReplayProcess):
 
     @classmethod
     def get_last_values(cls, dataset_id, number_of_points, delivery_format):
-        coverage = DatasetManagementService._get_coverage(dataset_id,mode='r')
-        if coverage.num_timesteps < number_of_points:
-            if coverage.num_timesteps == 0:
-                rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
-                return rdt.to_granule()
-            number_of_points = coverage.num_timesteps
-        rdt = cls._coverage_to_granule(coverage,tdoa=slice(-number_of_points,None),stream_def_id=delivery_format)
-        coverage.close(timeout=5)
+        with CoveragePool.coverage(dataset_id, mode='r') as coverage:
+            if coverage.num_timesteps < number_of_points:
+                if coverage.num_timesteps == 0:
+                    rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
+                    return rdt.to_granule()
+                number_of_points = coverage.num_timesteps
+            rdt = cls._coverage_to_granule(coverage,tdoa=slice(-number_of_points,None),stream_def_id=delivery_format)
         
         return rdt.to_granule()
 
     def _replay(self):
-        coverage = DatasetManagementService._get_coverage(self.dataset_id,mode='r')
-        rdt = self._coverage_to_granule(coverage=coverage, start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters, stream_def_id=self.stream_def_id)
-        elements = len(rdt)
-        
-        for i in xrange(elements / self.publish_limit):
-            outgoing = RecordDictionaryTool(stream_definition_id=self.stream_def_id)
-            fields = self.parameters or outgoing.fields
-            for field in fields:
-                v = rdt[field]
-                if v is not None:
-                    outgoing[field] = v[(i*self.publish_limit) : ((i+1)*self.publish_limit)]
-            yield outgoing
-        coverage.close(timeout=5)
-        return 
-
-
-
+        '''
+        Generator of the record dictionaries to replay. The pooled coverage
+        handle is released once the generator is exhausted or closed
+        (GeneratorExit), and discarded if reading the coverage fails.
+        '''
+        coverage = CoveragePool.acquire(self.dataset_id, mode='r')
+        discard = False
+        try:
+            for rdt in self._coverage_to_granules(coverage, self.publish_limit, start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters, stream_def_id=self.stream_def_id, tdoa=self.tdoa, max_points=self.max_points, bucket_time=self.bucket_time, aggregate=self.aggregate):
+                yield rdt
+        except Exception:
+            discard = True
+            raise
+        finally:
+            CoveragePool.release(coverage, discard=discard)
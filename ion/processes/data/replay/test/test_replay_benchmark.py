@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/replay/test/test_replay_benchmark.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from nose.plugins.attrib import attr
+
+from ion.processes.data.replay.replay_benchmark import StrideBenchmark
+
+
+@attr('UTIL',group='dm')
+class StrideBenchmarkTest(PyonTestCase):
+    def test_benchmark(self):
+        report = StrideBenchmark(values=86400, stride=60.).run()
+        log.info('\n%s', StrideBenchmark.format_report(report))
+
+        self.assertTrue(report['matches'])
+        self.assertEquals(report['timestamps'], 1440)
+        self.assertEquals(report['vectorized_reads'], 1)
+        self.assertLess(report['vectorized_s'], report['per_timestamp_s'])
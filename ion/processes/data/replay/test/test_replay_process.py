@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/replay/test/test_replay_process.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+from ion.processes.data.replay.replay_process import ReplayProcess
+
+import numpy as np
+import time
+
+
+@attr('UNIT',group='dm')
+class ReplayProcessUnitTest(PyonTestCase):
+    def mock_coverage(self, times):
+        coverage = Mock()
+        coverage.temporal_parameter_name = 'time'
+        coverage.get_parameter_context.return_value.uom = 'seconds'
+        coverage.get_parameter_values.return_value = times
+        return coverage
+
+    def slow_stride_indices(self, coverage, requested):
+        idx_values = [ReplayProcess.get_time_idx(coverage, i) for i in requested]
+        return sorted(set(idx_values))
+
+    def test_time_idxs(self):
+        # Sorted time axis with gaps and duplicate timestamps
+        times = np.cumsum(np.random.randint(0, 4, 2000)).astype(np.float64)
+        coverage = self.mock_coverage(times)
+        requested = np.arange(-10, times[-1] + 10, 0.75)
+
+        fast = [int(i) for i in ReplayProcess.get_time_idxs(coverage, requested)]
+        slow = [int(ReplayProcess.get_time_idx(coverage, i)) for i in requested]
+        self.assertEquals(fast, slow)
+
+        # Unsorted time axis
+        np.random.shuffle(times)
+        fast = [int(i) for i in ReplayProcess.get_time_idxs(coverage, requested)]
+        slow = [int(ReplayProcess.get_time_idx(coverage, i)) for i in requested]
+        self.assertEquals(fast, slow)
+
+    def test_stride_indices(self):
+        times = np.arange(0, 86400, 1.)
+        coverage = self.mock_coverage(times)
+        requested = np.arange(0, 86400, 60.)
+
+        start = time.time()
+        slow = self.slow_stride_indices(coverage, requested)
+        slow_time = time.time() - start
+
+        start = time.time()
+        fast = sorted(set(ReplayProcess.get_time_idxs(coverage, requested)))
+        fast_time = time.time() - start
+
+        self.assertEquals(fast, slow)
+        self.assertEquals(coverage.get_parameter_values.call_count, len(requested) + 1)
+        # Timings are compared by ion/processes/data/replay/replay_benchmark.py
+        log.info('Stride of %s timestamps over %s values: %.4fs per timestamp, %.4fs vectorized', len(requested), len(times), slow_time, fast_time)
+
+    def test_slabs(self):
+        data = np.arange(95)
+        for slice_ in [slice(None), slice(3,None), slice(10,80,3), slice(None,None,-2), slice(90,5,-7), slice(-20,None)]:
+            slabs = list(ReplayProcess._slabs(slice_, data.shape[0], 10))
+            self.assertTrue(all(len(data[slab]) <= 10 for slab in slabs))
+            np.testing.assert_array_equal(np.concatenate([data[slab] for slab in slabs]), data[slice_])
+
+        slabs = list(ReplayProcess._slabs([range(25)], data.shape[0], 10))
+        self.assertEquals(slabs, [[range(10)], [range(10,20)], [range(20,25)]])
+
+    def test_coverage_to_granules(self):
+        coverage = self.mock_coverage(np.arange(25.))
+        coverage.num_timesteps = 25
+        rdts = []
+        def slice_to_rdt(coverage, slice_, parameters=None, stream_def_id=None):
+            rdts.append(slice_)
+            return slice_
+        with patch.object(ReplayProcess, '_slice_to_rdt', Mock(side_effect=slice_to_rdt)):
+            granules = ReplayProcess._coverage_to_granules(coverage, 10, tdoa=slice(0,25))
+            self.assertEquals(rdts, [])
+            granules.next()
+            # Slabs are only read as they're consumed
+            self.assertEquals(rdts, [slice(0,10,1)])
+            list(granules)
+            self.assertEquals(rdts, [slice(0,10,1), slice(10,20,1), slice(20,25,1)])
+
+    def test_replay_releases_coverage(self):
+        replay = ReplayProcess()
+        replay.dataset_id = 'dataset'
+        replay.output = Mock()
+        replay.play.set()
+        rdts = [Mock(), Mock(), Mock()]
+        def coverage_to_granules(*args, **kwargs):
+            for rdt in rdts:
+                yield rdt
+        def publish(granule):
+            if replay.output.publish.call_count == 2:
+                replay.stop()
+        replay.output.publish.side_effect = publish
+
+        with patch('ion.processes.data.replay.replay_process.CoveragePool') as pool, \
+                patch.object(ReplayProcess, '_coverage_to_granules', Mock(side_effect=coverage_to_granules)):
+            replay.replay()
+            # Stopped part way, the handle is given back right away
+            self.assertEquals(replay.output.publish.call_count, 2)
+            pool.release.assert_called_once_with(pool.acquire.return_value, discard=False)
+
+    def test_decimation_buckets(self):
+        starts = ReplayProcess._point_buckets(1000, 7)
+        self.assertEquals(len(starts), 7)
+        self.assertEquals(starts[0], 0)
+        self.assertTrue(ReplayProcess._point_buckets(5, 7) is None)
+
+        times = np.array([0., 1., 9., 10., 11., 25., 29., 30.])
+        np.testing.assert_array_equal(ReplayProcess._time_buckets(times, 10.), [0, 3, 5, 7])
+
+        data = np.arange(1000)
+        for slice_ in [slice(None), slice(10, 900), slice(5, 500, 3)]:
+            strided = ReplayProcess._strided_slice(slice_, data.shape[0], 50)
+            self.assertTrue(len(data[strided]) <= 50)
+            self.assertEquals(data[strided][0], data[slice_][0])
+        self.assertEquals(ReplayProcess._strided_slice(slice(0, 20), 1000, 50), slice(0, 20))
+
+    def test_aggregate(self):
+        values = np.array([3, 1, 2, 8, 5, 4, 7])
+        starts = np.array([0, 3, 5])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'min'), [1, 5, 4])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'max'), [3, 8, 7])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'mean'), [2., 6.5, 5.5])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'first'), [3, 8, 4])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'last'), [2, 5, 7])
+
+        # Multidimensional values are aggregated along the time axis
+        values = np.arange(14.).reshape(7, 2)
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'mean'), [[2., 3.], [7., 8.], [11., 12.]])
+
+        # Fill values and NaNs are skipped, a bucket of fill values aggregates to fill
+        values = np.array([3., -9999., np.nan, -9999., -9999., 4., np.nan])
+        for aggregate, expected in [('min', [3., -9999., 4.]), ('max', [3., -9999., 4.]), ('mean', [3., -9999., 4.])]:
+            np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, aggregate, -9999.), expected)
+        values = np.array([5, -1, 1, -1, -1, 2, 6], dtype=np.int32)
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'min', -1), [1, -1, 2])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'max', -1), [5, -1, 6])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'mean', -1), [3., -1., 4.])
+        self.assertEquals(ReplayProcess._aggregate(values, starts, 'min', -1).dtype, np.int32)
+        np.testing.assert_array_equal(ReplayProcess._aggregate(np.array([np.nan, 1., np.nan]), np.array([0, 1, 2]), 'mean'), [np.nan, 1., np.nan])
+
+        # Empty integer buckets without a fill value are NaN, not NaN cast to an integer
+        ints = np.array([5, 1, 2, 6], dtype=np.int32)
+        buckets = np.array([0, 2])
+        self.assertEquals(ReplayProcess._aggregate(ints, buckets, 'min').dtype, np.int32)
+        np.testing.assert_array_equal(ReplayProcess._aggregate(ints, buckets, 'min'), [1, 2])
+        buckets = np.array([0, 2, 2, 3])
+        for aggregate, expected in [('min', [1., np.nan, 2., 6.]), ('max', [5., np.nan, 2., 6.]), ('mean', [3., np.nan, 2., 6.])]:
+            result = ReplayProcess._aggregate(ints, buckets, aggregate)
+            self.assertEquals(result.dtype.kind, 'f')
+            np.testing.assert_array_equal(result, expected)
+        np.testing.assert_array_equal(ReplayProcess._aggregate(ints, buckets, 'min', -1), [1, -1, 2, 6])
+
+        # Non numeric values take the first record of the bucket
+        values = np.array(['a', 'b', 'c', 'd', 'e', 'f', 'g'])
+        np.testing.assert_array_equal(ReplayProcess._aggregate(values, starts, 'mean'), ['a', 'd', 'f'])
@@ -15,7 +15,7 @@ from pyon.util.memoize import memoize_lru
 from pyon.util.log import log
 from pyon.core.exception import NotFound
 from pyon.ion.event import EventSubscriber
-from ion.util.stored_values import StoredValueManager
+from ion.util.stored_values import CachedStoredValueManager, StoredValueCache
 from pyon.public import OT
 
 from gevent.event import Event
@@ -36,7 +36,7 @@ class TransformPrime(TransformDataProcess):
     def on_start(self):
         TransformDataProcess.on_start(self)
         self.pubsub_management = PubsubManagementServiceProcessClient(process=self)
-        self.stored_values = StoredValueManager(self.container)
+        self.stored_values = CachedStoredValueManager(self.container)
         self.input_data_product_ids = self.CFG.get_safe('process.input_products', [])
         self.output_data_product_ids = self.CFG.get_safe('process.output_products', [])
         self.lookup_docs = self.CFG.get_safe('process.lookup_docs',[])
@@ -48,6 +48,10 @@ class TransformPrime(TransformDataProcess):
         self.lookup_monitor.stop()
         TransformDataProcess.on_quit(self)
 
+    def _stat(self):
+        self._stats['lookup_values'] = StoredValueCache.stats()
+        return self._stats
+
     def _add_lookups(self, event, *args, **kwargs):
         if event.origin in self.input_data_product_ids + self.output_data_product_ids:
             if isinstance(event.reference_keys, list):
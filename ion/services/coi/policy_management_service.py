@@ -14,13 +14,31 @@ from pyon.event.event import EventPublisher
 from pyon.ion.endpoint import ProcessEventSubscriber
 from ion.util.related_resources_crawler import RelatedResourcesCrawler
 
+import collections
+import time
+
 class PolicyManagementService(BasePolicyManagementService):
 
+    # Seconds the active policy rules are cached, they are also discarded when policies or the resources
+    # crawled for related resource policies are modified. 0 disables the cache.
+    POLICY_CACHE_TTL = CFG.get_safe('service.policy_management.policy_cache_ttl', 10)
+
+    # Resources whose access policy rules are cached, the least recently used are discarded first
+    RESOURCE_RULES_CACHE_SIZE = CFG.get_safe('service.policy_management.resource_rules_cache_size', 1024)
+
+    # Types of the resources whose modification can change the active resource access policy rules
+    POLICY_RELATED_TYPES = set([RT.Policy, RT.InstrumentDevice, RT.InstrumentModel, RT.InstrumentSite, RT.PlatformDevice,
+                                RT.PlatformModel, RT.PlatformSite, RT.Subsite, RT.Observatory, RT.Org])
+
     def __init__(self, *args, **kwargs):
         BasePolicyManagementService.__init__(self,*args,**kwargs)
 
         self.event_pub = None  # For unit tests
 
+        self._resource_rules_cache = collections.OrderedDict()  # resource id -> (time, policy rules)
+        self._service_rules_cache = None    # (time, common service policy rules, {service name: policy rules})
+        self._policy_cache_generation = 0
+
 
     def on_start(self):
         self.event_pub = EventPublisher()
@@ -28,6 +46,16 @@ class PolicyManagementService(BasePolicyManagementService):
         self.policy_event_subscriber = ProcessEventSubscriber(event_type="ResourceModifiedEvent", origin_type="Policy", callback=self._policy_event_callback, process=self)
         self._process.add_endpoint(self.policy_event_subscriber)
 
+        # Policies are handled by the policy event subscriber
+        self.resource_event_subscribers = []
+        for origin_type in sorted(self.POLICY_RELATED_TYPES - set([RT.Policy])):
+            resource_event_subscriber = ProcessEventSubscriber(event_type="ResourceModifiedEvent", origin_type=origin_type, callback=self._resource_event_callback, process=self)
+            self._process.add_endpoint(resource_event_subscriber)
+            self.resource_event_subscribers.append(resource_event_subscriber)
+
+        self.resource_policy_event_subscriber = ProcessEventSubscriber(event_type="ResourcePolicyEvent", callback=self._resource_event_callback, process=self)
+        self._process.add_endpoint(self.resource_policy_event_subscriber)
+
     """Provides the interface to define and manage policy and a repository to store and retrieve policy
     and templates for policy definitions, aka attribute authority.
 
@@ -199,6 +227,7 @@ class PolicyManagementService(BasePolicyManagementService):
             raise Inconsistent("Missing the elements in the policy rule to set the description: " + e.message)
 
         policy_id, version = self.clients.resource_registry.create(policy)
+        self._clear_policy_cache()
 
         log.debug('Policy created: ' + policy.name)
 
@@ -223,6 +252,7 @@ class PolicyManagementService(BasePolicyManagementService):
             raise BadRequest("The policy name '%s' can only contain alphanumeric and underscore characters" % policy.name)
 
         self.clients.resource_registry.update(policy)
+        self._clear_policy_cache()
 
     def read_policy(self, policy_id=''):
         """Returns the Policy object for the specified policy id.
@@ -260,6 +290,7 @@ class PolicyManagementService(BasePolicyManagementService):
             self._remove_resource_policy(res, policy)
 
         self.clients.resource_registry.delete(policy_id)
+        self._clear_policy_cache()
 
         #Force a publish since the policy object will have been deleted
         self._publish_policy_event(policy, delete_policy=True)
@@ -346,6 +377,7 @@ class PolicyManagementService(BasePolicyManagementService):
             raise NotFound("Policy %s does not exist" % policy_id)
 
         aid = self.clients.resource_registry.create_association(resource, PRED.hasPolicy, policy)
+        self._clear_policy_cache()
 
         #Publish an event that the resource policy has changed
         if publish_event:
@@ -359,6 +391,7 @@ class PolicyManagementService(BasePolicyManagementService):
             raise NotFound("The association between the specified Resource %s and Policy %s was not found" % (resource._id, policy._id))
 
         self.clients.resource_registry.delete_association(aid)
+        self._clear_policy_cache()
 
         #Publish an event that the resource policy has changed
         self._publish_resource_policy_event(policy, resource)
@@ -373,6 +406,8 @@ class PolicyManagementService(BasePolicyManagementService):
         policy_id = policy_event.origin
         log.debug("Policy modified: %s" ,  str(policy_event.__dict__))
 
+        self._clear_policy_cache()
+
         try:
             policy = self.clients.resource_registry.read(policy_id)
             if policy:
@@ -384,6 +419,27 @@ class PolicyManagementService(BasePolicyManagementService):
             if policy_event.sub_type != 'DELETE':
                 log.error(e)
 
+    def _resource_event_callback(self, *args, **kwargs):
+        """
+        This method is a callback function for receiving resource and resource policy events, the cached
+        policy rules are discarded when a resource they can depend on is modified.
+        """
+        event = args[0]
+        if event.type_ == OT.ResourcePolicyEvent or event.origin_type in self.POLICY_RELATED_TYPES or \
+                event.origin in self._resource_rules_cache:
+            self._clear_policy_cache()
+
+    def _clear_policy_cache(self):
+        self._resource_rules_cache = collections.OrderedDict()
+        self._service_rules_cache = None
+        self._policy_cache_generation += 1
+
+        # The crawler snapshots hold the associations of the related resources
+        RelatedResourcesCrawler.clear_snapshots()
+
+    def _is_policy_cache_fresh(self, cached_time):
+        return time.time() - cached_time < self.POLICY_CACHE_TTL
+
     def _publish_policy_event(self, policy, delete_policy=False):
 
         if policy.policy_type.type_ == OT.CommonServiceAccessPolicy:
@@ -516,6 +572,26 @@ class PolicyManagementService(BasePolicyManagementService):
         if not resource:
             raise NotFound("Resource %s does not exist" % resource_id)
 
+        cached_time, rules = self._resource_rules_cache.pop(resource_id, (None, None))
+        if cached_time is not None and self._is_policy_cache_fresh(cached_time):
+            self._resource_rules_cache[resource_id] = (cached_time, rules)
+            return rules
+
+        generation = self._policy_cache_generation
+        cached_time = time.time()
+        rules = self._get_resource_access_policy_rules(resource)
+
+        # Rules are only kept if no policy or related resource was modified while they were gathered
+        if self.POLICY_CACHE_TTL > 0 and generation == self._policy_cache_generation:
+            self._resource_rules_cache[resource_id] = (cached_time, rules)
+            while len(self._resource_rules_cache) > self.RESOURCE_RULES_CACHE_SIZE:
+                self._resource_rules_cache.popitem(last=False)
+
+        return rules
+
+    def _get_resource_access_policy_rules(self, resource):
+        resource_id = resource._id
+
         rules = ""
 
         resource_id_list = self._get_related_resource_ids(resource)
@@ -566,7 +642,7 @@ class PolicyManagementService(BasePolicyManagementService):
         """
         resource_types = resource_types if resource_types is not None else []
         predicate_set = predicate_set if predicate_set is not None else {}
-        r = RelatedResourcesCrawler()
+        r = RelatedResourcesCrawler(snapshot_max_age=self.POLICY_CACHE_TTL)
         test_real_fn = r.generate_get_related_resources_fn(self.clients.resource_registry, resource_whitelist=resource_types, predicate_dictionary=predicate_set)
         related_objs = test_real_fn(resource_id)
 
@@ -588,20 +664,39 @@ class PolicyManagementService(BasePolicyManagementService):
         """
         #TODO - extend to handle Org specific service policies at some point.
 
-        rules = ""
+        if self._service_rules_cache is not None and self._is_policy_cache_fresh(self._service_rules_cache[0]):
+            _, common_rules, service_rules = self._service_rules_cache
+        else:
+            generation = self._policy_cache_generation
+            cached_time = time.time()
+            common_rules, service_rules = self._get_service_access_policy_rules()
+
+            if self.POLICY_CACHE_TTL > 0 and generation == self._policy_cache_generation:
+                self._service_rules_cache = (cached_time, common_rules, service_rules)
+
         if not service_name:
-            policy_set,_ = self.clients.resource_registry.find_resources_ext(restype=RT.Policy, nested_type=OT.CommonServiceAccessPolicy)
-            for p in policy_set:
-                if p.enabled:
-                    rules += p.policy_type.policy_rule
+            return common_rules
+        return service_rules.get(service_name, "")
 
-        else:
-            policy_set,_ = self.clients.resource_registry.find_resources_ext(restype=RT.Policy, nested_type=OT.ServiceAccessPolicy)
-            for p in policy_set:
-                if p.enabled and p.policy_type.service_name == service_name:
-                    rules += p.policy_type.policy_rule
+    def _get_service_access_policy_rules(self):
+        """
+        Returns the rules of the enabled common service access policies and a dict of the rules of the
+        enabled service access policies by service name
+        """
+        common_rules = ""
+        policy_set,_ = self.clients.resource_registry.find_resources_ext(restype=RT.Policy, nested_type=OT.CommonServiceAccessPolicy)
+        for p in policy_set:
+            if p.enabled:
+                common_rules += p.policy_type.policy_rule
 
-        return rules
+        service_rules = {}
+        policy_set,_ = self.clients.resource_registry.find_resources_ext(restype=RT.Policy, nested_type=OT.ServiceAccessPolicy)
+        for p in policy_set:
+            if p.enabled:
+                service_name = p.policy_type.service_name
+                service_rules[service_name] = service_rules.get(service_name, "") + p.policy_type.policy_rule
+
+        return common_rules, service_rules
 
     def get_active_process_operation_preconditions(self, process_name='', op='', org_name=''):
         """Generates the set of all enabled precondition policies for the specified process operation within the specified
@@ -114,6 +114,88 @@ class TestPolicyManagementService(PyonTestCase):
         self.assertEqual(ex.message, 'Policy bad does not exist')
         self.mock_read.assert_called_once_with('bad', '')
 
+    def test_resource_access_policy_rules_cache(self):
+        self.resource.type_ = RT.DataProduct
+        self.mock_read.return_value = self.resource
+        self.policy.enabled = True
+        self.policy.policy_type.type_ = OT.ResourceAccessPolicy
+        self.policy.policy_type.policy_rule = '<Rule/>'
+        self.mock_find_objects.return_value = ([self.policy], [])
+        self.policy_management_service._crawl_related_resources = Mock(return_value=['123'])
+
+        for i in range(2):
+            rules = self.policy_management_service.get_active_resource_access_policy_rules('123')
+            self.assertEqual(rules, '<Rule/>')
+        self.assertEqual(self.mock_find_objects.call_count, 1)
+        self.assertEqual(self.mock_read.call_count, 2)
+
+        # Modifications of resources the rules can't depend on keep them
+        self.policy_management_service._resource_event_callback(Mock(type_=OT.ResourceModifiedEvent, origin='456', origin_type=RT.DataProduct))
+        self.policy_management_service.get_active_resource_access_policy_rules('123')
+        self.assertEqual(self.mock_find_objects.call_count, 1)
+
+        for event in [Mock(type_=OT.ResourceModifiedEvent, origin='123', origin_type=RT.DataProduct),
+                      Mock(type_=OT.ResourceModifiedEvent, origin='456', origin_type=RT.InstrumentDevice),
+                      Mock(type_=OT.ResourcePolicyEvent, origin='111', origin_type='Resource_Policy')]:
+            self.policy_management_service._resource_event_callback(event)
+            self.policy_management_service.get_active_resource_access_policy_rules('123')
+        self.assertEqual(self.mock_find_objects.call_count, 4)
+
+        # The policy is disabled
+        self.policy.enabled = False
+        self.policy_management_service.update_policy(self.policy)
+        rules = self.policy_management_service.get_active_resource_access_policy_rules('123')
+        self.assertEqual(rules, '')
+
+    def test_resource_access_policy_rules_lru(self):
+        self.resource.type_ = RT.DataProduct
+        self.mock_read.return_value = self.resource
+        self.mock_find_objects.return_value = ([], [])
+        self.policy_management_service._crawl_related_resources = Mock(return_value=[])
+
+        with patch.object(PolicyManagementService, 'RESOURCE_RULES_CACHE_SIZE', 2):
+            for resource_id in ['1', '2', '1', '3']:
+                self.policy_management_service.get_active_resource_access_policy_rules(resource_id)
+        # '1' was used after '2', '2' is discarded
+        self.assertEqual(self.policy_management_service._resource_rules_cache.keys(), ['1', '3'])
+        self.assertEqual(self.mock_find_objects.call_count, 3)
+
+    @patch('ion.services.coi.policy_management_service.EventPublisher')
+    @patch('ion.services.coi.policy_management_service.ProcessEventSubscriber')
+    def test_resource_event_subscriptions(self, mock_subscriber, mock_publisher):
+        self.policy_management_service._process = Mock()
+        self.policy_management_service.on_start()
+
+        origin_types = [kwargs.get('origin_type') for args, kwargs in mock_subscriber.call_args_list
+                        if kwargs['event_type'] == 'ResourceModifiedEvent']
+        # Only the modifications of the resources policy rules can depend on are received
+        self.assertEqual(sorted(origin_types), sorted(PolicyManagementService.POLICY_RELATED_TYPES))
+        self.assertEqual(self.policy_management_service._process.add_endpoint.call_count, mock_subscriber.call_count)
+
+    def test_service_access_policy_rules_cache(self):
+        def policy(service_name, rule, enabled=True):
+            return Mock(enabled=enabled, policy_type=Mock(service_name=service_name, policy_rule=rule))
+        policies = {OT.CommonServiceAccessPolicy : [policy('', '<Common/>')],
+                    OT.ServiceAccessPolicy       : [policy('a', '<A1/>'), policy('b', '<B/>'), policy('a', '<A2/>'), policy('a', '<A3/>', False)]}
+        mock_find_resources_ext = self.policy_management_service.clients.resource_registry.find_resources_ext
+        mock_find_resources_ext.side_effect = lambda restype, nested_type: (policies[nested_type], [])
+
+        self.assertEqual(self.policy_management_service.get_active_service_access_policy_rules(), '<Common/>')
+        self.assertEqual(self.policy_management_service.get_active_service_access_policy_rules('a'), '<A1/><A2/>')
+        self.assertEqual(self.policy_management_service.get_active_service_access_policy_rules('b'), '<B/>')
+        self.assertEqual(self.policy_management_service.get_active_service_access_policy_rules('c'), '')
+        self.assertEqual(mock_find_resources_ext.call_count, 2)
+
+        policies[OT.ServiceAccessPolicy].append(policy('c', '<C/>'))
+        self.mock_read.return_value = None
+        self.policy_management_service._policy_event_callback(Mock(origin='111'))
+        self.assertEqual(self.policy_management_service.get_active_service_access_policy_rules('c'), '<C/>')
+        self.assertEqual(mock_find_resources_ext.call_count, 4)
+
+        with patch.object(PolicyManagementService, 'POLICY_CACHE_TTL', 0):
+            self.policy_management_service.get_active_service_access_policy_rules('c')
+            self.policy_management_service.get_active_service_access_policy_rules('c')
+        self.assertEqual(mock_find_resources_ext.call_count, 8)
 
     def test_create_user_role(self):
         self.mock_create.return_value = ['123', 1]
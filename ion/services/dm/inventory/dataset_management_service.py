@@ -15,6 +15,8 @@ from pyon.util.log import log
 
 from ion.services.dm.utility.granule_utils import SimplexCoverage, ParameterDictionary, GridDomain, ParameterContext
 from ion.util.time_utils import TimeUtils
+from ion.util.time_index import TimeIndex
+from ion.services.dm.utility.coverage_pool import CoveragePool
 
 from interface.objects import ParameterContext as ParameterContextResource, ParameterDictionary as ParameterDictionaryResource, ParameterFunction as ParameterFunctionResource
 from interface.objects import Dataset
@@ -140,16 +142,16 @@ class DatasetManagementService(BaseDatasetManagementService):
 #--------
 
     def get_dataset_info(self,dataset_id=''):
-        coverage = self._get_coverage(dataset_id)
-        return coverage.info
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.info
 
     def get_dataset_parameters(self, dataset_id=''):
-        coverage = self._get_coverage(dataset_id)
-        return coverage.parameter_dictionary.dump()
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.parameter_dictionary.dump()
 
     def get_dataset_length(self, dataset_id=''):
-        coverage = self._get_coverage(dataset_id)
-        return coverage.num_timesteps
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.num_timesteps
 
 #--------
 
@@ -312,62 +314,64 @@ class DatasetManagementService(BaseDatasetManagementService):
     def dataset_bounds(self, dataset_id='', parameters=None):
         self.read_dataset(dataset_id) # Validates proper dataset
         parameters = parameters or None
-        coverage = self._get_coverage(dataset_id)
-        if not coverage.num_timesteps:
-            if isinstance(parameters,list):
-                return {i:(coverage.get_parameter_context(i).fill_value,coverage.get_parameter_context(i).fill_value) for i in parameters}
-            elif not parameters: 
-                return {i:(coverage.get_parameter_context(i).fill_value,coverage.get_parameter_context(i).fill_value) for i in coverage.list_parameters()}
-            else:
-                return (coverage.get_parameter_context(parameters).fill_value, coverage.get_parameter_context(parameters).fill_value)
-        return coverage.get_data_bounds(parameters)
+        with CoveragePool.coverage(dataset_id) as coverage:
+            if not coverage.num_timesteps:
+                if isinstance(parameters,list):
+                    return {i:(coverage.get_parameter_context(i).fill_value,coverage.get_parameter_context(i).fill_value) for i in parameters}
+                elif not parameters: 
+                    return {i:(coverage.get_parameter_context(i).fill_value,coverage.get_parameter_context(i).fill_value) for i in coverage.list_parameters()}
+                else:
+                    return (coverage.get_parameter_context(parameters).fill_value, coverage.get_parameter_context(parameters).fill_value)
+            return coverage.get_data_bounds(parameters)
 
     def dataset_bounds_by_axis(self, dataset_id='', axis=None):
         self.read_dataset(dataset_id) # Validates proper dataset
         axis = axis or None
-        coverage = self._get_coverage(dataset_id)
-        if not coverage.num_timesteps:
-            temporal = coverage.temporal_parameter_name
-            if isinstance(axis,list):
-                return {temporal:(coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)}
-            elif not axis:
-                return {temporal:(coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)}
-            else:
-                return (coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)
-        return coverage.get_data_bounds_by_axis(axis)
+        with CoveragePool.coverage(dataset_id) as coverage:
+            if not coverage.num_timesteps:
+                temporal = coverage.temporal_parameter_name
+                if isinstance(axis,list):
+                    return {temporal:(coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)}
+                elif not axis:
+                    return {temporal:(coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)}
+                else:
+                    return (coverage.get_parameter_context(temporal).fill_value, coverage.get_parameter_context(temporal).fill_value)
+            return coverage.get_data_bounds_by_axis(axis)
 
     def dataset_temporal_bounds(self, dataset_id):
-        coverage = self._get_coverage(dataset_id)
-        temporal_param = coverage.temporal_parameter_name
-        try:
-            bounds = coverage.get_data_bounds(temporal_param)
-        except ValueError:
-            return (coverage.get_parameter_context(temporal_param).fill_value,) * 2
-        uom = coverage.get_parameter_context(temporal_param).uom
+        with CoveragePool.coverage(dataset_id) as coverage:
+            temporal_param = coverage.temporal_parameter_name
+            try:
+                index = TimeIndex.for_coverage(coverage)
+                if index is not None:
+                    bounds = index.bounds()
+                else:
+                    bounds = coverage.get_data_bounds(temporal_param)
+            except ValueError:
+                return (coverage.get_parameter_context(temporal_param).fill_value,) * 2
+            uom = coverage.get_parameter_context(temporal_param).uom
         new_bounds = (TimeUtils.units_to_ts(uom,bounds[0]), TimeUtils.units_to_ts(uom,bounds[1]))
         return new_bounds
 
     def dataset_extents(self, dataset_id='', parameters=None):
         self.read_dataset(dataset_id)
         parameters = parameters or None
-        coverage = DatasetManagementService._get_coverage(dataset_id)
-        extents = coverage.get_data_extents(parameters)
-        coverage.close()
-        return extents
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.get_data_extents(parameters)
 
     def dataset_extents_by_axis(self, dataset_id='', axis=None):
         self.read_dataset(dataset_id) 
         axis = axis or None
-        coverage = self._get_coverage(dataset_id)
-        return coverage.get_data_extents_by_axis(axis)
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.get_data_extents_by_axis(axis)
 
     def dataset_size(self,dataset_id='', parameters=None, slice_=None, in_bytes=False):
         self.read_dataset(dataset_id) 
         parameters = parameters or None
         slice_     = slice_ if isinstance(slice_, slice) else None
 
-        coverage = self._get_coverage(dataset_id)
-        return coverage.get_data_size(parameters, slice_, in_bytes)
+        with CoveragePool.coverage(dataset_id) as coverage:
+            return coverage.get_data_size(parameters, slice_, in_bytes)
 
 #--------
 
@@ -10,30 +10,46 @@ from interface.objects import View, Catalog, ElasticSearchIndex
 from interface.services.dm.idiscovery_service import BaseDiscoveryService
 from pyon.util.containers import DotDict, get_safe
 from pyon.util.arg_check import validate_true, validate_is_instance
-from pyon.public import PRED, CFG, RT, log
+from pyon.public import PRED, CFG, RT, OT, log
 from pyon.core.exception import BadRequest
 from pyon.event.event import EventPublisher
+from pyon.ion.endpoint import ProcessEventSubscriber
 from pyon.core.bootstrap import get_obj_registry, get_sys_name
 from pyon.core.object import IonObjectDeserializer
 from ion.services.dm.inventory.index_management_service import IndexManagementService
 from ion.processes.bootstrap.index_bootstrap import STD_INDEXES
-from collections import deque
 from ion.services.dm.utility.query_language import QueryLanguage
 
+from contextlib import contextmanager
+import collections
+import copy
 import dateutil.parser
 import calendar
 import time
 import elasticpy as ep
+import gevent.pool
 import heapq
 
 
 class DiscoveryService(BaseDiscoveryService):
     SEARCH_BUFFER_SIZE=CFG.get_safe('service.discovery.search_buffer_size', 1048576)
+    FAN_OUT_SIZE=CFG.get_safe('service.discovery.fan_out_size', 8)
+    ES_POOL_SIZE=CFG.get_safe('service.discovery.es_pool_size', 8)
+    RESULT_CACHE_SIZE=CFG.get_safe('service.discovery.result_cache_size', 128)
+    # The index may lag behind the resource events, results are only kept this many seconds
+    RESULT_CACHE_MAX_AGE=CFG.get_safe('service.discovery.result_cache_max_age', 10)
+
+    _es_clients = {} # (host, port) -> idle ElasticSearch clients
 
     """
     class docstring
     """
 
+    def __init__(self, *args, **kwargs):
+        BaseDiscoveryService.__init__(self, *args, **kwargs)
+        self._result_cache = collections.OrderedDict() # request key -> (resource types, result, expiry time)
+        self._result_stats = collections.Counter()
+
     def on_start(self): # pragma no cover
         super(DiscoveryService,self).on_start()
 
@@ -45,6 +61,11 @@ class DiscoveryService(BaseDiscoveryService):
         self.ep = EventPublisher(event_type = 'SearchBufferExceededEvent')
         self.heuristic_cutoff = 4
 
+        # Cached results are discarded when resources of the types they can contain change
+        for event_type in (OT.ResourceModifiedEvent, OT.ResourceLifecycleEvent):
+            subscriber = ProcessEventSubscriber(event_type=event_type, callback=self._resource_event, process=self)
+            self._process.add_endpoint(subscriber)
+
     
    
     @staticmethod
@@ -190,120 +211,69 @@ class DiscoveryService(BaseDiscoveryService):
 #
 #        return db.query_view(view_name,opts=opts)
 
-    def traverse(self, resource_id=''):
-        """Breadth-first traversal of the association graph for a specified resource.
-
-        @param resource_id    str
-        @retval resources    list
-        """
-        
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_objects_mult(subjects=resource_ids,id_only=True)[0]
-            
-        visited_resources = deque(edges([resource_id]))
-        traversal_queue = deque()
-        done = False
-        t = None
-        while not done:
-            t = traversal_queue or deque(visited_resources)
-            traversal_queue = deque()
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    traversal_queue.append(e)
-            if not len(traversal_queue): done = True
+    def _objects(self, resource_ids):
+        return self.clients.resource_registry.find_objects_mult(subjects=resource_ids,id_only=True)[0]
 
+    def _subjects(self, resource_ids):
+        return self.clients.resource_registry.find_subjects_mult(objects=resource_ids,id_only=True)[0]
 
+    def _traverse(self, resource_id, edges, depth=None):
+        '''
+        Breadth-first traversal of the association graph, returns the resources
+        in the order they are first reached.
 
-        return list(visited_resources)
+        edges is called once per level with every resource of the level.
+        depth is the number of levels traversed beyond the resource's own
+        associations, None for no limit.
+        '''
+        visited_resources = list(edges([resource_id]))
+        visited = set()
+        level = [] # Resources of the current level, in order, without duplicates
+        for resource in visited_resources:
+            if resource not in visited:
+                visited.add(resource)
+                level.append(resource)
+        while level and (depth is None or depth > 0):
+            gathered = []
+            for e in edges(level):
+                if e not in visited:
+                    visited.add(e)
+                    visited_resources.append(e)
+                    gathered.append(e)
+            level = gathered
+            if depth is not None:
+                depth -= 1
+        return visited_resources
 
-    def reverse_traverse(self, resource_id=''):
+    def traverse(self, resource_id='', depth=None):
         """Breadth-first traversal of the association graph for a specified resource.
 
         @param resource_id    str
+        @param depth    int    Levels traversed beyond the resource's associations, None for no limit
         @retval resources    list
         """
-        
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids,list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_subjects_mult(objects=resource_ids,id_only=True)[0]
-            
-        visited_resources = deque(edges([resource_id]))
-        traversal_queue = deque()
-        done = False
-        t = None
-        while not done:
-            t = traversal_queue or deque(visited_resources)
-            traversal_queue = deque()
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    traversal_queue.append(e)
-            if not len(traversal_queue): done = True
-
+        return self._traverse(resource_id, self._objects, depth)
 
+    def reverse_traverse(self, resource_id='', depth=None):
+        """Breadth-first traversal of the association graph for a specified resource.
 
-        return list(visited_resources)
-    
+        @param resource_id    str
+        @param depth    int    Levels traversed beyond the resource's associations, None for no limit
+        @retval resources    list
+        """
+        return self._traverse(resource_id, self._subjects, depth)
 
     def iterative_traverse(self, resource_id='', limit=-1):
         '''
         Iterative breadth first traversal of the resource associations
         '''
-        #--------------------------------------------------------------------------------
-        # Retrieve edges for this resource
-        #--------------------------------------------------------------------------------
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_objects_mult(subjects=resource_ids,id_only=True)[0]
-            
-        gathered = deque()
-        visited_resources = deque(edges([resource_id]))
-        while limit>0:
-            t = gathered or deque(visited_resources)
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    gathered.append(e)
-            if not len(gathered): break
-
-            t = deque(gathered)
-            gathered = deque()
-            limit -= 1
-
-        return list(visited_resources)
+        return self._traverse(resource_id, self._objects, max(limit, 0))
 
     def iterative_reverse_traverse(self, resource_id='', limit=-1):
         '''
         Iterative breadth first traversal of the resource associations
         '''
-        #--------------------------------------------------------------------------------
-        # Retrieve edges for this resource
-        #--------------------------------------------------------------------------------
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_subjects_mult(objects=resource_ids,id_only=True)[0]
-            
-        gathered = deque()
-        visited_resources = deque(edges([resource_id]))
-        while limit>0:
-            t = gathered or deque(visited_resources)
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    gathered.append(e)
-            if not len(gathered): break
-
-            t = deque(gathered)
-            gathered = deque()
-            limit -= 1
-
-        return list(visited_resources)
+        return self._traverse(resource_id, self._subjects, max(limit, 0))
 
 
             
@@ -573,29 +543,56 @@ class DiscoveryService(BaseDiscoveryService):
         #@todo: query for couch
         raise BadRequest('improper query: %s' % query)
 
+    @contextmanager
+    def _es_client(self):
+        '''
+        Lends an ElasticSearch client from the process wide pool. A client holds
+        the sort, size, offset and filter of its next search so it is only used
+        by one query at a time.
+        '''
+        idle = self._es_clients.setdefault((self.elasticsearch_host, self.elasticsearch_port), [])
+        if idle:
+            es = idle.pop()
+            es.params = None # Same state as a new client
+        else:
+            es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
+        yield es
+        # Clients are not given back after an error
+        if len(idle) < self.ES_POOL_SIZE:
+            idle.append(es)
+
+    @classmethod
+    def _clear_es_clients(cls):
+        cls._es_clients.clear()
+
+    def _fan_out(self, cb, sources, *args, **kwargs):
+        '''
+        Calls the callback for each source concurrently, the results are in the order of the sources
+        '''
+        if len(sources) < 2:
+            return [cb(source, *args, **kwargs) for source in sources]
+        pool = gevent.pool.Pool(self.FAN_OUT_SIZE)
+        return pool.map(lambda source: cb(source, *args, **kwargs), sources)
+
     def _multi(self, cb,source, *args, **kwargs):
         '''
         Manage the different collections of indexes for queries, views, catalogs
-        Expand the resource into it's components and call the callback for each subcategory
+        Expand the resource into it's components and call the callback for each subcategory,
+        the subcategories are queried concurrently.
         '''
         if isinstance(source, View):
-            catalogs = self.list_catalogs(source._id)
-            result_queue = list()
-            for catalog in catalogs:
-                result_queue.extend(cb(catalog, *args, **kwargs))
-            if kwargs.has_key('limit') and kwargs['limit']:
-                return result_queue[:kwargs['limit']]
-            return result_queue
-
-        if isinstance(source, Catalog):
-            indexes = self.clients.catalog_management.list_indexes(source._id, id_only=True)
-            result_queue = list()
-            for index in indexes:
-                result_queue.extend(cb(index, *args, **kwargs))
-            if kwargs.has_key('limit') and kwargs['limit']:
-                return result_queue[:kwargs['limit']]
-            return result_queue
-        return None
+            sources = self.list_catalogs(source._id)
+        elif isinstance(source, Catalog):
+            sources = self.clients.catalog_management.list_indexes(source._id, id_only=True)
+        else:
+            return None
+
+        result_queue = list()
+        for results in self._fan_out(cb, list(sources), *args, **kwargs):
+            result_queue.extend(results)
+        if kwargs.has_key('limit') and kwargs['limit']:
+            return result_queue[:kwargs['limit']]
+        return result_queue
 
     def query_term(self, source_id='', field='', value='', fuzzy=False, match=False, order=None, limit=0, offset=0, id_only=False):
         '''
@@ -610,7 +607,6 @@ class DiscoveryService(BaseDiscoveryService):
         validate_true(value, 'Unspecified value')
 
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
 
@@ -622,37 +618,38 @@ class DiscoveryService(BaseDiscoveryService):
             return iterate
 
 
-        index = source
-        validate_is_instance(index, ElasticSearchIndex, '%s does not refer to a valid index.' % index)
-        if order: 
-            validate_is_instance(order,dict, 'Order is incorrect.')
-            es.sort(**order)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index, ElasticSearchIndex, '%s does not refer to a valid index.' % index)
+            if order: 
+                validate_is_instance(order,dict, 'Order is incorrect.')
+                es.sort(**order)
 
-        if limit:
-            es.size(limit)
+            if limit:
+                es.size(limit)
 
-        if offset:
-            es.from_offset(offset)
+            if offset:
+                es.from_offset(offset)
 
-        if field == '*':
-            field = '_all'
+            if field == '*':
+                field = '_all'
 
-        if fuzzy:
-            query = ep.ElasticQuery.fuzzy_like_this(value, fields=[field])
-        elif match:
-            match_query = ep.ElasticQuery.match(field=field,query=value)
-            query = {"match_phrase_prefix":match_query['match']}
+            if fuzzy:
+                query = ep.ElasticQuery.fuzzy_like_this(value, fields=[field])
+            elif match:
+                match_query = ep.ElasticQuery.match(field=field,query=value)
+                query = {"match_phrase_prefix":match_query['match']}
             
-        elif '*' in value:
-            query = ep.ElasticQuery.wildcard(field=field, value=value)
-        else:
-            query = ep.ElasticQuery.field(field=field, query=value)
+            elif '*' in value:
+                query = ep.ElasticQuery.wildcard(field=field, value=value)
+            else:
+                query = ep.ElasticQuery.field(field=field, query=value)
 
-        response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
+            response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
 
-        IndexManagementService._check_response(response)
+            IndexManagementService._check_response(response)
 
-        return self._results_from_response(response, id_only)
+            return self._results_from_response(response, id_only)
 
     def query_range(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
         
@@ -665,7 +662,6 @@ class DiscoveryService(BaseDiscoveryService):
             validate_true(isinstance(to_value,int) or isinstance(to_value,float), 'to_value is not a valid number')
         validate_true(source_id, 'source_id not specified')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
 
         source = self.clients.resource_registry.read(source_id)
@@ -677,28 +673,29 @@ class DiscoveryService(BaseDiscoveryService):
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
-        if order:
-            validate_is_instance(order,dict,'Order is incorrect.')
-            es.sort(**order)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
+            if order:
+                validate_is_instance(order,dict,'Order is incorrect.')
+                es.sort(**order)
 
-        if limit:
-            es.size(limit)
+            if limit:
+                es.size(limit)
 
-        if field == '*':
-            field = '_all'
+            if field == '*':
+                field = '_all'
 
-        query = ep.ElasticQuery.range(
-            field      = field,
-            from_value = from_value,
-            to_value   = to_value
-        )
-        response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
+            query = ep.ElasticQuery.range(
+                field      = field,
+                from_value = from_value,
+                to_value   = to_value
+            )
+            response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
 
-        IndexManagementService._check_response(response)
+            IndexManagementService._check_response(response)
 
-        return self._results_from_response(response, id_only)
+            return self._results_from_response(response, id_only)
 
     def query_time(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
         if not self.use_es:
@@ -710,7 +707,6 @@ class DiscoveryService(BaseDiscoveryService):
         if to_value is not None:
             validate_is_instance(to_value,basestring,'"To" is not a valid string')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
 
@@ -721,35 +717,36 @@ class DiscoveryService(BaseDiscoveryService):
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
-        if order:
-            validate_is_instance(order,dict,'Order is incorrect.')
-            es.sort(**order)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
+            if order:
+                validate_is_instance(order,dict,'Order is incorrect.')
+                es.sort(**order)
 
-        if limit:
-            es.size(limit)
+            if limit:
+                es.size(limit)
 
-        if field == '*':
-            field = '_all'
+            if field == '*':
+                field = '_all'
 
-        if from_value is not None:
-            from_value = calendar.timegm(dateutil.parser.parse(from_value).timetuple()) * 1000
+            if from_value is not None:
+                from_value = calendar.timegm(dateutil.parser.parse(from_value).timetuple()) * 1000
 
-        if to_value is not None:
-            to_value = calendar.timegm(dateutil.parser.parse(to_value).timetuple()) * 1000
+            if to_value is not None:
+                to_value = calendar.timegm(dateutil.parser.parse(to_value).timetuple()) * 1000
 
-        query = ep.ElasticQuery.range(
-            field      = field,
-            from_value = from_value,
-            to_value   = to_value
-        )
+            query = ep.ElasticQuery.range(
+                field      = field,
+                from_value = from_value,
+                to_value   = to_value
+            )
 
-        response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
+            response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
 
-        IndexManagementService._check_response(response)
+            IndexManagementService._check_response(response)
 
-        return self._results_from_response(response, id_only)
+            return self._results_from_response(response, id_only)
 
 
     def query_time_bounds(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
@@ -759,7 +756,6 @@ class DiscoveryService(BaseDiscoveryService):
         if to_value is not None:
             validate_is_instance(to_value,basestring,'"To" is not a valid string')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
 
@@ -770,82 +766,83 @@ class DiscoveryService(BaseDiscoveryService):
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
-        if order:
-            validate_is_instance(order,dict,'Order is incorrect.')
-            es.sort(**order)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
+            if order:
+                validate_is_instance(order,dict,'Order is incorrect.')
+                es.sort(**order)
 
-        if field == '*':
-            field = '_all'
-            start_time = 'start_datetime'
-            end_time = 'end_datetime'
-        else:
-            start_time = '%s.start_datetime' % field
-            end_time = '%s.end_datetime' % field
+            if field == '*':
+                field = '_all'
+                start_time = 'start_datetime'
+                end_time = 'end_datetime'
+            else:
+                start_time = '%s.start_datetime' % field
+                end_time = '%s.end_datetime' % field
 
 
 
-        if from_value is not None:
-            from_value = calendar.timegm(dateutil.parser.parse(from_value).timetuple()) * 1000
+            if from_value is not None:
+                from_value = calendar.timegm(dateutil.parser.parse(from_value).timetuple()) * 1000
 
-        if to_value is not None:
-            to_value = calendar.timegm(dateutil.parser.parse(to_value).timetuple()) * 1000
-
-        query = {
-          "query": {
-            "match_all": {}
-          },
-          "filter": {
-            "and": [
-              {
-                "or": [
-                  {
-                    "range": {
-                      start_time: {
-                        "gte": from_value
-                      }
-                    }
-                  },
-                  {
-                    "range": {
-                      end_time: {
-                        "gte": from_value
-                      }
-                    }
-                  }
-                ]
+            if to_value is not None:
+                to_value = calendar.timegm(dateutil.parser.parse(to_value).timetuple()) * 1000
+
+            query = {
+              "query": {
+                "match_all": {}
               },
-              {
-                "or": [
+              "filter": {
+                "and": [
                   {
-                    "range": {
-                      start_time: {
-                        "lte": to_value
+                    "or": [
+                      {
+                        "range": {
+                          start_time: {
+                            "gte": from_value
+                          }
+                        }
+                      },
+                      {
+                        "range": {
+                          end_time: {
+                            "gte": from_value
+                          }
+                        }
                       }
-                    }
+                    ]
                   },
                   {
-                    "range": {
-                      end_time: {
-                        "lte": to_value
+                    "or": [
+                      {
+                        "range": {
+                          start_time: {
+                            "lte": to_value
+                          }
+                        }
+                      },
+                      {
+                        "range": {
+                          end_time: {
+                            "lte": to_value
+                          }
+                        }
                       }
-                    }
+                    ]
                   }
                 ]
               }
-            ]
-          }
-        }
-        if limit:
-            query['size'] = limit
-        if offset:
-            query['from'] = offset
+            }
+            if limit:
+                query['size'] = limit
+            if offset:
+                query['from'] = offset
 
         
-        response = IndexManagementService._es_call(es.raw_query,'%s/_search' % index.index_name,method='POST', data=query, host=self.elasticsearch_host, port=self.elasticsearch_port)
-        IndexManagementService._check_response(response)
-        return self._results_from_response(response, id_only)
+            response = IndexManagementService._es_call(es.raw_query,'%s/_search' % index.index_name,method='POST', data=query, host=self.elasticsearch_host, port=self.elasticsearch_port)
+            IndexManagementService._check_response(response)
+            return self._results_from_response(response, id_only)
  
 
     def query_vertical_bounds(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
@@ -855,7 +852,6 @@ class DiscoveryService(BaseDiscoveryService):
         if to_value is not None:
             validate_is_instance(to_value,float,'"To" is not a valid float')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
 
@@ -866,76 +862,77 @@ class DiscoveryService(BaseDiscoveryService):
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
-        if order:
-            validate_is_instance(order,dict,'Order is incorrect.')
-            es.sort(**order)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex,'%s does not refer to a valid index.' % source_id)
+            if order:
+                validate_is_instance(order,dict,'Order is incorrect.')
+                es.sort(**order)
 
 
-        if field == '*':
-            field = '_all'
-            vertical_min = 'geospatial_vertical_min'
-            vertical_max = 'geospatial_vertical_max'
-        else:
-            vertical_min = '%s.geospatial_vertical_min' % field
-            vertical_max = '%s.geospatial_vertical_max' % field
-
-
-        query = {
-          "query": {
-            "match_all": {}
-          },
-          "filter": {
-            "and": [
-              {
-                "or": [
-                  {
-                    "range": {
-                      vertical_min: {
-                        "gte": from_value
-                      }
-                    }
-                  },
-                  {
-                    "range": {
-                      vertical_max: {
-                        "gte": from_value
-                      }
-                    }
-                  }
-                ]
+            if field == '*':
+                field = '_all'
+                vertical_min = 'geospatial_vertical_min'
+                vertical_max = 'geospatial_vertical_max'
+            else:
+                vertical_min = '%s.geospatial_vertical_min' % field
+                vertical_max = '%s.geospatial_vertical_max' % field
+
+
+            query = {
+              "query": {
+                "match_all": {}
               },
-              {
-                "or": [
+              "filter": {
+                "and": [
                   {
-                    "range": {
-                      vertical_min: {
-                        "lte": to_value
+                    "or": [
+                      {
+                        "range": {
+                          vertical_min: {
+                            "gte": from_value
+                          }
+                        }
+                      },
+                      {
+                        "range": {
+                          vertical_max: {
+                            "gte": from_value
+                          }
+                        }
                       }
-                    }
+                    ]
                   },
                   {
-                    "range": {
-                      vertical_max: {
-                        "lte": to_value
+                    "or": [
+                      {
+                        "range": {
+                          vertical_min: {
+                            "lte": to_value
+                          }
+                        }
+                      },
+                      {
+                        "range": {
+                          vertical_max: {
+                            "lte": to_value
+                          }
+                        }
                       }
-                    }
+                    ]
                   }
                 ]
               }
-            ]
-          }
-        }
-        if limit:
-            query['size'] = limit
-        if offset:
-            query['from'] = offset
+            }
+            if limit:
+                query['size'] = limit
+            if offset:
+                query['from'] = offset
 
-        response = IndexManagementService._es_call(es.raw_query,'%s/_search' % index.index_name,method='POST', data=query, host=self.elasticsearch_host, port=self.elasticsearch_port)
-        IndexManagementService._check_response(response)
-        retval= self._results_from_response(response, id_only)
-        return retval
+            response = IndexManagementService._es_call(es.raw_query,'%s/_search' % index.index_name,method='POST', data=query, host=self.elasticsearch_host, port=self.elasticsearch_port)
+            IndexManagementService._check_response(response)
+            retval= self._results_from_response(response, id_only)
+            return retval
 
 
     def query_association(self,resource_id='', depth=0, id_only=False):
@@ -986,47 +983,47 @@ class DiscoveryService(BaseDiscoveryService):
         if not self.use_es:
             raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
         source = self.clients.resource_registry.read(source_id)
 
         iterate = self._multi(self.query_geo_distance, source=source, field=field, origin=origin, distance=distance) 
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex, '%s does not refer to a valid index.' % index)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex, '%s does not refer to a valid index.' % index)
 
-        sorts = ep.ElasticSort()
-        if order is not None and isinstance(order,dict):
-            sort_field = order.keys()[0]
-            value = order[sort_field]
-            sorts.sort(sort_field,value)
-            es.sorted(sorts)
+            sorts = ep.ElasticSort()
+            if order is not None and isinstance(order,dict):
+                sort_field = order.keys()[0]
+                value = order[sort_field]
+                sorts.sort(sort_field,value)
+                es.sorted(sorts)
 
-        if limit:
-            es.size(limit)
+            if limit:
+                es.size(limit)
 
-        if offset:
-            es.from_offset(offset)
+            if offset:
+                es.from_offset(offset)
 
-        if field == '*':
-            field = '_all'
+            if field == '*':
+                field = '_all'
 
 
-        sorts.geo_distance(field, origin, units)
+            sorts.geo_distance(field, origin, units)
 
-        es.sorted(sorts)
+            es.sorted(sorts)
 
-        filter = ep.ElasticFilter.geo_distance(field,origin, '%s%s' %(distance,units))
+            filter = ep.ElasticFilter.geo_distance(field,origin, '%s%s' %(distance,units))
 
-        es.filtered(filter)
+            es.filtered(filter)
 
-        query = ep.ElasticQuery.match_all()
+            query = ep.ElasticQuery.match_all()
 
-        response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
-        IndexManagementService._check_response(response)
+            response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
+            IndexManagementService._check_response(response)
 
-        return self._results_from_response(response,id_only)
+            return self._results_from_response(response,id_only)
 
 
     def query_geo_bbox(self, source_id='', field='', top_left=None, bottom_right=None, order=None, limit=0, offset=0, id_only=False):
@@ -1038,43 +1035,43 @@ class DiscoveryService(BaseDiscoveryService):
         if not self.use_es:
             raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
 
-        es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
         source = self.clients.resource_registry.read(source_id)
 
         iterate = self._multi(self.query_geo_bbox, source=source, field=field, top_left=top_left, bottom_right=bottom_right, order=order, limit=limit, offset=offset, id_only=id_only)
         if iterate is not None:
             return iterate
 
-        index = source
-        validate_is_instance(index,ElasticSearchIndex, '%s does not refer to a valid index.' % index)
+        with self._es_client() as es:
+            index = source
+            validate_is_instance(index,ElasticSearchIndex, '%s does not refer to a valid index.' % index)
 
-        sorts = ep.ElasticSort()
-        if order is not None and isinstance(order,dict):
-            sort_field = order.keys()[0]
-            value = order[sort_field]
-            sorts.sort(sort_field,value)
-            es.sorted(sorts)
+            sorts = ep.ElasticSort()
+            if order is not None and isinstance(order,dict):
+                sort_field = order.keys()[0]
+                value = order[sort_field]
+                sorts.sort(sort_field,value)
+                es.sorted(sorts)
 
-        if limit:
-            es.size(limit)
+            if limit:
+                es.size(limit)
 
-        if offset:
-            es.from_offset(offset)
+            if offset:
+                es.from_offset(offset)
 
-        if field == '*':
-            field = '_all'
+            if field == '*':
+                field = '_all'
 
 
-        filter = ep.ElasticFilter.geo_bounding_box(field, top_left, bottom_right)
+            filter = ep.ElasticFilter.geo_bounding_box(field, top_left, bottom_right)
 
-        es.filtered(filter)
+            es.filtered(filter)
 
-        query = ep.ElasticQuery.match_all()
+            query = ep.ElasticQuery.match_all()
 
-        response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
-        IndexManagementService._check_response(response)
+            response = IndexManagementService._es_call(es.search_index_advanced,index.index_name,query)
+            IndexManagementService._check_response(response)
 
-        return self._results_from_response(response,id_only)
+            return self._results_from_response(response,id_only)
 
         
 
@@ -1111,6 +1108,30 @@ class DiscoveryService(BaseDiscoveryService):
         if not (query.has_key('query') and query.has_key('and') and query.has_key('or')):
             raise BadRequest('Improper query request: %s' % query)
 
+        # Requests with cache=False bypass the result cache
+        if not query.get('cache', True) or self.RESULT_CACHE_SIZE <= 0:
+            return self._request(query, id_only)
+
+        key = self._query_key(query, id_only)
+        entry = self._result_cache.pop(key, None)
+        if entry is not None and entry[2] > time.time():
+            self._result_cache[key] = entry
+            self._result_stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+        if entry is not None:
+            self._result_stats['expired'] += 1
+        self._result_stats['misses'] += 1
+
+        generation = self._result_stats['invalidations']
+        result = self._request(query, id_only)
+        # Results are only kept if no resource changed while they were gathered
+        if generation == self._result_stats['invalidations']:
+            self._result_cache[key] = (self._query_types(query), result, time.time() + self.RESULT_CACHE_MAX_AGE)
+            while len(self._result_cache) > self.RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return copy.deepcopy(result)
+
+    def _request(self, query, id_only):
         query_queue = list()
 
         query = DotDict(query)
@@ -1127,23 +1148,24 @@ class DiscoveryService(BaseDiscoveryService):
         #================================================
         # Tier-2 Query
         #================================================
-        
-        query_queue.append(self.query_request(query.query,limit=self.SEARCH_BUFFER_SIZE, id_only=True))
-        
+
+        # The query and its branches are made concurrently
+        queries = [query.query] + list(query['and']) + list(query['or'])
+        results = self._fan_out(self.query_request, queries, limit=self.SEARCH_BUFFER_SIZE, id_only=True)
+        and_count = len(query['and']) + 1
+
         #==================
         # Intersection
         #==================
-        for q in query['and']:
-            query_queue.append(self.query_request(q, limit=self.SEARCH_BUFFER_SIZE, id_only=True))
+        query_queue.extend(results[:and_count])
         while len(query_queue) > 1:
             tmp = self.intersect(query_queue.pop(), query_queue.pop())
             query_queue.append(tmp)
-        
+
         #==================
         # Union
         #==================
-        for q in query['or']:
-            query_queue.append(self.query_request(q, limit=self.SEARCH_BUFFER_SIZE, id_only=True))
+        query_queue.extend(results[and_count:])
         while len(query_queue) > 1:
             tmp = self.union(query_queue.pop(), query_queue.pop())
             query_queue.append(tmp)
@@ -1157,6 +1179,61 @@ class DiscoveryService(BaseDiscoveryService):
 
 
 
+    #===================================================================
+    # Result Cache
+    #===================================================================
+
+    @classmethod
+    def _query_key(cls, query, id_only):
+        '''
+        Hashable form of a request, independent of the order of the keys and of the and/or branches
+        '''
+        def normalize(value):
+            if isinstance(value, dict):
+                return tuple(sorted((k, normalize(v)) for k,v in value.iteritems()))
+            if isinstance(value, (list, tuple)):
+                return tuple(normalize(v) for v in value)
+            return value
+        return (normalize(query['query']),
+                tuple(sorted(normalize(q) for q in query['and'])),
+                tuple(sorted(normalize(q) for q in query['or'])),
+                bool(id_only))
+
+    @classmethod
+    def _query_types(cls, query):
+        '''
+        Resource types a request can return, None when they're not known (views,
+        associations, collections or indexes holding any resource)
+        '''
+        types = set()
+        for q in [query['query']] + list(query['and']) + list(query['or']):
+            index_types = STD_INDEXES.get(q.get('index') if isinstance(q, dict) else None)
+            if index_types is None:
+                return None
+            types.update(index_types)
+        return types
+
+    def _resource_event(self, event, *args, **kwargs):
+        self.invalidate_results(event.origin_type)
+
+    def invalidate_results(self, resource_type=None):
+        '''
+        Discards the cached results that can contain resources of the type, all of them if no type is given
+        '''
+        self._result_stats['invalidations'] += 1
+        for key, (types, _, _) in self._result_cache.items():
+            if resource_type is None or types is None or resource_type in types:
+                self._result_cache.pop(key)
+
+    def result_cache_stats(self):
+        hits, misses = self._result_stats['hits'], self._result_stats['misses']
+        return {'hits'          : hits,
+                'misses'        : misses,
+                'hit_ratio'     : float(hits) / (hits + misses) if hits + misses else 0.,
+                'invalidations' : self._result_stats['invalidations'],
+                'expired'       : self._result_stats['expired'],
+                'size'          : len(self._result_cache)}
+
     def raise_search_buffer_exceeded(self):
         self.ep.publish_event(origin='Discovery Service', description='Search buffer was exceeded, results may not contain all the possible results.')
 
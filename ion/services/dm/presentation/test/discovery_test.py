@@ -44,6 +44,30 @@ import calendar
 use_es = CFG.get_safe('system.elasticsearch',False)
 
 
+class FakeElasticSearch(object):
+    '''
+    Stand-in for an ElasticSearch client, each index holds a single document named after the index
+    '''
+    instances = []
+    active = 0
+    max_active = 0
+
+    def __init__(self, host='', port=''):
+        self.params = None
+        FakeElasticSearch.instances.append(self)
+
+    def size(self, size):
+        self.params = self.params or {}
+        self.params['size'] = size
+
+    def search_index_advanced(self, index, query):
+        FakeElasticSearch.active += 1
+        FakeElasticSearch.max_active = max(FakeElasticSearch.active, FakeElasticSearch.max_active)
+        gevent.sleep(0.01)
+        FakeElasticSearch.active -= 1
+        return {'hits':{'hits':[{'_id':index}]}}
+
+
 @attr('UNIT', group='dm')
 class DiscoveryUnitTest(PyonTestCase):
     def setUp(self):
@@ -67,6 +91,9 @@ class DiscoveryUnitTest(PyonTestCase):
         self.cms_create = mock_clients.catalog_management.create_catalog
         self.cms_list_indexes = mock_clients.catalog_management.list_indexes
 
+        DiscoveryService._clear_es_clients()
+        self.addCleanup(DiscoveryService._clear_es_clients)
+
     def test_create_view(self):
         # Mocks
         self.rr_find_res.return_value = ([],[])
@@ -147,21 +174,27 @@ class DiscoveryUnitTest(PyonTestCase):
         pass
         
 
-    @skip('Needs to be adjusted for new traversal')
     def test_traverse(self):
-        edge_list = ['B','C','D']
-        callers = []
-        def pop_edge(*args, **kwargs):
-            callers.append(args[0])
-            if len(edge_list):
-                val = edge_list.pop(0)
-                return [val], 'blah'
-            return [], 'blah'
-        self.rr_find_obj.side_effect = pop_edge
+        graph = {'A':['B','C'], 'B':['D','A'], 'C':['D','E'], 'D':['F'], 'E':[], 'F':['B']}
+        find_objects_mult = self.discovery.clients.resource_registry.find_objects_mult
+        find_objects_mult.side_effect = lambda subjects, id_only: ([o for s in subjects for o in graph[s]], [])
+        find_subjects_mult = self.discovery.clients.resource_registry.find_subjects_mult
+        find_subjects_mult.side_effect = lambda objects, id_only: ([s for o in objects for s in sorted(graph) if o in graph[s]], [])
 
         retval = self.discovery.traverse('A')
-        retval.sort()
-        self.assertTrue(retval == ['B','C','D'], '%s' % retval)
+        self.assertEquals(retval, ['B','C','D','A','E','F'])
+        # One registry call per level
+        self.assertEquals(find_objects_mult.call_count, 4)
+
+        retval = self.discovery.traverse('A', depth=1)
+        self.assertEquals(retval, ['B','C','D','A','E'])
+
+        self.assertEquals(self.discovery.iterative_traverse('A'), ['B','C'])
+        self.assertEquals(self.discovery.iterative_traverse('A', 1), ['B','C','D','A','E'])
+
+        retval = self.discovery.reverse_traverse('F')
+        self.assertEquals(retval, ['D','B','C','A','F'])
+        self.assertEquals(self.discovery.iterative_reverse_traverse('F', 1), ['D','B','C'])
 
     def test_intersect(self):
         test_vals = [0,1,2,3]
@@ -337,6 +370,69 @@ class DiscoveryUnitTest(PyonTestCase):
 
         self.assertTrue(retval == [0,1,2,3,4])
 
+    def test_result_cache(self):
+        self.discovery.query_request = Mock(return_value=['a', 'b'])
+        sites_index = '%s_sites_index' % get_sys_name().lower()
+        request = {'and':[], 'or':[], 'query':{'index':sites_index, 'field':'name', 'value':'*'}}
+
+        self.assertEquals(self.discovery.request(request), ['a', 'b'])
+        # Same request, keys in a different order
+        retval = self.discovery.request({'query':{'value':'*', 'field':'name', 'index':sites_index}, 'or':[], 'and':[]})
+        self.assertEquals(retval, ['a', 'b'])
+        self.assertEquals(self.discovery.query_request.call_count, 1)
+        # Cached results can't be modified by the callers
+        retval.append('c')
+        self.assertEquals(self.discovery.request(request), ['a', 'b'])
+
+        self.assertEquals(self.discovery.request(dict(request, cache=False)), ['a', 'b'])
+        self.assertEquals(self.discovery.query_request.call_count, 2)
+        self.discovery.request(request, id_only=False)
+        self.assertEquals(self.discovery.query_request.call_count, 3)
+
+        stats = self.discovery.result_cache_stats()
+        self.assertEquals((stats['hits'], stats['misses'], stats['size']), (2, 2, 2))
+        self.assertEquals(stats['hit_ratio'], 0.5)
+
+    def test_result_cache_invalidation(self):
+        self.discovery.query_request = Mock(return_value=['a'])
+        sites_index = '%s_sites_index' % get_sys_name().lower()
+        sites_request = {'and':[], 'or':[], 'query':{'index':sites_index, 'field':'name', 'value':'*'}}
+        association_request = {'and':[], 'or':[], 'query':{'association':'resource_id'}}
+        self.discovery.request(sites_request)
+        self.discovery.request(association_request)
+
+        # The types of the resources an association search returns are not known
+        self.discovery._resource_event(Mock(origin_type=RT.DataProduct))
+        self.assertEquals(self.discovery.result_cache_stats()['size'], 1)
+        self.discovery._resource_event(Mock(origin_type=RT.Site))
+        self.assertEquals(self.discovery.result_cache_stats()['size'], 0)
+
+        # Results gathered while a resource changed are not kept
+        def query_request(*args, **kwargs):
+            self.discovery._resource_event(Mock(origin_type=RT.Site))
+            return ['a']
+        self.discovery.query_request.side_effect = query_request
+        self.discovery.request(sites_request)
+        self.assertEquals(self.discovery.result_cache_stats()['size'], 0)
+
+    def test_result_cache_max_age(self):
+        self.discovery.query_request = Mock(return_value=['a'])
+        sites_index = '%s_sites_index' % get_sys_name().lower()
+        request = {'and':[], 'or':[], 'query':{'index':sites_index, 'field':'name', 'value':'*'}}
+
+        with patch.object(DiscoveryService, 'RESULT_CACHE_MAX_AGE', 0):
+            self.discovery.request(request)
+            self.discovery.request(request)
+        self.assertEquals(self.discovery.query_request.call_count, 2)
+        stats = self.discovery.result_cache_stats()
+        self.assertEquals((stats['hits'], stats['misses'], stats['expired'], stats['size']), (0, 2, 1, 1))
+
+        # The entry stored with the default max age is used
+        self.discovery.request(request)
+        self.assertEquals(self.discovery.query_request.call_count, 3)
+        self.discovery.request(request)
+        self.assertEquals(self.discovery.query_request.call_count, 3)
+
     def test_bad_requests(self):
         #================================
         # Battery of broken requests
@@ -391,6 +487,38 @@ class DiscoveryUnitTest(PyonTestCase):
         retval = self.discovery.query_term('blah', 'field', 'value')
         self.assertTrue(retval == 'test')
 
+    @patch('ion.services.dm.presentation.discovery_service.ep.ElasticSearch', FakeElasticSearch)
+    def test_view_fan_out(self):
+        FakeElasticSearch.instances = []
+        FakeElasticSearch.max_active = 0
+        self.discovery.elasticsearch_host = ''
+        self.discovery.elasticsearch_port = ''
+
+        resources = {'view':View(), 'c1':Catalog(), 'c2':Catalog()}
+        resources['view']._id = 'view'
+        resources['c1']._id = 'c1'
+        resources['c2']._id = 'c2'
+        for index in ('i1', 'i2', 'i3', 'i4'):
+            resources[index] = ElasticSearchIndex(index_name=index)
+        self.rr_read.side_effect = resources.get
+        self.discovery.list_catalogs = Mock(return_value=['c1', 'c2'])
+        self.cms_list_indexes.side_effect = lambda catalog_id, id_only: {'c1':['i1', 'i2'], 'c2':['i3', 'i4']}[catalog_id]
+
+        retval = self.discovery.query_term('view', 'field', 'value', id_only=True)
+        self.assertEquals(retval, ['i1', 'i2', 'i3', 'i4'])
+        # The indexes are searched concurrently, each search with its own client
+        self.assertEquals(FakeElasticSearch.max_active, 4)
+        self.assertEquals(len(FakeElasticSearch.instances), 4)
+
+        # The clients are reused and start from a clean state
+        retval = self.discovery.query_term('view', 'field', 'value', limit=2, id_only=True)
+        self.assertEquals(retval, ['i1', 'i2'])
+        self.assertEquals(len(FakeElasticSearch.instances), 4)
+        retval = self.discovery.query_term('i1', 'field', 'value', id_only=True)
+        self.assertEquals(retval, ['i1'])
+        self.assertEquals(len(FakeElasticSearch.instances), 4)
+        self.assertEquals(self.discovery._es_clients[('', '')][-1].params, None)
+
     @patch('ion.services.dm.presentation.discovery_service.ep.ElasticSearch')
     def test_query_geo_distance(self, mock_es):
         self.rr_read.return_value = ElasticSearchIndex(name='test')
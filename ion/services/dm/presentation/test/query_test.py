@@ -11,6 +11,7 @@ from pyon.util.containers import DotDict
 from pyon.core.exception import BadRequest
 from pyon.util.unit_test import PyonTestCase
 from nose.plugins.attrib import attr
+from mock import patch
 from ion.services.dm.presentation.discovery_service import QueryLanguage
 
 
@@ -196,3 +197,50 @@ class QueryLanguageUnitTest(PyonTestCase):
         test_string = "search 'geospatial_bounds' vertical from 0.5 to 10.2 from 'index'"
         retval = self.parser.parse(test_string)
         self.assertEquals(retval, {'and':[], 'or':[], 'query':{'field':'geospatial_bounds', 'vertical_bounds':{'from':0.5, 'to':10.2}, 'index':'index'}})
+
+    def test_parse_cache(self):
+        QueryLanguage.clear_cache()
+        self.addCleanup(QueryLanguage.clear_cache)
+        test_string = "search 'description' like 'products' from 'index'"
+        retval = self.parser.parse(test_string)
+        retval['query']['fuzzy'] = 'modified'
+
+        # Cached results are copied for every caller
+        retval = QueryLanguage().parse(test_string)
+        self.assertEquals(retval, {'and':[], 'or':[], 'query':{'field':'description', 'fuzzy':'products', 'index':'index'}})
+        stats = QueryLanguage.stats()
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['misses'], 1)
+
+        # Failures aren't cached
+        with self.assertRaises(BadRequest):
+            self.parser.parse('bad query')
+        self.assertEquals(QueryLanguage.stats()['cached'], 1)
+
+        with patch.object(QueryLanguage, '_cache_limit', 3):
+            for i in xrange(10):
+                retval = self.parser.parse("search 'model' is '%s' from 'index'" % i)
+                self.assertEquals(retval['query']['value'], str(i))
+            self.assertEquals(QueryLanguage.stats()['cached'], 3)
+
+    def test_shared_grammar(self):
+        QueryLanguage.clear_cache()
+        self.addCleanup(QueryLanguage.clear_cache)
+        queries = ["search 'model' is 'abc*' from 'models' and belongs to 'platformDeviceID'",
+                   "search 'runtime' values from 1. to 100 from 'devices' and belongs to 'RSN'",
+                   "search 'model' is 'sbc*' from 'devices' order by 'name' limit 30 and belongs to 'platformDeviceID'",
+                   "search 'location' geo distance 20 km from lat 20 lon 30 from 'index'"] * 50
+
+        with patch.object(QueryLanguage, '_grammar', None), patch.object(QueryLanguage, '_build_grammar', side_effect=QueryLanguage._build_grammar) as build_grammar:
+            # Without the parse cache every query is parsed with the one grammar
+            with patch.object(QueryLanguage, '_cache_limit', 0):
+                expected = [QueryLanguage().parse(query) for query in queries]
+            self.assertEquals(build_grammar.call_count, 1)
+            self.assertEquals(QueryLanguage.stats(), {'misses': len(queries), 'cached': 0})
+
+            # With the cache only the first occurrence of each query is parsed
+            QueryLanguage.clear_cache()
+            retval = [QueryLanguage().parse(query) for query in queries]
+            self.assertEquals(retval, expected)
+            self.assertEquals(build_grammar.call_count, 1)
+            self.assertEquals(QueryLanguage.stats(), {'misses': 4, 'hits': len(queries) - 4, 'cached': 4})
@@ -19,6 +19,7 @@ from ion.services.dm.ingestion.test.ingestion_management_test import IngestionMa
 from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
 from ion.services.dm.inventory.data_retriever_service import DataRetrieverService
 from ion.services.dm.utility.granule_utils import RecordDictionaryTool, CoverageCraft, time_series_domain
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from ion.services.dm.utility.test.parameter_helper import ParameterHelper
 from ion.util.stored_values import StoredValueManager
 
@@ -617,51 +618,51 @@ class TestDMEnd2End(IonIntegrationTestCase):
     @attr('LOCOINT')
     @unittest.skipIf(os.getenv('CEI_LAUNCH_TEST', False), 'Host requires file-system access to coverage files, CEI mode does not support.')
     def test_retrieve_cache(self):
-        DataRetrieverService._refresh_interval = 1
+        CoveragePool.clear()
+        self.addCleanup(CoveragePool.clear)
+        self.addCleanup(setattr, CoveragePool, '_max_open', CoveragePool._max_open)
+        CoveragePool._max_open = 5
         datasets = [self.make_simple_dataset() for i in xrange(10)]
         for stream_id, route, stream_def_id, dataset_id in datasets:
             coverage = DatasetManagementService._get_simplex_coverage(dataset_id)
             coverage.insert_timesteps(10)
             coverage.set_parameter_values('time', np.arange(10))
             coverage.set_parameter_values('temp', np.arange(10))
+            coverage.close()
 
-        # Verify cache hit and refresh
+        # Verify cache hit
         dataset_ids = [i[3] for i in datasets]
-        self.assertTrue(dataset_ids[0] not in DataRetrieverService._retrieve_cache)
-        DataRetrieverService._get_coverage(dataset_ids[0]) # Hit the chache
-        cov, age = DataRetrieverService._retrieve_cache[dataset_ids[0]]
-        # Verify that it was hit and it's now in there
-        self.assertTrue(dataset_ids[0] in DataRetrieverService._retrieve_cache)
-
-        gevent.sleep(DataRetrieverService._refresh_interval + 0.2)
-
-        DataRetrieverService._get_coverage(dataset_ids[0]) # Hit the chache
-        cov, age2 = DataRetrieverService._retrieve_cache[dataset_ids[0]]
-        self.assertTrue(age2 != age)
-
+        key = CoveragePool.key(dataset_ids[0])
+        self.assertTrue(key not in CoveragePool._handles)
+        with CoveragePool.coverage(dataset_ids[0]) as cov:
+            pass
+        self.assertTrue(key in CoveragePool._handles)
+        with CoveragePool.coverage(dataset_ids[0]) as cov2:
+            self.assertTrue(cov2 is cov)
+
+        # Least recently used handles are closed
         for dataset_id in dataset_ids:
-            DataRetrieverService._get_coverage(dataset_id)
-        
-        self.assertTrue(dataset_ids[0] not in DataRetrieverService._retrieve_cache)
+            with CoveragePool.coverage(dataset_id):
+                pass
+        self.assertTrue(key not in CoveragePool._handles)
+        self.assertTrue(len(CoveragePool._handles) <= CoveragePool._max_open)
 
         stream_id, route, stream_def, dataset_id = datasets[0]
         self.start_ingestion(stream_id, dataset_id)
-        DataRetrieverService._get_coverage(dataset_id)
-        
-        self.assertTrue(dataset_id in DataRetrieverService._retrieve_cache)
+        with CoveragePool.coverage(dataset_id):
+            pass
+        self.assertTrue(key in CoveragePool._handles)
 
-        DataRetrieverService._refresh_interval = 100
+        # New data invalidates the read-only handle
         self.publish_hifi(stream_id,route,1)
         self.wait_until_we_have_enough_granules(dataset_id, data_size=20)
-            
- 
+
         event = gevent.event.Event()
         with gevent.Timeout(20):
             while not event.wait(0.1):
-                if dataset_id not in DataRetrieverService._retrieve_cache:
+                if key not in CoveragePool._handles:
                     event.set()
 
-
         self.assertTrue(event.is_set())
 
         
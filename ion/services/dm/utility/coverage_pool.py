@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/coverage_pool.py
+@description Container wide pool of open coverage handles
+'''
+
+from pyon.public import CFG, OT
+from pyon.util.log import log
+
+from coverage_model.coverage import AbstractCoverage
+
+from contextlib import contextmanager
+import collections
+import gevent.coros
+import os
+
+
+class PooledCoverage(object):
+    '''
+    An open coverage handle held by the pool
+    '''
+    def __init__(self, key, coverage):
+        self.key       = key
+        self.coverage  = coverage
+        self.refcount  = 0
+        self.discarded = False
+
+
+class CoveragePool(object):
+    '''
+    Open coverage handles shared by the DM components of a container
+    (ingestion, data retriever, dataset management, replay and the pydap
+    handler) so that a coverage is only loaded once per container.
+
+    Handles are acquired and released; a handle is never closed while it is
+    in use. Read-only and writable handles are pooled separately, as are the
+    handles loaded from a root path other than the datasets directory.
+    Read-only handles are long lived and shared, they don't cache values.
+    Coverages are loaded without holding the pool; when two loads of a handle
+    race the second one is closed. Idle handles
+    are closed in LRU order when there are more than _max_open handles open or
+    when the process uses more than _max_memory MB.
+
+    DatasetModified events discard the read-only handles of the dataset so
+    that readers see the new data, writable handles are kept.
+    '''
+    _max_open     = CFG.get_safe('container.coverage_pool.max_open', 20)
+    _max_memory   = CFG.get_safe('container.coverage_pool.max_memory', None)
+    _handles      = collections.OrderedDict() # (dataset_id, writable, simplex, root_path) -> PooledCoverage
+    _by_coverage  = {}                        # id(coverage) -> PooledCoverage
+    _pool_lock    = gevent.coros.RLock()
+    _subscriber   = None
+    _stats        = collections.Counter()
+
+    @classmethod
+    def acquire(cls, dataset_id, mode='r', simplex=False, root_path=None):
+        '''
+        Returns an open coverage handle for the dataset, it must be given back
+        with release() instead of being closed.
+        '''
+        cls._monitor_datasets()
+        key = cls.key(dataset_id, mode, simplex, root_path)
+        with cls._pool_lock:
+            handle = cls._handles.get(key)
+            if handle is not None:
+                cls._stats['hits'] += 1
+                return cls._use(handle)
+            cls._stats['misses'] += 1
+
+        # Coverages are loaded without holding the pool, loads of other datasets aren't held up
+        coverage = cls._load(dataset_id, mode, simplex, root_path)
+        with cls._pool_lock:
+            handle = cls._handles.get(key)
+            if handle is None:
+                handle = PooledCoverage(key, coverage)
+                cls._by_coverage[id(coverage)] = handle
+                coverage = None
+            retval = cls._use(handle)
+        if coverage is not None:
+            # The dataset was loaded concurrently, the other handle is used
+            cls._stats['races'] += 1
+            cls._close(coverage)
+        return retval
+
+    @classmethod
+    def register(cls, dataset_id, coverage, mode='a', simplex=False, root_path=None):
+        '''
+        Adds a coverage opened elsewhere to the pool, replacing the current
+        handle for the dataset, and acquires it.
+        '''
+        key = cls.key(dataset_id, mode, simplex, root_path)
+        with cls._pool_lock:
+            current = cls._handles.pop(key, None)
+            if current is not None:
+                cls._discard(current)
+            handle = PooledCoverage(key, coverage)
+            handle.refcount = 1
+            cls._handles[key] = handle
+            cls._by_coverage[id(coverage)] = handle
+            cls._evict()
+            return coverage
+
+    @classmethod
+    def release(cls, coverage, discard=False):
+        '''
+        Gives back an acquired handle, discard closes the handle as soon as
+        nothing else uses it (e.g. after an error with the coverage).
+        '''
+        if coverage is None:
+            return
+        with cls._pool_lock:
+            handle = cls._by_coverage.get(id(coverage))
+            if handle is None:
+                # Not a pooled handle
+                cls._close(coverage)
+                return
+            handle.refcount = max(handle.refcount - 1, 0)
+            if discard:
+                cls._discard(handle)
+            elif handle.discarded and not handle.refcount:
+                cls._close_handle(handle)
+            else:
+                cls._evict()
+
+    @classmethod
+    @contextmanager
+    def coverage(cls, dataset_id, mode='r', simplex=False, root_path=None):
+        coverage = cls.acquire(dataset_id, mode=mode, simplex=simplex, root_path=root_path)
+        discard = False
+        try:
+            yield coverage
+        except Exception:
+            # The handle may be in a bad state
+            discard = True
+            raise
+        finally:
+            cls.release(coverage, discard=discard)
+
+    @classmethod
+    def key(cls, dataset_id, mode='r', simplex=False, root_path=None):
+        '''
+        The pool key of a handle, the datasets directory as root path is the
+        same handle as no root path
+        '''
+        if root_path is not None and os.path.normpath(root_path) == cls._datasets_root():
+            root_path = None
+        return (dataset_id, mode != 'r', simplex, root_path)
+
+    @classmethod
+    def invalidate(cls, dataset_id, writable=False):
+        '''
+        Discards the read-only (and optionally the writable) handles of a dataset
+        '''
+        with cls._pool_lock:
+            for key, handle in cls._handles.items():
+                if key[0] == dataset_id and (writable or not key[1]):
+                    cls._stats['invalidations'] += 1
+                    cls._discard(handle)
+
+    @classmethod
+    def clear(cls):
+        with cls._pool_lock:
+            for handle in cls._handles.values():
+                cls._discard(handle)
+
+    @classmethod
+    def stats(cls):
+        with cls._pool_lock:
+            retval = dict(cls._stats)
+            retval['open'] = len(cls._by_coverage)
+            retval['in_use'] = len([h for h in cls._by_coverage.itervalues() if h.refcount])
+            return retval
+
+    #--------------------------------------------------------------------------------
+    # Internals
+    #--------------------------------------------------------------------------------
+
+    @classmethod
+    def _datasets_root(cls):
+        from pyon.util.file_sys import FileSystem, FS
+        return os.path.normpath(FileSystem.get_url(FS.CACHE, 'datasets'))
+
+    @classmethod
+    def _load(cls, dataset_id, mode, simplex, root_path):
+        from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
+        if root_path is not None:
+            coverage = AbstractCoverage.load(root_path, dataset_id, mode=mode)
+        elif simplex:
+            coverage = DatasetManagementService._get_simplex_coverage(dataset_id, mode=mode)
+        else:
+            coverage = DatasetManagementService._get_coverage(dataset_id, mode=mode)
+        if mode == 'r':
+            coverage.value_caching = False
+        return coverage
+
+    @classmethod
+    def _use(cls, handle):
+        ''' Marks the handle as the most recently used and acquires it, the pool must be locked '''
+        cls._handles.pop(handle.key, None)
+        cls._handles[handle.key] = handle
+        handle.refcount += 1
+        cls._evict()
+        return handle.coverage
+
+    @classmethod
+    def _discard(cls, handle):
+        if cls._handles.get(handle.key) is handle:
+            cls._handles.pop(handle.key)
+        handle.discarded = True
+        if not handle.refcount:
+            cls._close_handle(handle)
+
+    @classmethod
+    def _close_handle(cls, handle):
+        cls._by_coverage.pop(id(handle.coverage), None)
+        cls._close(handle.coverage)
+
+    @classmethod
+    def _close(cls, coverage):
+        try:
+            coverage.close(timeout=5)
+        except:
+            log.exception('Problems closing the coverage')
+
+    @classmethod
+    def _evict(cls):
+        '''
+        Closes idle handles, least recently used first, while the pool is over its limits
+        '''
+        for key, handle in cls._handles.items():
+            if not cls._over_limit():
+                return
+            if handle.refcount:
+                continue
+            cls._stats['evictions'] += 1
+            cls._discard(handle)
+
+    @classmethod
+    def _over_limit(cls):
+        if len(cls._by_coverage) > cls._max_open:
+            return True
+        if cls._max_memory:
+            memory = cls._memory_usage()
+            return memory is not None and memory > cls._max_memory
+        return False
+
+    @classmethod
+    def _memory_usage(cls):
+        '''
+        Resident memory of the process in MB, None when it can't be determined
+        '''
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE') / (1024. * 1024.)
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    @classmethod
+    def _dataset_modified(cls, event, *args, **kwargs):
+        cls.invalidate(event.origin)
+
+    @classmethod
+    def _monitor_datasets(cls):
+        '''
+        Starts listening for DatasetModified the first time the pool is used inside a container
+        '''
+        if cls._subscriber is not None:
+            return
+        from pyon.container.cc import Container
+        from pyon.ion.event import EventSubscriber
+        if Container.instance is None:
+            return
+        with cls._pool_lock:
+            if cls._subscriber is not None:
+                return
+            cls._subscriber = EventSubscriber(event_type=OT.DatasetModified, callback=cls._dataset_modified, auto_delete=True)
+            cls._subscriber.start()
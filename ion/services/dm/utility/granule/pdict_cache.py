@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/granule/pdict_cache.py
+@description Process wide cache of parsed parameter dictionaries
+'''
+
+from pyon.core.interceptor.encode import encode_ion
+from pyon.public import CFG, OT, RT
+from pyon.util.log import log
+
+from coverage_model import ParameterDictionary
+
+import collections
+import gevent.coros
+import hashlib
+import msgpack
+
+class ParameterDictionaryCache(object):
+    '''
+    Parsed ParameterDictionary objects shared by every record dictionary in
+    the process, so that a parameter dictionary is only loaded once per stream
+    definition (or per distinct parameter dictionary dump).
+
+    Entries keyed by stream definition are ejected when the stream definition
+    is modified or deleted (ResourceModifiedEvent), the stream definitions
+    memoized by RecordDictionaryTool.read_stream_def are cleared with them.
+    The cached objects are shared and must not be modified.
+    '''
+    _cache_limit     = CFG.get_safe('container.pdict_cache', 100)
+    _by_stream_def   = collections.OrderedDict()
+    _by_hash         = collections.OrderedDict()
+    _cache_lock      = gevent.coros.RLock()
+    _subscriber      = None
+    hits             = 0
+    misses           = 0
+
+    @classmethod
+    def _lookup(cls, cache, key, pdict_dump):
+        with cls._cache_lock:
+            try:
+                result = cache.pop(key)
+                cls.hits += 1
+            except KeyError:
+                cls.misses += 1
+                result = ParameterDictionary.load(pdict_dump)
+                if len(cache) >= cls._cache_limit:
+                    cache.popitem(0)
+            cache[key] = result
+            return result
+
+    @classmethod
+    def content_hash(cls, pdict_dump):
+        return hashlib.sha1(msgpack.packb(pdict_dump, default=encode_ion)).hexdigest()
+
+    @classmethod
+    def get_pdict(cls, pdict_dump):
+        ''' Returns the parsed parameter dictionary for a parameter dictionary dump '''
+        return cls._lookup(cls._by_hash, cls.content_hash(pdict_dump), pdict_dump)
+
+    @classmethod
+    def get_stream_def_pdict(cls, stream_definition_id, pdict_dump):
+        ''' Returns the parsed parameter dictionary of a stream definition '''
+        if not stream_definition_id:
+            return cls.get_pdict(pdict_dump)
+        cls._monitor_stream_definitions()
+        return cls._lookup(cls._by_stream_def, stream_definition_id, pdict_dump)
+
+    @classmethod
+    def eject(cls, stream_definition_id):
+        with cls._cache_lock:
+            cls._by_stream_def.pop(stream_definition_id, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._cache_lock:
+            cls._by_stream_def.clear()
+            cls._by_hash.clear()
+            cls.hits = 0
+            cls.misses = 0
+
+    @classmethod
+    def stats(cls):
+        with cls._cache_lock:
+            return {'hits'       : cls.hits,
+                    'misses'     : cls.misses,
+                    'stream_defs': len(cls._by_stream_def),
+                    'pdicts'     : len(cls._by_hash)}
+
+    @classmethod
+    def _stream_definition_event(cls, event, *args, **kwargs):
+        from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
+        log.debug('Stream definition %s modified, ejecting its parameter dictionary', event.origin)
+        cls.eject(event.origin)
+        # memoize_lru can't eject a single entry
+        RecordDictionaryTool.read_stream_def.clear()
+
+    @classmethod
+    def _monitor_stream_definitions(cls):
+        '''
+        Starts listening to the stream definition lifecycle the first time the
+        cache is used inside a container.
+        '''
+        if cls._subscriber is not None:
+            return
+        from pyon.container.cc import Container
+        from pyon.ion.event import EventSubscriber
+        if Container.instance is None:
+            return
+        with cls._cache_lock:
+            if cls._subscriber is not None:
+                return
+            cls._subscriber = EventSubscriber(event_type=OT.ResourceModifiedEvent, origin_type=RT.StreamDefinition, callback=cls._stream_definition_event, auto_delete=True)
+            cls._subscriber.start()
@@ -11,12 +11,14 @@
 from pyon.container.cc import Container
 from pyon.core.exception import BadRequest, NotFound
 from pyon.core.object import IonObjectSerializer
+from pyon.public import CFG
 from pyon.core.interceptor.encode import encode_ion
 from pyon.util.arg_check import validate_equal
 from pyon.util.log import log
 from pyon.util.memoize import memoize_lru
 
-from ion.util.stored_values import StoredValueManager
+from ion.util.stored_values import CachedStoredValueManager
+from ion.services.dm.utility.granule.pdict_cache import ParameterDictionaryCache
 
 from interface.services.dm.ipubsub_management_service import PubsubManagementServiceClient
 from interface.objects import Granule, StreamDefinition
@@ -29,6 +31,7 @@ from coverage_model.parameter_types import ParameterFunctionType
 import numpy as np
 import msgpack
 import time
+import copy
 
 class RecordDictionaryTool(object):
     """
@@ -61,12 +64,18 @@ class RecordDictionaryTool(object):
     connection_id       = ''
     connection_index    = ''
 
+    # Numeric arrays are sent as raw buffers (see encode_values) instead of msgpack lists. Granules of
+    # either encoding are always loaded, enable it once every consumer decodes raw buffers.
+    _raw_arrays         = CFG.get_safe('container.granule.raw_arrays', False)
+    RAW_KINDS           = 'biufc'
+    RAW_HEADER          = '__ndbuffer__'
+
 
     def __init__(self,param_dictionary=None, stream_definition_id='', locator=None, stream_definition=None):
         """
         """
         if type(param_dictionary) == dict:
-            self._pdict = ParameterDictionary.load(param_dictionary)
+            self._pdict = ParameterDictionaryCache.get_pdict(param_dictionary)
         
         elif isinstance(param_dictionary,ParameterDictionary):
             self._pdict = param_dictionary
@@ -81,7 +90,7 @@ class RecordDictionaryTool(object):
             pdict = stream_def_obj.parameter_dictionary
             self._available_fields = stream_def_obj.available_fields or None
             self._stream_config = stream_def_obj.stream_configuration
-            self._pdict = ParameterDictionary.load(pdict)
+            self._pdict = ParameterDictionaryCache.get_stream_def_pdict(stream_definition_id or getattr(stream_def_obj, '_id', ''), pdict)
             self._stream_def = stream_definition_id
 
         else:
@@ -150,7 +159,7 @@ class RecordDictionaryTool(object):
                 document_key = context.document_key
                 if '$designator' in context.document_key and 'reference_designator' in self._stream_config:
                     document_key = document_key.replace('$designator',self._stream_config['reference_designator'])
-                svm = StoredValueManager(Container.instance)
+                svm = CachedStoredValueManager(Container.instance)
                 try:
                     doc = svm.read_value(document_key)
                 except NotFound:
@@ -159,6 +168,30 @@ class RecordDictionaryTool(object):
                 if context.lookup_value in doc:
                     self[lv] = [doc[context.lookup_value]] * self._shp[0] if self._shp else doc[context.lookup_value]
 
+    @classmethod
+    def encode_values(cls, values):
+        '''
+        Encodes a numeric array as its raw contiguous buffer with a dtype/shape
+        header, any other value is left to the default granule encoding.
+        '''
+        if not isinstance(values, np.ndarray) or values.dtype.kind not in cls.RAW_KINDS:
+            return values
+        if not values.flags.c_contiguous:
+            values = values.copy()
+        return {cls.RAW_HEADER : values.dtype.str,
+                'shape'        : list(values.shape),
+                'data'         : values.tostring()}
+
+    @classmethod
+    def decode_values(cls, values):
+        '''
+        Rebuilds an array encoded by encode_values as a (read-only) view over
+        the received buffer, get_paramval copies it into the parameter values.
+        '''
+        if isinstance(values, dict) and cls.RAW_HEADER in values:
+            return np.frombuffer(values['data'], dtype=np.dtype(values[cls.RAW_HEADER])).reshape(values['shape'])
+        return values
+
     @classmethod
     def load_from_granule(cls, g):
         if g.stream_definition_id:
@@ -179,7 +212,7 @@ class RecordDictionaryTool(object):
             key = instance._pdict.key_from_ord(k)
             if v is not None:
                 ptype = instance._pdict.get_context(key).param_type
-                paramval = cls.get_paramval(ptype, instance.domain, v)
+                paramval = cls.get_paramval(ptype, instance.domain, cls.decode_values(v))
                 instance._rd[key] = paramval
         
         instance.connection_id = g.connection_id
@@ -193,7 +226,10 @@ class RecordDictionaryTool(object):
         
         for key,val in self._rd.iteritems():
             if val is not None:
-                granule.record_dictionary[self._pdict.ord_from_key(key)] = self[key]
+                values = self[key]
+                if self._raw_arrays:
+                    values = self.encode_values(values)
+                granule.record_dictionary[self._pdict.ord_from_key(key)] = values
             else:
                 granule.record_dictionary[self._pdict.ord_from_key(key)] = None
         
@@ -217,6 +253,21 @@ class RecordDictionaryTool(object):
         for param in self._pdict.keys():
             self._rd[param] = None
 
+    def empty_copy(self):
+        '''
+        Returns an empty record dictionary for the same parameter dictionary and stream definition,
+        without loading them again.
+        '''
+        rdt = copy.copy(self)
+        rdt._rd = {}
+        rdt._shp = None
+        rdt._dirty_shape = False
+        rdt._creation_timestamp = None
+        rdt.connection_id = ''
+        rdt.connection_index = ''
+        rdt._setup_params()
+        return rdt
+
     @property
     def fields(self):
         if self._available_fields is not None:
@@ -415,14 +466,19 @@ class RecordDictionaryTool(object):
 
     def size(self):
         '''
-        Truly poor way to calculate the size of a granule...
-        returns the size in bytes.
+        Returns the size in bytes of the encoded granule, the raw array
+        buffers are measured without being serialized.
         '''
         granule = self.to_granule()
+        nbytes = 0
+        for k,v in granule.record_dictionary.items():
+            if isinstance(v, dict) and self.RAW_HEADER in v:
+                nbytes += len(v['data'])
+                granule.record_dictionary[k] = dict(v, data='')
         serializer = IonObjectSerializer()
         flat = serializer.serialize(granule)
         byte_stream = msgpack.packb(flat, default=encode_ion)
-        return len(byte_stream)
+        return nbytes + len(byte_stream)
 
     
     @staticmethod
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/granule/test/test_granule_encoding.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.core.interceptor.encode import encode_ion, decode_ion
+from nose.plugins.attrib import attr
+from mock import patch
+
+from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType, SparseConstantType, ConstantType, CategoryType, BooleanType, ArrayType
+from coverage_model import ParameterFunctionType, NumexprFunction, VariabilityEnum
+
+import numpy as np
+import msgpack
+
+
+@attr('UNIT',group='dm')
+class GranuleEncodingTest(PyonTestCase):
+    def wire(self, values):
+        encoded = RecordDictionaryTool.encode_values(values)
+        return msgpack.unpackb(msgpack.packb(encoded, default=encode_ion), object_hook=decode_ion)
+
+    def test_numeric_round_trip(self):
+        arrays = [
+            np.arange(10, dtype=np.int8),
+            np.arange(10, dtype='>i4'),
+            np.arange(10, dtype=np.uint64),
+            np.array([1.5, np.nan, -9999999., np.inf]),
+            np.array([1.5, -9999999.], dtype=np.float32),
+            np.array([True, False, True]),
+            np.array([1+2j, 3-1j]),
+            np.arange(12.).reshape(4,3),
+            np.arange(20.)[::3], # Not contiguous
+        ]
+        for values in arrays:
+            encoded = RecordDictionaryTool.encode_values(values)
+            self.assertIsInstance(encoded, dict)
+            decoded = RecordDictionaryTool.decode_values(self.wire(values))
+            self.assertEquals(decoded.dtype, values.dtype)
+            self.assertEquals(decoded.shape, values.shape)
+            # Fill values and NaNs are preserved bit for bit
+            self.assertEquals(decoded.tostring(), np.ascontiguousarray(values).tostring())
+
+    def test_fallback(self):
+        for values in [np.array(['a', 'bc']), np.array([{'a':1}, None], dtype=object), [1,2,3], None]:
+            self.assertTrue(RecordDictionaryTool.encode_values(values) is values)
+            self.assertTrue(RecordDictionaryTool.decode_values(values) is values)
+
+
+@attr('UNIT',group='dm')
+class GranuleRoundTripTest(PyonTestCase):
+    def build_rdt(self):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=np.float64)), is_temporal=True)
+        pdict.add_context(ParameterContext('temp', param_type=QuantityType(value_encoding=np.float32), fill_value=-9999.))
+        pdict.add_context(ParameterContext('lat', param_type=SparseConstantType(value_encoding=np.float64), fill_value=-9999.))
+        pdict.add_context(ParameterContext('serial', param_type=ConstantType(QuantityType(value_encoding=np.dtype('uint8'))), fill_value=12))
+        pdict.add_context(ParameterContext('switch', param_type=CategoryType(categories={np.int8(0):'off', np.int8(1):'on'}), fill_value=np.int8(0)))
+        pdict.add_context(ParameterContext('flag', param_type=BooleanType(), fill_value=False))
+        pdict.add_context(ParameterContext('raw', param_type=ArrayType()))
+        func = NumexprFunction('temp_L1', 'temp * 2', ['temp'], param_map={'temp':'temp'})
+        pdict.add_context(ParameterContext('temp_L1', param_type=ParameterFunctionType(func), variability=VariabilityEnum.TEMPORAL))
+
+        rdt = RecordDictionaryTool(param_dictionary=pdict)
+        rdt['time'] = np.arange(10.)
+        rdt['temp'] = np.arange(10, dtype=np.float32) / 4
+        rdt['lat'] = [45.] * 5 + [46.] * 5
+        rdt['serial'] = 2
+        rdt['switch'] = [1, 0] * 5
+        rdt['flag'] = [True, False] * 5
+        rdt['raw'] = ['abc', 'de'] * 5
+        return rdt
+
+    def round_trip(self, rdt, raw_arrays):
+        with patch.object(RecordDictionaryTool, '_raw_arrays', raw_arrays):
+            granule = rdt.to_granule()
+        # The record dictionary as it goes over the wire
+        granule.record_dictionary = msgpack.unpackb(msgpack.packb(granule.record_dictionary, default=encode_ion), object_hook=decode_ion)
+        return RecordDictionaryTool.load_from_granule(granule)
+
+    def test_round_trip(self):
+        rdt = self.build_rdt()
+        for raw_arrays in (False, True):
+            loaded = self.round_trip(rdt, raw_arrays)
+            self.assertEquals(sorted(loaded.fields), sorted(rdt.fields))
+            for name in rdt.fields:
+                msg = '%s (raw_arrays=%s)' % (name, raw_arrays)
+                np.testing.assert_array_equal(loaded[name], rdt[name], msg)
+                self.assertEquals(loaded[name].dtype, rdt[name].dtype, msg)
+            np.testing.assert_array_equal(loaded['temp_L1'], rdt['temp'] * 2)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/granule/test/test_pdict_cache.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+from ion.services.dm.utility.granule.pdict_cache import ParameterDictionaryCache
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType
+
+import numpy as np
+
+@attr('UNIT',group='dm')
+class ParameterDictionaryCacheTest(PyonTestCase):
+    def setUp(self):
+        ParameterDictionaryCache.clear()
+        self.addCleanup(ParameterDictionaryCache.clear)
+
+    def pdict_dump(self):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=np.float64)), is_temporal=True)
+        pdict.add_context(ParameterContext('temp', param_type=QuantityType(value_encoding=np.float32)))
+        return pdict.dump()
+
+    def test_content_hash(self):
+        dump = self.pdict_dump()
+
+        rdt1 = RecordDictionaryTool(param_dictionary=dump)
+        rdt2 = RecordDictionaryTool(param_dictionary=self.pdict_dump())
+        self.assertIs(rdt1._pdict, rdt2._pdict)
+        self.assertEquals(ParameterDictionaryCache.stats()['hits'], 1)
+        self.assertEquals(ParameterDictionaryCache.stats()['misses'], 1)
+
+        rdt1['time'] = np.arange(10)
+        granule = rdt1.to_granule()
+        rdt3 = RecordDictionaryTool.load_from_granule(granule)
+        np.testing.assert_array_equal(rdt3['time'], np.arange(10))
+
+    def test_stream_definition(self):
+        dump = self.pdict_dump()
+        pdict1 = ParameterDictionaryCache.get_stream_def_pdict('stream_def', dump)
+        pdict2 = ParameterDictionaryCache.get_stream_def_pdict('stream_def', dump)
+        self.assertIs(pdict1, pdict2)
+
+        event = Mock()
+        event.origin = 'stream_def'
+        with patch.object(RecordDictionaryTool, 'read_stream_def') as read_stream_def:
+            ParameterDictionaryCache._stream_definition_event(event)
+            # The memoized stream definitions are cleared too
+            read_stream_def.clear.assert_called_once_with()
+        pdict3 = ParameterDictionaryCache.get_stream_def_pdict('stream_def', dump)
+        self.assertIsNot(pdict1, pdict3)
+
+        stats = ParameterDictionaryCache.stats()
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['misses'], 2)
+        self.assertEquals(stats['stream_defs'], 1)
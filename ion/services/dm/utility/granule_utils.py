@@ -76,7 +76,7 @@ class CoverageCraft(object):
             validate_is_instance(end_time, Number, 'end_time must be a number for striding.')
             validate_is_instance(stride_time, Number, 'stride_time must be a number for striding.')
             ugly_range = np.arange(start_time, end_time, stride_time)
-            idx_values = [TimeUtils.get_relative_time(coverage,i) for i in ugly_range]
+            idx_values = list(TimeUtils.get_relative_times(coverage,ugly_range))
             slice_ = [idx_values]
 
         elif not (start_time is None and end_time is None):
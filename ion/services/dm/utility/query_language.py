@@ -7,6 +7,11 @@
 '''
 from pyparsing import ParseException, Regex, quotedString, CaselessLiteral, MatchFirst, removeQuotes, Optional
 from pyon.core.exception import BadRequest
+from pyon.public import CFG
+
+import collections
+import copy
+import gevent.coros
 
 
 class QueryLanguage(object):
@@ -59,11 +64,30 @@ class QueryLanguage(object):
               <integer> ::= 0-9
     '''
 
-    def __init__(self):
-
+    _grammar      = None
+    _current      = None # The instance whose parse is in progress, the target of the parse actions
+    _parse_lock   = gevent.coros.RLock()
+    _cache_limit  = CFG.get_safe('service.discovery.query_cache_size', 256)
+    _parse_cache  = collections.OrderedDict()
+    _stats        = collections.Counter()
 
+    def __init__(self):
         self.json_query = {'query':{}, 'and': [], 'or': []}
         self.tokens = None
+        self.frame = {}
+
+    @classmethod
+    def grammar(cls):
+        '''
+        The grammar is built once per process and shared by every instance
+        '''
+        with cls._parse_lock:
+            if cls._grammar is None:
+                cls._grammar = cls._build_grammar()
+            return cls._grammar
+
+    @classmethod
+    def _build_grammar(cls):
         #--------------------------------------------------------------------------------------
         # <integer> ::= 0-9
         # <double>  ::= 0-9 ('.' 0-9)
@@ -89,7 +113,7 @@ class QueryLanguage(object):
         coords = CaselessLiteral("LAT") + number + CaselessLiteral("LON") + number
         units = CaselessLiteral('km') | CaselessLiteral('mi')
         distance = number + units
-        distance.setParseAction( lambda x : self.frame.update({'dist' : float(x[0]), 'units' : x[1]}))
+        distance.setParseAction( lambda x : cls._current.frame.update({'dist' : float(x[0]), 'units' : x[1]}))
 
 
         #--------------------------------------------------------------------------------------
@@ -105,10 +129,10 @@ class QueryLanguage(object):
         #--------------------------------------------------------------------------------------
         query_filter = CaselessLiteral("FILTER") + python_string
         # Add the filter to the frame object
-        query_filter.setParseAction(lambda x : self.frame.update({'filter' : x[1]}))
+        query_filter.setParseAction(lambda x : cls._current.frame.update({'filter' : x[1]}))
         index_name = MatchFirst(python_string)
         # Add the index to the frame object
-        index_name.setParseAction(lambda x : self.frame.update({'index' : x[0]}))
+        index_name.setParseAction(lambda x : cls._current.frame.update({'index' : x[0]}))
         resource_id = Regex(r'("(?:[a-zA-Z0-9\$_-])*"|\'(?:[a-zA-Z0-9\$_-]*)\')').setParseAction(removeQuotes)
         collection_id = resource_id
 
@@ -118,9 +142,9 @@ class QueryLanguage(object):
         # <to-statement>   ::= "TO" <number>
         #--------------------------------------------------------------------------------------
         from_statement = CaselessLiteral("FROM") + number
-        from_statement.setParseAction(lambda x : self.frame.update({'from' : x[1]}))
+        from_statement.setParseAction(lambda x : cls._current.frame.update({'from' : x[1]}))
         to_statement = CaselessLiteral("TO") + number
-        to_statement.setParseAction(lambda x : self.frame.update({'to' : x[1]}))
+        to_statement.setParseAction(lambda x : cls._current.frame.update({'to' : x[1]}))
 
 
         #--------------------------------------------------------------------------------------
@@ -128,45 +152,45 @@ class QueryLanguage(object):
         # <date-to-statement>   ::= "TO" <date>
         #--------------------------------------------------------------------------------------
         date_from_statement = CaselessLiteral("FROM") + date
-        date_from_statement.setParseAction(lambda x : self.frame.update({'from' : x[1]}))
+        date_from_statement.setParseAction(lambda x : cls._current.frame.update({'from' : x[1]}))
         date_to_statement = CaselessLiteral("TO") + date
-        date_to_statement.setParseAction(lambda x : self.frame.update({'to' : x[1]}))
+        date_to_statement.setParseAction(lambda x : cls._current.frame.update({'to' : x[1]}))
 
 
         #--------------------------------------------------------------------------------------
         # <time-query> ::= "TIME FROM" <date> "TO" <date>
         #--------------------------------------------------------------------------------------
         time_query = CaselessLiteral("TIME") + Optional(date_from_statement) + Optional(date_to_statement)
-        time_query.setParseAction(lambda x : self.time_frame())
+        time_query.setParseAction(lambda x : cls._current.time_frame())
            # time.mktime(dateutil.parser.parse(x[2])), 'to':time.mktime(dateutil.parser.parse(x[4]))}}))
 
         #--------------------------------------------------------------------------------------
         # <time-bounds> ::= "TIMEBOUNDS" <from-statement> <to-statement>
         #--------------------------------------------------------------------------------------
         time_bounds = CaselessLiteral("TIMEBOUNDS") + date_from_statement + date_to_statement
-        time_bounds.setParseAction(lambda x : self.time_bounds_frame())
+        time_bounds.setParseAction(lambda x : cls._current.time_bounds_frame())
 
         #--------------------------------------------------------------------------------------
         # <vertical-bounds> ::= "VERTICAL" <from-statement> <to-statement>        
         #--------------------------------------------------------------------------------------
         vertical_bounds = CaselessLiteral("VERTICAL") + from_statement + to_statement
-        vertical_bounds.setParseAction(lambda x : self.vertical_bounds_frame())
+        vertical_bounds.setParseAction(lambda x : cls._current.vertical_bounds_frame())
         
         #--------------------------------------------------------------------------------------
         # <range-query>  ::= "VALUES" [<from-statement>] [<to-statement>]
         #--------------------------------------------------------------------------------------
         range_query = CaselessLiteral("VALUES") + Optional(from_statement) + Optional(to_statement)
         # Add the range to the frame object
-        range_query.setParseAction(lambda x : self.range_frame())
+        range_query.setParseAction(lambda x : cls._current.range_frame())
 
         #--------------------------------------------------------------------------------------
         # <geo-distance> ::= "DISTANCE" <distance> "FROM" <coords>
         # <geo-bbox>     ::= "BOX" "TOP-LEFT" <coords> "BOTTOM-RIGHT" <coords>
         #--------------------------------------------------------------------------------------
         geo_distance = CaselessLiteral("DISTANCE") + distance + CaselessLiteral("FROM") + coords
-        geo_distance.setParseAction(lambda x : self.frame.update({'lat': float(x[5]), 'lon':float(x[7])}))
+        geo_distance.setParseAction(lambda x : cls._current.frame.update({'lat': float(x[5]), 'lon':float(x[7])}))
         geo_bbox = CaselessLiteral("BOX") + CaselessLiteral("TOP-LEFT") + coords + CaselessLiteral("BOTTOM-RIGHT") + coords
-        geo_bbox.setParseAction(lambda x : self.frame.update({'top_left':[float(x[5]),float(x[3])], 'bottom_right':[float(x[10]),float(x[8])]}))
+        geo_bbox.setParseAction(lambda x : cls._current.frame.update({'top_left':[float(x[5]),float(x[3])], 'bottom_right':[float(x[10]),float(x[8])]}))
 
         #--------------------------------------------------------------------------------------
         # <field-query>  ::= <wildcard-string>
@@ -177,14 +201,14 @@ class QueryLanguage(object):
         #--------------------------------------------------------------------------------------
         field_query = wildcard_string
         term_query = CaselessLiteral("IS") + field_query
-        term_query.setParseAction(lambda x : self.frame.update({'value':x[1]}))
+        term_query.setParseAction(lambda x : cls._current.frame.update({'value':x[1]}))
         
         geo_query = CaselessLiteral("GEO") + ( geo_distance | geo_bbox )
 
         fuzzy_query = CaselessLiteral("LIKE") + field_query
-        fuzzy_query.setParseAction(lambda x : self.frame.update({'fuzzy':x[1]}))
+        fuzzy_query.setParseAction(lambda x : cls._current.frame.update({'fuzzy':x[1]}))
         match_query = CaselessLiteral("MATCH") + field_query
-        match_query.setParseAction(lambda x : self.frame.update({'match':x[1]}))
+        match_query.setParseAction(lambda x : cls._current.frame.update({'match':x[1]}))
 
         #--------------------------------------------------------------------------------------
         # <limit-parameter>  ::= "LIMIT" <integer>
@@ -194,13 +218,13 @@ class QueryLanguage(object):
         # <query-parameter>  ::= <order-paramater> | <limit-parameter>
         #--------------------------------------------------------------------------------------
         limit_parameter = CaselessLiteral("LIMIT") + integer
-        limit_parameter.setParseAction(lambda x: self.frame.update({'limit' : int(x[1])}))
+        limit_parameter.setParseAction(lambda x: cls._current.frame.update({'limit' : int(x[1])}))
         depth_parameter = CaselessLiteral("DEPTH") + integer
-        depth_parameter.setParseAction(lambda x: self.frame.update({'depth' : int(x[1])}))
+        depth_parameter.setParseAction(lambda x: cls._current.frame.update({'depth' : int(x[1])}))
         order_parameter = CaselessLiteral("ORDER") + CaselessLiteral("BY") + limited_string
-        order_parameter.setParseAction(lambda x: self.frame.update({'order' : {x[2] : 'asc'}}))
+        order_parameter.setParseAction(lambda x: cls._current.frame.update({'order' : {x[2] : 'asc'}}))
         offset_parameter = CaselessLiteral("SKIP") + integer
-        offset_parameter.setParseAction(lambda x : self.frame.update({'offset' : int(x[1])}))
+        offset_parameter.setParseAction(lambda x : cls._current.frame.update({'offset' : int(x[1])}))
         query_parameter = limit_parameter | order_parameter | offset_parameter
 
         #--------------------------------------------------------------------------------------
@@ -212,14 +236,14 @@ class QueryLanguage(object):
         #--------------------------------------------------------------------------------------
         search_query = CaselessLiteral("SEARCH") + field + (range_query | term_query | fuzzy_query | match_query | vertical_bounds | time_bounds | time_query | geo_query) + CaselessLiteral("FROM") + index_name + query_parameter*(0,None)
         # Add the field to the frame object
-        search_query.setParseAction(lambda x : self.frame.update({'field' : x[1]}))
+        search_query.setParseAction(lambda x : cls._current.frame.update({'field' : x[1]}))
         collection_query = CaselessLiteral("IN") + collection_id
-        collection_query.setParseAction(lambda x : self.frame.update({'collection': x[1]}))
+        collection_query.setParseAction(lambda x : cls._current.frame.update({'collection': x[1]}))
         association_query = CaselessLiteral("BELONGS") + CaselessLiteral("TO") + resource_id + Optional(depth_parameter)
         # Add the association to the frame object
-        association_query.setParseAction(lambda x : self.frame.update({'association':x[2]}))
+        association_query.setParseAction(lambda x : cls._current.frame.update({'association':x[2]}))
         owner_query = CaselessLiteral("HAS") + resource_id + Optional(depth_parameter)
-        owner_query.setParseAction(lambda x : self.frame.update({'owner':x[1]}))
+        owner_query.setParseAction(lambda x : cls._current.frame.update({'owner':x[1]}))
         query = search_query | association_query | collection_query | owner_query
 
         #--------------------------------------------------------------------------------------
@@ -231,16 +255,16 @@ class QueryLanguage(object):
         #--------------------------------------------------------------------------------------
         primary_query = query + Optional(query_filter)
         # Set the primary query on the json_query to the frame and clear the frame
-        primary_query.setParseAction(lambda x : self.push_frame())
+        primary_query.setParseAction(lambda x : cls._current.push_frame())
         atom = query
         intersection = CaselessLiteral("AND") + atom
         # Add an AND operation to the json_query and clear the frame
-        intersection.setParseAction(lambda x : self.and_frame())
+        intersection.setParseAction(lambda x : cls._current.and_frame())
         union = CaselessLiteral("OR") + atom
         # Add an OR operation to the json_query and clear the frame
-        union.setParseAction(lambda x : self.or_frame())
+        union.setParseAction(lambda x : cls._current.or_frame())
 
-        self.sentence = primary_query + (intersection ^ union)*(0,None)
+        return primary_query + (intersection ^ union)*(0,None)
 
     def push_frame(self):
         self.json_query['query'] = self.frame
@@ -304,16 +328,49 @@ class QueryLanguage(object):
     def parse(self, s):
         '''
         Parses string s and returns a json_query object, self.tokens is set to the tokens
+        The results of the recently parsed strings are cached.
         '''
-        self.json_query = {'query':{}, 'and': [], 'or': []}
-        self.frame = {}
-        try:
-            self.tokens = self.sentence.parseString(s)
-        except ParseException as e:
-            raise BadRequest('%s' % e)
-
+        with self._parse_lock:
+            try:
+                json_query, tokens = self._parse_cache.pop(s)
+                self._stats['hits'] += 1
+            except KeyError:
+                self._stats['misses'] += 1
+                json_query, tokens = self._parse(s)
+            if self._cache_limit > 0:
+                while len(self._parse_cache) >= self._cache_limit:
+                    self._parse_cache.popitem(last=False)
+                self._parse_cache[s] = (json_query, tokens)
+        # The caller may modify the query
+        self.json_query = copy.deepcopy(json_query)
+        self.tokens = tokens
         return self.json_query
 
+    def _parse(self, s):
+        grammar = self.grammar()
+        with self._parse_lock:
+            QueryLanguage._current = self
+            self.json_query = {'query':{}, 'and': [], 'or': []}
+            self.frame = {}
+            try:
+                tokens = grammar.parseString(s)
+            except ParseException as e:
+                raise BadRequest('%s' % e)
+            finally:
+                QueryLanguage._current = None
+        return self.json_query, tokens
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._parse_lock:
+            cls._parse_cache.clear()
+            cls._stats.clear()
+
+    @classmethod
+    def stats(cls):
+        with cls._parse_lock:
+            return dict(cls._stats, cached=len(cls._parse_cache))
+
     #=========================================
     # Methods for checking the requests
     #=========================================
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/query_language_benchmark.py
+@description Discovery query parse throughput benchmark
+
+Parses a set of discovery queries the way QueryLanguage did before the
+grammar was shared (building the grammar for every parse), with the shared
+grammar and with the parse cache, no container is needed.
+
+    bin/python ion/services/dm/utility/query_language_benchmark.py --repeat 50
+'''
+
+from ion.services.dm.utility.query_language import QueryLanguage
+
+import time
+
+
+QUERIES = ["search 'model' is 'abc*' from 'models' and belongs to 'platformDeviceID'",
+           "search 'runtime' values from 1. to 100 from 'devices' and belongs to 'RSN'",
+           "search 'model' is 'sbc*' from 'devices' order by 'name' limit 30 and belongs to 'platformDeviceID'",
+           "search 'location' geo distance 20 km from lat 20 lon 30 from 'index'"]
+
+
+class QueryParseBenchmark(object):
+    '''
+    Runs a single benchmark configuration:
+      repeat - Times each of the queries is parsed
+    '''
+    MODES = ('rebuild', 'shared', 'cached')
+
+    def __init__(self, repeat=50, queries=None):
+        self.repeat  = repeat
+        self.queries = queries or QUERIES
+
+    def parse_all(self, queries, mode):
+        '''
+        Returns the parse results and the time it took
+        '''
+        QueryLanguage.clear_cache()
+        results = []
+        start = time.time()
+        for query in queries:
+            if mode == 'rebuild':
+                QueryLanguage._grammar = None
+            results.append(QueryLanguage().parse(query))
+        return results, time.time() - start
+
+    def run(self):
+        queries = self.queries * self.repeat
+        report = {'parses': len(queries), 'modes': {}}
+        results = {}
+        grammar, cache_limit = QueryLanguage._grammar, QueryLanguage._cache_limit
+        try:
+            QueryLanguage._grammar = None
+            for mode in self.MODES:
+                QueryLanguage._cache_limit = cache_limit if mode == 'cached' else 0
+                results[mode], elapsed = self.parse_all(queries, mode)
+                report['modes'][mode] = {'elapsed'       : elapsed,
+                                         'parses_per_s'  : len(queries) / max(elapsed, 1e-9)}
+        finally:
+            QueryLanguage._grammar, QueryLanguage._cache_limit = grammar, cache_limit
+        QueryLanguage.clear_cache()
+        report['matches'] = results['rebuild'] == results['shared'] == results['cached']
+        return report
+
+    @classmethod
+    def format_report(cls, report):
+        lines = ['%(parses)s parses, results match: %(matches)s' % report]
+        for mode in cls.MODES:
+            lines.append('  %-8s %.4fs  %.1f parses/s' % (mode, report['modes'][mode]['elapsed'], report['modes'][mode]['parses_per_s']))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__': # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Discovery query parse throughput benchmark')
+    parser.add_argument('--repeat', type=int, default=50, help='times each query is parsed (default: 50)')
+    opts = parser.parse_args()
+
+    print QueryParseBenchmark.format_report(QueryParseBenchmark(repeat=opts.repeat).run())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/test/test_coverage_pool.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+from ion.services.dm.utility.coverage_pool import CoveragePool
+
+import gevent
+
+
+@attr('UNIT',group='dm')
+class CoveragePoolTest(PyonTestCase):
+    def setUp(self):
+        CoveragePool.clear()
+        self.addCleanup(CoveragePool.clear)
+        patcher = patch.object(CoveragePool, '_load', side_effect=lambda *args: Mock())
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(CoveragePool, '_max_open', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_handles(self):
+        cov = CoveragePool.acquire('ds1')
+        self.assertTrue(CoveragePool.acquire('ds1') is cov)
+        self.assertFalse(CoveragePool.acquire('ds1', mode='a') is cov)
+        self.assertEquals(self.load.call_count, 2)
+
+        CoveragePool.release(cov)
+        CoveragePool.release(cov)
+        self.assertFalse(cov.close.called)
+
+    def test_root_path(self):
+        cov = CoveragePool.acquire('ds1')
+        self.assertFalse(CoveragePool.acquire('ds1', root_path='/tmp/a') is cov)
+        self.assertTrue(CoveragePool.acquire('ds1', root_path='/tmp/a') is CoveragePool.acquire('ds1', root_path='/tmp/a'))
+        self.assertEquals(self.load.call_count, 2)
+
+        # The datasets directory is the default root path
+        with patch.object(CoveragePool, '_datasets_root', return_value='/tmp/datasets'):
+            self.assertTrue(CoveragePool.acquire('ds1', root_path='/tmp/datasets/') is cov)
+            self.assertEquals(CoveragePool.key('ds1', root_path='/tmp/datasets'), CoveragePool.key('ds1'))
+        self.assertEquals(self.load.call_count, 2)
+
+    def test_load_outside_the_lock(self):
+        def pool_locked():
+            def try_lock():
+                if CoveragePool._pool_lock.acquire(blocking=False):
+                    CoveragePool._pool_lock.release()
+                    return False
+                return True
+            return gevent.spawn(try_lock).get()
+
+        loaded = []
+        def load(*args):
+            self.assertFalse(pool_locked())
+            cov = Mock()
+            loaded.append(cov)
+            if len(loaded) == 1:
+                # The same handle is loaded by another reader meanwhile
+                self.assertTrue(CoveragePool.acquire('ds1') is loaded[1])
+            return cov
+        self.load.side_effect = load
+        races = CoveragePool.stats().get('races', 0)
+
+        cov = CoveragePool.acquire('ds1')
+        # The handle pooled first is kept, the other one is closed
+        self.assertTrue(cov is loaded[1])
+        self.assertTrue(loaded[0].close.called)
+        self.assertFalse(loaded[1].close.called)
+        self.assertEquals(CoveragePool.stats()['races'], races + 1)
+
+    def test_eviction(self):
+        covs = [CoveragePool.acquire(ds) for ds in ('ds1', 'ds2', 'ds3')]
+        # All the handles are in use, none can be closed
+        self.assertFalse(any(c.close.called for c in covs))
+        for cov in covs:
+            CoveragePool.release(cov)
+        self.assertTrue(covs[0].close.called)
+        self.assertFalse(covs[2].close.called)
+        self.assertEquals(CoveragePool.stats()['open'], 2)
+
+    def test_invalidation(self):
+        reader = CoveragePool.acquire('ds1')
+        writer = CoveragePool.acquire('ds1', mode='a')
+        CoveragePool._dataset_modified(Mock(origin='ds1'))
+        # The reader is still in use
+        self.assertFalse(reader.close.called)
+        self.assertFalse(CoveragePool.acquire('ds1') is reader)
+        CoveragePool.release(reader)
+        self.assertTrue(reader.close.called)
+        self.assertTrue(CoveragePool.acquire('ds1', mode='a') is writer)
+
+    def test_discard_on_error(self):
+        with self.assertRaises(ValueError):
+            with CoveragePool.coverage('ds1') as cov:
+                raise ValueError()
+        self.assertTrue(cov.close.called)
+        self.assertFalse(CoveragePool.acquire('ds1') is cov)
+
+    def test_unpooled_release(self):
+        cov = Mock()
+        CoveragePool.release(cov)
+        self.assertTrue(cov.close.called)
@@ -65,7 +65,7 @@ class RecordDictionaryIntegrationTest(IonIntegrationTestCase):
         def verifier(msg, route, stream_id):
             for k,v in msg.record_dictionary.iteritems():
                 if v is not None:
-                    self.assertIsInstance(v, np.ndarray)
+                    self.assertIsInstance(RecordDictionaryTool.decode_values(v), np.ndarray)
             rdt = RecordDictionaryTool.load_from_granule(msg)
             for field in rdt.fields:
                 self.assertIsInstance(rdt[field], np.ndarray)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/test/test_query_language_benchmark.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from nose.plugins.attrib import attr
+
+from ion.services.dm.utility.query_language_benchmark import QueryParseBenchmark
+
+
+@attr('UTIL',group='dm')
+class QueryParseBenchmarkTest(PyonTestCase):
+    def test_benchmark(self):
+        report = QueryParseBenchmark(repeat=50).run()
+        log.info('\n%s', QueryParseBenchmark.format_report(report))
+
+        self.assertTrue(report['matches'])
+        self.assertEquals(report['parses'], 200)
+        modes = report['modes']
+        self.assertLess(modes['shared']['elapsed'], modes['rebuild']['elapsed'])
+        self.assertLess(modes['cached']['elapsed'], modes['shared']['elapsed'])
@@ -37,6 +37,7 @@ from ion.util.agent_launcher import AgentLauncher
 from ion.util.module_uploader import RegisterModulePreparerEgg
 from ion.util.qa_doc_parser import QADocParser
 from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryClient
+from ion.util.memoizing_resource_registry_client import memoized_resource_registry
 from ion.util.resource_lcs_policy import AgentPolicy, ResourceLCSPolicy, ModelPolicy, DevicePolicy
 
 from interface.objects import AttachmentType, ComputedValueAvailability, ProcessDefinition, ComputedDictValue
@@ -1540,6 +1541,13 @@ class InstrumentManagementService(BaseInstrumentManagementService):
         @throws BadRequest    A parameter is missing
         @throws NotFound    An object with the specified instrument_device_id does not exist
         """
+        with memoized_resource_registry(self, 'ims.instrument_device_extension') as memo:
+            # most of the extension's associations are those of the device itself
+            memo.prefetch_objects([instrument_device_id])
+            memo.prefetch_subjects([instrument_device_id])
+            return self._get_instrument_device_extension(instrument_device_id, ext_associations, ext_exclude, user_id)
+
+    def _get_instrument_device_extension(self, instrument_device_id='', ext_associations=None, ext_exclude=None, user_id=''):
         t = Timer() if stats.is_log_enabled() else None
         if not instrument_device_id:
             raise BadRequest("The instrument_device_id parameter is empty")
@@ -1707,6 +1715,12 @@ class InstrumentManagementService(BaseInstrumentManagementService):
     def get_platform_device_extension(self, platform_device_id='', ext_associations=None, ext_exclude=None, user_id=''):
         """Returns an PlatformDeviceExtension object containing additional related information
         """
+        with memoized_resource_registry(self, 'ims.platform_device_extension') as memo:
+            memo.prefetch_objects([platform_device_id])
+            memo.prefetch_subjects([platform_device_id])
+            return self._get_platform_device_extension(platform_device_id, ext_associations, ext_exclude, user_id)
+
+    def _get_platform_device_extension(self, platform_device_id='', ext_associations=None, ext_exclude=None, user_id=''):
         t = Timer() if stats.is_log_enabled() else None
 
         RR2 = EnhancedResourceRegistryClient(self.clients.resource_registry)
@@ -1836,7 +1850,7 @@ class InstrumentManagementService(BaseInstrumentManagementService):
         if t:
             t.complete_step('ims.platform_device_extension.top')
         net_stats, ancestors = rollx_builder.get_network_hierarchy(top_platformnode_id,
-                                                                   lambda x: self.agent_status_builder.get_aggregate_status_of_device(x))
+                                                                   device_vals_fn=self.agent_status_builder.get_aggregate_status_of_devices)
         if t:
             t.complete_step('ims.platform_device_extension.hierarchy')
         extended_platform.computed.rsn_network_child_device_status = ComputedDictValue(value=net_stats,
@@ -1850,7 +1864,7 @@ class InstrumentManagementService(BaseInstrumentManagementService):
             extended_platform.computed.rsn_network_rollup = ComputedDictValue(status=ComputedValueAvailability.NOTAVAILABLE,
                                                                               reason="Could not find parent network node")
         else:
-            parent_node_statuses = [self.agent_status_builder.get_status_of_device(x) for x in parent_node_device_ids]
+            parent_node_statuses = self.agent_status_builder.get_status_of_devices(parent_node_device_ids)
             rollup_values = {}
             for astkey, astname in AggregateStatusType._str_map.iteritems():
                 log.debug("collecting all %s values to crush", astname)
@@ -100,11 +100,14 @@ class RollXBuilder(object):
         return dict([(s, site_val_fn(s)) for s in full_list]), acc
 
 
-    def get_network_hierarchy(self, device_id, device_val_fn):
+    def get_network_hierarchy(self, device_id, device_val_fn=None, device_vals_fn=None):
         """
         return (child_devices, device_ancestors)
         where child_devices is a dict mapping all child device ids to the value of device_val_fn(child_device_id)
           and device_ancestors is a dict mapping all device ids to a list of their children as per
+
+        device_vals_fn can be given instead of device_val_fn, it maps the list of all child device ids to
+        the list of their values in one call
         """
 
         if not self.RR2.has_cached_predicate(PRED.hasNetworkParent):
@@ -122,4 +125,6 @@ class RollXBuilder(object):
 
         _get_ancestors_h(device_id)
 
+        if device_vals_fn:
+            return dict(zip(full_list, device_vals_fn(full_list))), acc
         return dict([(d, device_val_fn(d)) for d in full_list]), acc
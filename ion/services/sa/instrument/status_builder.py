@@ -8,13 +8,20 @@ from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryC
 from ooi.logging import log
 from pyon.agent.agent import ResourceAgentClient
 from pyon.core.bootstrap import IonObject
-from pyon.core.exception import NotFound, Unauthorized, BadRequest
+from pyon.core.exception import NotFound, Unauthorized, BadRequest, Timeout
+from pyon.public import CFG
 
 from interface.objects import ComputedValueAvailability, ComputedIntValue, ComputedDictValue, ComputedListValue
 from interface.objects import AggregateStatusType, DeviceStatusType
 from pyon.ion.resource import RT, PRED
 from pyon.util.containers import DotDict
 
+from functools import partial
+import gevent
+import gevent.coros
+import gevent.pool
+import time
+
 # possible ways of determining the type of a device driver
 DriverTypingMethod = DotDict()
 DriverTypingMethod.ByRR = 1
@@ -22,6 +29,17 @@ DriverTypingMethod.ByAgent = 2
 DriverTypingMethod.ByException = 3
 
 class AgentStatusBuilder(object):
+    """
+    Agents of several devices are queried concurrently, at most AGENT_POOL_SIZE agent calls of a builder are in
+    progress at once however the queries are nested.  An agent that
+    doesn't answer within AGENT_TIMEOUT seconds is considered unreachable, and its status unknown, for the
+    next UNREACHABLE_TTL seconds.
+    """
+    AGENT_POOL_SIZE = CFG.get_safe('service.agent_status_builder.agent_pool_size', 8)
+    AGENT_TIMEOUT   = CFG.get_safe('service.agent_status_builder.agent_timeout', 5)
+    UNREACHABLE_TTL = CFG.get_safe('service.agent_status_builder.unreachable_ttl', 30)
+
+    _unreachable = {} # device id -> time until which its agent is considered unreachable
 
     def __init__(self, process=None):
         """
@@ -35,6 +53,9 @@ class AgentStatusBuilder(object):
         # make an internal pointer to this function so we can Mock it for testing
         self._get_agent_client = ResourceAgentClient
 
+        # bounds the agent calls of all the fan outs together
+        self._agent_calls = gevent.coros.BoundedSemaphore(self.AGENT_POOL_SIZE)
+
         if DriverTypingMethod.ByRR == self.dtm:
             self.RR2 = EnhancedResourceRegistryClient(process.clients.resource_registry)
 
@@ -68,6 +89,9 @@ class AgentStatusBuilder(object):
         if not device_id or device_id is None:
             return None, "No device ID was provided"
 
+        if self._unreachable.get(device_id, 0) > time.time():
+            return None, "Agent instance did not respond recently -- status unknown"
+
         try:
             h_agent = self._get_agent_client(device_id, process=self.process)
             log.debug("got the agent client here: %s for the device id: %s and process: %s",
@@ -92,36 +116,106 @@ class AgentStatusBuilder(object):
             log.warn('no agent for device %s, reason=%s', device_id, reason)
             return None, reason
 
-        # read child agg status
-        try:
-            #retrieve the platform status from the platform agent
-            this_status = h_agent.get_agent(['aggstatus'])['aggstatus']
-            log.debug("this_status for %s is %s", device_id, this_status)
+        # find out whether child_agg_status is needed, so that both statuses can be read together
+        with_children = True
+        if DriverTypingMethod.ByAgent == self.dtm:
+            # we're done if the agent doesn't support child_agg_status
+            capabilities = self._call_agent(device_id, h_agent.get_capabilities)
+            if None is capabilities:
+                return None, "Agent instance did not respond -- status unknown"
+            with_children = "child_agg_status" in [c.name for c in capabilities]
+        elif DriverTypingMethod.ByRR == self.dtm:
+            device_obj = self.RR2.read(device_id)
+            with_children = RT.PlatformDevice == device_obj._get_type()
 
-        except Unauthorized:
+        params = ['aggstatus', 'child_agg_status'] if with_children else ['aggstatus']
+        values = self._fan_out(partial(self._get_agent_param, device_id, h_agent), params)
+
+        # read child agg status
+        #retrieve the platform status from the platform agent
+        this_status, error = values['aggstatus']
+        if "denied" == error:
             log.warn("The requester does not have the proper role to access the status of this agent")
             return None, "InstrumentDevice(get_agent) has been denied"
+        elif error:
+            return None, "Agent instance did not respond -- status unknown"
+        log.debug("this_status for %s is %s", device_id, this_status)
 
         out_status = {device_id: this_status}
 
-        if DriverTypingMethod.ByAgent == self.dtm:
-            # we're done if the agent doesn't support child_agg_status
-            if not "child_agg_status" in [c.name for c in h_agent.get_capabilities()]:
-                return out_status, None
-        elif DriverTypingMethod.ByRR == self.dtm:
-            device_obj = self.RR2.read(device_id)
-            if RT.PlatformDevice != device_obj._get_type():
-                return out_status, None
-
-        try:
-            child_agg_status = h_agent.get_agent(['child_agg_status'])['child_agg_status']
-            log.debug('get_cumulative_status_dict child_agg_status : %s', child_agg_status)
-            if child_agg_status:
-                out_status.update(child_agg_status)
+        if not with_children:
             return out_status, None
-        except Unauthorized:
+
+        child_agg_status, error = values['child_agg_status']
+        if "denied" == error:
             log.warn("The requester does not have the proper role to access the child_agg_status of this agent")
             return out_status, "Error getting child status: 'child_agg_status' has been denied"
+        elif error:
+            return out_status, "Error getting child status: agent did not respond"
+        log.debug('get_cumulative_status_dict child_agg_status : %s', child_agg_status)
+        if child_agg_status:
+            out_status.update(child_agg_status)
+        return out_status, None
+
+    def get_cumulative_status_dicts(self, device_ids):
+        """
+        get_cumulative_status_dict for several devices, their agents are queried concurrently
+        returns a dict of device_id -> (status dict or None, reason)
+        """
+        return self._fan_out(self.get_cumulative_status_dict, device_ids)
+
+
+    # -------------------------------------------------------------------------
+    # Agent access
+
+    def _fan_out(self, fn, keys):
+        """
+        returns a dict of key -> fn(key), computed by a bounded pool of greenlets; the agent calls they make are
+        bounded by _call_agent
+        """
+        keys = list(keys)
+        if len(keys) < 2:
+            return dict((k, fn(k)) for k in keys)
+        pool = gevent.pool.Pool(min(self.AGENT_POOL_SIZE, len(keys)))
+        return dict(zip(keys, pool.map(fn, keys)))
+
+    def _call_agent(self, device_id, fn, *args, **kwargs):
+        """
+        call the agent of a device; if it doesn't respond within AGENT_TIMEOUT, remember it as unreachable and
+        return None.  Waiting for one of the AGENT_POOL_SIZE call slots doesn't count toward the timeout.
+        """
+        self._agent_calls.acquire()
+        try:
+            timeout = gevent.Timeout(self.AGENT_TIMEOUT)
+            timeout.start()
+            try:
+                return fn(*args, **kwargs)
+            except gevent.Timeout as t:
+                if t is not timeout:
+                    raise
+            except Timeout:
+                pass
+            finally:
+                timeout.cancel()
+        finally:
+            self._agent_calls.release()
+
+        log.warn("Agent of device %s did not respond within %s seconds, considered unreachable for %s seconds",
+                 device_id, self.AGENT_TIMEOUT, self.UNREACHABLE_TTL)
+        self._unreachable[device_id] = time.time() + self.UNREACHABLE_TTL
+        return None
+
+    def _get_agent_param(self, device_id, h_agent, param):
+        """
+        returns (value, error) for an agent parameter, error is None, "denied" or "unreachable"
+        """
+        try:
+            values = self._call_agent(device_id, h_agent.get_agent, [param])
+        except Unauthorized:
+            return None, "denied"
+        if None is values:
+            return None, "unreachable"
+        return values[param], None
 
 
     #return this aggregate status, reason for fail, dict of device_id -> agg status
@@ -257,7 +351,10 @@ class AgentStatusBuilder(object):
         if None is a_client:
             return None, reason
 
-        aggstatus = a_client.get_agent(['aggstatus'])['aggstatus']
+        values = self._call_agent(device_id, a_client.get_agent, ['aggstatus'])
+        if None is values:
+            return None, "Agent instance did not respond -- status unknown"
+        aggstatus = values['aggstatus']
         log.debug('get_aggregate_status_of_device status: %s', aggstatus)
         return aggstatus, ""
 
@@ -267,6 +364,13 @@ class AgentStatusBuilder(object):
             status = {}
         return status
 
+    def get_status_of_devices(self, device_ids):
+        """
+        get_status_of_device for several devices, in the same order, their agents are queried concurrently
+        """
+        statuses = self._fan_out(self.get_status_of_device, device_ids)
+        return [statuses[device_id] for device_id in device_ids]
+
 
     def get_aggregate_status_of_device(self, device_id):
         if  device_id is not None and type("") != type(device_id):
@@ -281,4 +385,9 @@ class AgentStatusBuilder(object):
         else:
             return self._crush_status_dict(aggstatus)
 
-
+    def get_aggregate_status_of_devices(self, device_ids):
+        """
+        get_aggregate_status_of_device for several devices, in the same order, their agents are queried concurrently
+        """
+        statuses = self._fan_out(self.get_aggregate_status_of_device, device_ids)
+        return [statuses[device_id] for device_id in device_ids]
@@ -13,14 +13,17 @@ from ion.services.sa.instrument.status_builder import AgentStatusBuilder, Driver
 from ion.services.sa.observatory.observatory_management_service import ObservatoryManagementService
 from ion.services.sa.test.helpers import any_old
 from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryClient
-from mock import Mock
+from mock import Mock, patch
 from nose.plugins.attrib import attr
 
 from ooi.logging import log
 
 
 #from pyon.core.exception import BadRequest, Conflict, Inconsistent, NotFound
+import gevent
+import time
 import unittest
+from pyon.core.bootstrap import IonObject
 from pyon.core.exception import Unauthorized, NotFound
 from pyon.ion.resource import RT, PRED
 from pyon.util.containers import DotDict
@@ -54,6 +57,37 @@ class FakeAgent(object):
         return "FAKE"
 
 
+class InFlight(object):
+    """
+    counts the calls in progress, and the most seen at once
+    """
+    def __init__(self):
+        self.current = 0
+        self.most = 0
+
+    def enter(self):
+        self.current += 1
+        self.most = max(self.most, self.current)
+
+    def exit(self):
+        self.current -= 1
+
+
+class FakeAgentSlow(FakeAgent):
+    def __init__(self, delay, in_flight=None):
+        FakeAgent.__init__(self)
+        self.delay = delay
+        self.in_flight = in_flight or InFlight()
+
+    def get_agent(self, cmds):
+        self.in_flight.enter()
+        try:
+            gevent.sleep(self.delay)
+        finally:
+            self.in_flight.exit()
+        return FakeAgent.get_agent(self, cmds)
+
+
 class FakeAgentErroring(FakeAgent):
     def __init__(self, exn):
         self.exn = exn
@@ -71,6 +105,8 @@ class TestAgentStatusBuilder(PyonTestCase):
 
     def setUp(self):
         self.ASB = AgentStatusBuilder(Mock())
+        AgentStatusBuilder._unreachable.clear()
+        self.addCleanup(AgentStatusBuilder._unreachable.clear)
 
 
     def test_crush_list(self):
@@ -181,6 +217,58 @@ class TestAgentStatusBuilder(PyonTestCase):
 
 
 
+    def test_get_cumulative_status_dicts(self):
+        statusd = {AggregateStatusType.AGGREGATE_COMMS: DeviceStatusType.STATUS_OK}
+        agents = {}
+        in_flight = InFlight()
+        for device_id in ["p1", "p2", "i1"]:
+            agents[device_id] = FakeAgentSlow(0.01, in_flight)
+            agents[device_id].set_agent("aggstatus", statusd)
+        agents["p1"].set_agent("child_agg_status", {"i1": statusd})
+
+        def status_builder():
+            asb = AgentStatusBuilder(Mock())
+            asb._get_agent_client = lambda device_id, **kwargs: agents[device_id]
+            asb.RR2 = Mock()
+            asb.RR2.read.side_effect = lambda device_id: IonObject(RT.InstrumentDevice if "i" in device_id else RT.PlatformDevice)
+            return asb
+
+        statuses = status_builder().get_cumulative_status_dicts(["p1", "p2", "i1"])
+        # all the agents are asked at the same time, the platforms for their status and their children's
+        self.assertEqual(5, in_flight.most)
+        self.assertEqual(0, in_flight.current)
+        self.assertEqual(({"p1": statusd, "i1": statusd}, None), statuses["p1"])
+        self.assertEqual(({"p2": statusd}, None), statuses["p2"])
+        self.assertEqual(({"i1": statusd}, None), statuses["i1"])
+
+        # but no more than AGENT_POOL_SIZE calls at once, however they're nested
+        in_flight.most = 0
+        with patch.object(AgentStatusBuilder, 'AGENT_POOL_SIZE', 2):
+            asb = status_builder()
+        self.assertEqual(statuses, asb.get_cumulative_status_dicts(["p1", "p2", "i1"]))
+        self.assertEqual(2, in_flight.most)
+
+    def test_unreachable_agent(self):
+        slow_agent = FakeAgentSlow(1)
+        slow_agent.set_agent("aggstatus", {})
+        get_agent_client = Mock(return_value=slow_agent)
+        self.ASB._get_agent_client = get_agent_client
+        self.ASB.RR2 = Mock()
+        self.ASB.RR2.read.return_value = IonObject(RT.InstrumentDevice)
+
+        with patch.object(AgentStatusBuilder, 'AGENT_TIMEOUT', 0.1):
+            status, reason = self.ASB.get_cumulative_status_dict("slow")
+        self.assertIsNone(status)
+        self.assertNotEqual("", reason)
+        self.assertEqual([None], self.ASB.get_aggregate_status_of_devices(["slow"]))
+        # the agent isn't asked again for a while
+        self.assertEqual(1, get_agent_client.call_count)
+
+        AgentStatusBuilder._unreachable["slow"] = time.time() - 1
+        self.ASB.get_device_agent("slow")
+        self.assertEqual(2, get_agent_client.call_count)
+
+
 @attr('INT', group='sa')
 @unittest.skipIf(os.getenv('CEI_LAUNCH_TEST', False), 'Skip test while in CEI LAUNCH mode')
 class TestAgentStatusBuilderIntegration(IonIntegrationTestCase):
@@ -17,6 +17,7 @@ from ion.services.sa.instrument.rollx_builder import RollXBuilder
 from ion.services.sa.instrument.status_builder import AgentStatusBuilder
 from ion.services.sa.observatory.deployment_activator import DeploymentActivatorFactory, DeploymentResourceCollectorFactory
 from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryClient
+from ion.util.memoizing_resource_registry_client import memoized_resource_registry
 from ion.services.sa.observatory.observatory_util import ObservatoryUtil
 from ion.util.geo_utils import GeoUtils
 from ion.util.related_resources_crawler import RelatedResourcesCrawler
@@ -67,6 +68,15 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 #            reg_precondition(self, 'execute_instrument_site_lifecycle',
 #                             self.RR2.policy_fn_lcs_precondition("instrument_site_id"))
 
+    def on_start(self):
+        super(ObservatoryManagementService, self).on_start()
+        # self.outil lives as long as the service, keep its site topology current
+        self.outil.track_topology()
+
+    def _topology_changed(self, *resource_ids):
+        # Association changes made here don't publish resource events
+        self.outil.invalidate_topology(*resource_ids)
+
 
     def override_clients(self, new_clients):
         """
@@ -205,7 +215,9 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         return self.RR2.retire(observatory_id, RT.Observatory)
 
     def force_delete_observatory(self, observatory_id=''):
-        return self.RR2.pluck_delete(observatory_id, RT.Observatory)
+        ret = self.RR2.pluck_delete(observatory_id, RT.Observatory)
+        self._topology_changed(observatory_id)
+        return ret
 
 
 
@@ -259,6 +271,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
     def force_delete_subsite(self, subsite_id=''):
         self.RR2.pluck_delete(subsite_id, RT.Subsite)
+        self._topology_changed(subsite_id)
 
 
 
@@ -280,6 +293,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
         if parent_id:
             self.RR2.assign_site_to_one_site_with_has_site(platform_site_id, parent_id)
+            self._topology_changed(platform_site_id, parent_id)
 
         return platform_site_id
 
@@ -313,6 +327,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
     def force_delete_platform_site(self, platform_site_id=''):
         self.RR2.pluck_delete(platform_site_id, RT.PlatformSite)
+        self._topology_changed(platform_site_id)
 
 
     def create_instrument_site(self, instrument_site=None, parent_id=''):
@@ -332,6 +347,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
         if parent_id:
             self.RR2.assign_site_to_one_site_with_has_site(instrument_site_id, parent_id)
+            self._topology_changed(instrument_site_id, parent_id)
 
         return instrument_site_id
 
@@ -366,6 +382,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
     def force_delete_instrument_site(self, instrument_site_id=''):
         self.RR2.pluck_delete(instrument_site_id, RT.InstrumentSite)
+        self._topology_changed(instrument_site_id)
 
 
 
@@ -428,6 +445,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         """
 
         self.RR2.assign_site_to_site_with_has_site(child_site_id, parent_site_id)
+        self._topology_changed(child_site_id, parent_site_id)
 
 
     def unassign_site_from_site(self, child_site_id='', parent_site_id=''):
@@ -439,6 +457,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         """
 
         self.RR2.unassign_site_from_site_with_has_site(child_site_id, parent_site_id)
+        self._topology_changed(child_site_id, parent_site_id)
 
 
     def assign_device_to_site(self, device_id='', site_id=''):
@@ -450,6 +469,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         """
 
         self.RR2.assign_device_to_site_with_has_device(device_id, site_id)
+        self._topology_changed(device_id, site_id)
 
     def unassign_device_from_site(self, device_id='', site_id=''):
         """Disconnects a device (any type) from a site (any subtype)
@@ -460,6 +480,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         """
 
         self.RR2.unassign_device_from_site_with_has_device(device_id, site_id)
+        self._topology_changed(device_id, site_id)
 
 
     def assign_device_to_network_parent(self, child_device_id='', parent_device_id=''):
@@ -679,6 +700,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
                 if d in device_ids:
                     a = self.RR.get_association(s, PRED.hasDevice, d)
                     self.RR.delete_association(a)
+                    self._topology_changed(s, d)
 #
 #        # mark deployment as not deployed (developed seems appropriate)
 #        self.RR.execute_lifecycle_transition(deployment_id, LCE.DEVELOPED)
@@ -903,6 +925,12 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
     # TODO: Make every incoming call to this one
     def get_site_extension(self, site_id='', ext_associations=None, ext_exclude=None, user_id=''):
+        with memoized_resource_registry(self, 'oms.site_extension') as memo:
+            memo.prefetch_objects([site_id])
+            memo.prefetch_subjects([site_id])
+            return self._get_site_extension_by_type(site_id, ext_associations, ext_exclude, user_id)
+
+    def _get_site_extension_by_type(self, site_id='', ext_associations=None, ext_exclude=None, user_id=''):
         site_extension = None
 
         # Make a case decision on what what to do
@@ -984,7 +1012,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
             device_relations = outil.get_device_relations(site_ids)
 
             # Set parent immediate child sites
-            parent_site_ids = [a.s for a in RR2.filter_cached_associations(PRED.hasSite, lambda a: a.p ==PRED.hasSite and a.o == site_id)]
+            parent_site_ids = [a.s for a in RR2.filter_cached_associations(PRED.hasSite, lambda a: a.p ==PRED.hasSite and a.o == site_id, object_id=site_id)]
             if parent_site_ids:
                 extended_site.parent_site = RR2.read(parent_site_ids[0])
             else:
@@ -1177,8 +1205,8 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
                                                                      all_unknown,
                                                                      ComputedValueAvailability.PROVIDED)
 
-        instrument_status_list = [self.agent_status_builder.get_aggregate_status_of_device(d._id)
-                                  for d in extended_site.instrument_devices]
+        instrument_status_list = self.agent_status_builder.get_aggregate_status_of_devices(
+            [d._id for d in extended_site.instrument_devices])
 
         def clv(value=None):
             return ComputedListValue(status=ComputedValueAvailability.PROVIDED, value=value if value is not None else [])
@@ -1198,6 +1226,12 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         return extended_site
 
     def get_deployment_extension(self, deployment_id='', ext_associations=None, ext_exclude=None, user_id=''):
+        with memoized_resource_registry(self, 'oms.deployment_extension') as memo:
+            memo.prefetch_objects([deployment_id])
+            memo.prefetch_subjects([deployment_id])
+            return self._get_deployment_extension(deployment_id, ext_associations, ext_exclude, user_id)
+
+    def _get_deployment_extension(self, deployment_id='', ext_associations=None, ext_exclude=None, user_id=''):
         if not deployment_id:
             raise BadRequest("The deployment_id parameter is empty")
 
@@ -1317,7 +1351,11 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         @throws BadRequest    A parameter is missing
         @throws NotFound    An object with the specified observatory_id does not exist
         """
+        # no prefetch, an org is associated to all of its resources
+        with memoized_resource_registry(self, 'oms.marine_facility_extension'):
+            return self._get_marine_facility_extension(org_id, ext_associations, ext_exclude, user_id)
 
+    def _get_marine_facility_extension(self, org_id='', ext_associations=None, ext_exclude=None, user_id=''):
         if not org_id:
             raise BadRequest("The org_id parameter is empty")
 
@@ -1451,8 +1489,9 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
         # build id -> aggstatus lookup table
         master_status_table = {}
+        root_statuses = self.agent_status_builder.get_cumulative_status_dicts(plat_roots)
         for plat_root_id in plat_roots:
-            agg_status, _ = self.agent_status_builder.get_cumulative_status_dict(plat_root_id)
+            agg_status, _ = root_statuses[plat_root_id]
             if None is agg_status:
                 log.warn("Can't get agg status for platform %s, ignoring", plat_root_id)
             else:
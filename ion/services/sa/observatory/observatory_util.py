@@ -6,23 +6,120 @@ __author__ = 'Michael Meisinger, Maurice Manning, Ian Katz'
 
 
 from pyon.core.exception import BadRequest
-from pyon.public import RT, PRED
+from pyon.ion.endpoint import ProcessEventSubscriber
+from pyon.public import CFG, RT, PRED, OT
 
 from interface.objects import DeviceStatusType
 
+from collections import defaultdict
+import time
+
+
+class SiteTopology(object):
+    """
+    Materialized site and device structure, from the hasSite, hasDevice and hasSource associations.
+    Associations can be added and removed one at a time.
+    """
+    PREDICATES = (PRED.hasSite, PRED.hasDevice, PRED.hasSource)
+
+    def __init__(self, assoc_list=None):
+        self.assocs = {}                                # association id -> association
+        self.assoc_ids_of = defaultdict(set)            # resource id -> ids of its associations
+        self.site_parents = {}                          # site id -> (site type, parent site id, parent type)
+        self.site_children = defaultdict(list)          # site id -> [child site ids]
+        self.site_devices = {}                          # site id -> (site type, device id, device type)
+        self.child_devices = {}                         # device id -> [(device type, child device id, child type)]
+        self.device_data_products = {}                  # device id -> [data product ids]
+        for assoc in assoc_list or []:
+            self.add(assoc)
+
+    def add(self, assoc):
+        if assoc.p not in self.PREDICATES or assoc._id in self.assocs:
+            return
+        self.assocs[assoc._id] = assoc
+        self.assoc_ids_of[assoc.s].add(assoc._id)
+        self.assoc_ids_of[assoc.o].add(assoc._id)
+
+        if assoc.p == PRED.hasSite:
+            old_parent = self.site_parents.get(assoc.o)
+            if old_parent and assoc.o in self.site_children.get(old_parent[1], []):
+                self.site_children[old_parent[1]].remove(assoc.o)
+            self.site_parents[assoc.o] = (assoc.ot, assoc.s, assoc.st)
+            self.site_children[assoc.s].append(assoc.o)
+        elif assoc.p == PRED.hasDevice:
+            if assoc.st in [RT.PlatformSite, RT.InstrumentSite]:
+                self.site_devices[assoc.s] = (assoc.st, assoc.o, assoc.ot)
+            if assoc.st in [RT.PlatformDevice, RT.InstrumentDevice] and assoc.ot in [RT.PlatformDevice, RT.InstrumentDevice]:
+                self.child_devices.setdefault(assoc.s, []).append((assoc.st, assoc.o, assoc.ot))
+        elif assoc.p == PRED.hasSource and assoc.st == RT.DataProduct:
+            self.device_data_products.setdefault(assoc.o, []).append(assoc.s)
+
+    def remove(self, assoc_id):
+        assoc = self.assocs.pop(assoc_id, None)
+        if assoc is None:
+            return
+        self.assoc_ids_of[assoc.s].discard(assoc_id)
+        self.assoc_ids_of[assoc.o].discard(assoc_id)
+
+        if assoc.p == PRED.hasSite:
+            if self.site_parents.get(assoc.o, (None, None, None))[1] == assoc.s:
+                del self.site_parents[assoc.o]
+            if assoc.o in self.site_children.get(assoc.s, []):
+                self.site_children[assoc.s].remove(assoc.o)
+        elif assoc.p == PRED.hasDevice:
+            if self.site_devices.get(assoc.s, (None, None, None))[1] == assoc.o:
+                del self.site_devices[assoc.s]
+            self._remove_from(self.child_devices, assoc.s, (assoc.st, assoc.o, assoc.ot))
+        elif assoc.p == PRED.hasSource:
+            self._remove_from(self.device_data_products, assoc.o, assoc.s)
+
+    def replace(self, resource_ids, assoc_list):
+        """
+        Replaces all the associations of the given resources
+        """
+        for resource_id in resource_ids:
+            for assoc_id in list(self.assoc_ids_of.get(resource_id, [])):
+                self.remove(assoc_id)
+        for assoc in assoc_list:
+            self.add(assoc)
+
+    def _remove_from(self, index, key, value):
+        values = index.get(key)
+        if values and value in values:
+            values.remove(value)
+            if not values:
+                del index[key]
+
 
 class ObservatoryUtil(object):
+    """
+    The site/device topology is loaded once, on first use, and kept by the instance.  Instances that live longer
+    than a request must call track_topology() from a process, the topology is then updated from resource events
+    and reloaded when it is older than TOPOLOGY_MAX_AGE seconds.  Other services (e.g. the instrument management
+    assign/unassign operations) change hasDevice, hasSite and hasSource associations without any event, so the
+    max age bounds how long such a change goes unseen.
+    """
+    TOPOLOGY_MAX_AGE = CFG.get_safe('service.observatory_management.topology_max_age', 10)
+    TOPOLOGY_TYPES = set([RT.Observatory, RT.Subsite, RT.PlatformSite, RT.InstrumentSite,
+                          RT.PlatformDevice, RT.InstrumentDevice, RT.DataProduct])
+
     def __init__(self, process=None, container=None, enhanced_rr=None):
         self.process = process
         self.container = container if container else process.container
         self.RR2 = enhanced_rr
 
+        self._topology = None
+        self._topology_loaded = None
+        self._topology_dirty = set()
+        self._topology_subscribers = None
+
 
     # -------------------------------------------------------------------------
     # Resource registry access
 
     def _set_enhanced_rr(self, enhanced_rr=None):
         self.RR2 = enhanced_rr
+        self._topology = None
 
     def _get_predicate_assocs(self, predicate):
         if self.RR2:
@@ -39,6 +136,55 @@ class ObservatoryUtil(object):
         else:
             return self.container.resource_registry.find_objects(subject, predicate, object_type, id_only=id_only)
 
+    # -------------------------------------------------------------------------
+    # Site and device topology
+
+    def _get_topology(self):
+        if self._topology is None or \
+                (self._topology_subscribers and time.time() - self._topology_loaded > self.TOPOLOGY_MAX_AGE):
+            assoc_list = []
+            for predicate in SiteTopology.PREDICATES:
+                assoc_list.extend(self._get_predicate_assocs(predicate))
+            self._topology_dirty.clear()
+            self._topology = SiteTopology(assoc_list)
+            self._topology_loaded = time.time()
+
+        elif self._topology_dirty:
+            # One query in each direction for all the resources changed since the last use
+            resource_ids = list(self._topology_dirty)
+            self._topology_dirty.clear()
+            rr = self.container.resource_registry
+            _, object_assocs = rr.find_objects_mult(subjects=resource_ids, id_only=True)
+            _, subject_assocs = rr.find_subjects_mult(objects=resource_ids, id_only=True)
+            self._topology.replace(resource_ids, object_assocs + subject_assocs)
+
+        return self._topology
+
+    def track_topology(self):
+        """
+        Keep the topology current from the association and lifecycle changes of sites, devices and data products
+        """
+        if self._topology_subscribers:
+            return
+        self._topology_subscribers = []
+        for event_type in (OT.ResourceModifiedEvent, OT.ResourceLifecycleEvent):
+            sub = ProcessEventSubscriber(event_type=event_type, callback=self._topology_event_callback, process=self.process)
+            self.process._process.add_endpoint(sub)
+            self._topology_subscribers.append(sub)
+
+    def invalidate_topology(self, *resource_ids):
+        """
+        Mark resources whose hasSite, hasDevice or hasSource associations were changed without an event
+        """
+        if self._topology is not None:
+            self._topology_dirty.update(r for r in resource_ids if r)
+
+    def _topology_event_callback(self, event, *args, **kwargs):
+        if self._topology is None:
+            return
+        if event.origin_type in self.TOPOLOGY_TYPES or event.origin in self._topology.assoc_ids_of:
+            self._topology_dirty.add(event.origin)
+
     # -------------------------------------------------------------------------
     # Observatory site traversal
 
@@ -57,51 +203,47 @@ class ObservatoryUtil(object):
         if exclude_types is None:
             exclude_types = []
 
-        parents = self._get_site_parents()   # Note: root elements are not in list
+        topology = self._get_topology()
+        parents = topology.site_parents   # Note: root elements are not in list
 
         if org_id:
             obsite_ids,_ = self._find_objects(org_id, PRED.hasResource, RT.Observatory, id_only=True)
             if not obsite_ids:
                 return {}, {}
             parent_site_id = org_id
-            for obsite_id in obsite_ids:
-                parents[obsite_id] = ('Observatory', org_id, 'Org')
+            root_children = [(obsite_id, RT.Observatory) for obsite_id in obsite_ids]
         elif parent_site_id:
-            if parent_site_id not in parents:
-                parents[parent_site_id] = ('Observatory', None, 'Org')
+            root_children = [(ch_id, parents[ch_id][0]) for ch_id in topology.site_children.get(parent_site_id, [])]
         else:
             raise BadRequest("Must provide either parent_site_id or org_id")
 
         matchlist = []  # sites with wanted parent
         ancestors = {}  # child ids for sites in result set
-        for site_id, (st, parent_id, pt) in parents.iteritems():
-            # Iterate through sites and find the ones with a wanted parent
-            if st in exclude_types:
-                continue
-            parent_stack = [site_id, parent_id]
-            while parent_id:
-                # Walk up to parents
-                if parent_id == parent_site_id:
-                    matchlist.append(site_id)
-                    # Fill out ancestors
-                    par = parent_stack.pop()
-                    while parent_stack:
-                        ch = parent_stack.pop()
-                        if par not in ancestors:
-                            ancestors[par] = []
-                        if ch not in ancestors[par]:
-                            ancestors[par].append(ch)
-                        par = ch
-                    parent_id = None
-                else:
-                    _,parent_id,_ = parents.get(parent_id, (None,None,None))
-                    parent_stack.append(parent_id)
+        root_child_ids = set(ch_id for ch_id, _ in root_children)   # an org's observatories are only its children
+        visited = set([parent_site_id])
+        def add_descendants(site_id, children):
+            # Returns True if site_id or one of its descendants is a match
+            leads_to_match = False
+            for ch_id, ch_type in children:
+                if ch_id in visited:
+                    continue
+                visited.add(ch_id)
+                ch_match = ch_type not in exclude_types
+                if ch_match:
+                    matchlist.append(ch_id)
+                grand_children = [(gch_id, parents[gch_id][0]) for gch_id in topology.site_children.get(ch_id, [])
+                                  if gch_id not in root_child_ids]
+                if add_descendants(ch_id, grand_children) or ch_match:
+                    ancestors.setdefault(site_id, []).append(ch_id)
+                    leads_to_match = True
+            return leads_to_match
+        add_descendants(parent_site_id, root_children)
 
         # Go all the way up to the roots
         if include_parents:
             matchlist.append(parent_site_id)
             child_id = parent_site_id
-            parent = parents.get(child_id, None)
+            parent = parents.get(child_id, None) if not org_id else None
             while parent:
                 st, parent_id, pt = parent
                 if parent_id:
@@ -122,13 +264,7 @@ class ObservatoryUtil(object):
 
     def _get_site_parents(self):
         """Returns a dict mapping a site_id to site type and parent site_id."""
-        # This function makes one RR call retrieving all hasSite associations.
-        # @TODO: see if this can be done with an id_only=False argument
-        parents = {}
-        assoc_list = self._get_predicate_assocs(PRED.hasSite)
-        for assoc in assoc_list:
-            parents[assoc.o] = (assoc.ot, assoc.s, assoc.st)
-        return parents
+        return dict(self._get_topology().site_parents)
 
     def get_device_relations(self, site_list):
         """
@@ -136,17 +272,15 @@ class ObservatoryUtil(object):
         tuples, or None, based on hasDevice associations.
         This is a combination of 2 results: site->device(primary) and device(parent)->device(child)
         """
-        assoc_list = self._get_predicate_assocs(PRED.hasDevice)
-
         res_dict = {}
 
-        site_devices = self.get_site_devices(site_list, assoc_list=assoc_list)
+        site_devices = self.get_site_devices(site_list)
         res_dict.update(site_devices)
 
         # Add information for each device
         device_ids = [tuple_list[0][1] for tuple_list in site_devices.values() if tuple_list]
         for device_id in device_ids:
-            res_dict.update(self.get_child_devices(device_id, assoc_list=assoc_list))
+            res_dict.update(self.get_child_devices(device_id))
 
         return res_dict
 
@@ -167,13 +301,9 @@ class ObservatoryUtil(object):
         Returns a dict of site_id mapped to a list of (site type, device_id, device type) tuples,
         based on hasDevice association for all sites.
         """
-        sites = {}
         if not assoc_list:
-            assoc_list = self._get_predicate_assocs(PRED.hasDevice)
-        for assoc in assoc_list:
-            if assoc.st in [RT.PlatformSite, RT.InstrumentSite]:
-                sites[assoc.s] = (assoc.st, assoc.o, assoc.ot)
-        return sites
+            return self._get_topology().site_devices
+        return SiteTopology(assoc_list).site_devices
 
     def get_child_devices(self, device_id, assoc_list=None):
         child_devices = self._get_child_devices(assoc_list=assoc_list)
@@ -181,29 +311,22 @@ class ObservatoryUtil(object):
         def add_children(dev_id):
             ch_list = child_devices.get(dev_id, [])
             for _,ch_id,_ in ch_list:
-                all_children.add(ch_id)
-                add_children(ch_id)
+                if ch_id not in all_children:
+                    all_children.add(ch_id)
+                    add_children(ch_id)
         add_children(device_id)
-        for dev_id in list(child_devices.keys()):
-            if dev_id not in all_children:
-                del child_devices[dev_id]
-        if device_id not in child_devices:
-            child_devices[device_id] = []
-        return child_devices
+        res_devices = dict((dev_id, list(child_devices[dev_id])) for dev_id in all_children if dev_id in child_devices)
+        if device_id not in res_devices:
+            res_devices[device_id] = []
+        return res_devices
 
     def _get_child_devices(self, assoc_list=None):
         """
         Returns a dict mapping a device_id to parent type, child device_id, child type based on hasDevice association.
         """
-        sites = {}
         if not assoc_list:
-            assoc_list = self._get_predicate_assocs(PRED.hasDevice)
-        for assoc in assoc_list:
-            if assoc.st in [RT.PlatformDevice, RT.InstrumentDevice] and assoc.ot in [RT.PlatformDevice, RT.InstrumentDevice]:
-                if assoc.s not in sites:
-                    sites[assoc.s] = []
-                sites[assoc.s].append((assoc.st, assoc.o, assoc.ot))
-        return sites
+            return self._get_topology().child_devices
+        return SiteTopology(assoc_list).child_devices
 
 
 
@@ -265,22 +388,17 @@ class ObservatoryUtil(object):
         device_dps = self._get_device_data_products(assoc_list=assoc_list)
         res_dps = {}
         for dev_id in device_list:
-            res_dps[dev_id] = device_dps.get(dev_id, None)
+            dps = device_dps.get(dev_id, None)
+            res_dps[dev_id] = list(dps) if dps is not None else None
         return res_dps
 
     def _get_device_data_products(self, assoc_list=None):
         """
         Returns a dict of device_id mapped to data product id based on hasSource association.
         """
-        data_products = {}
         if not assoc_list:
-            assoc_list = self._get_predicate_assocs(PRED.hasSource)
-        for assoc in assoc_list:
-            if assoc.st == RT.DataProduct:
-                if assoc.o not in data_products:
-                    data_products[assoc.o] = []
-                data_products[assoc.o].append(assoc.s)
-        return data_products
+            return self._get_topology().device_data_products
+        return SiteTopology(assoc_list).device_data_products
 
     def get_site_data_products(self, res_id, res_type=None, include_sites=False, include_devices=False, include_data_products=False):
         """
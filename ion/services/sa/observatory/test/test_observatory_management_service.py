@@ -9,9 +9,13 @@
 
 #from mock import Mock , sentinel, patch
 from ion.services.sa.observatory.observatory_management_service import ObservatoryManagementService
+from ion.services.sa.observatory.observatory_util import ObservatoryUtil
+from ion.services.sa.observatory.mockutil import MockUtil
 from ion.services.sa.test.helpers import UnitTestGenerator
+from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryClient
 from nose.plugins.attrib import attr
 from pyon.ion.resource import RT
+from pyon.public import IonObject
 
 
 from ooi.logging import log
@@ -41,6 +45,48 @@ class TestObservatoryManagement(PyonTestCase):
         # must call this manually
         self.observatory_mgmt_service.on_init()
 
+    def test_topology_follows_association_changes(self):
+        mu = MockUtil()
+        process_mock = mu.create_process_mock()
+        container_mock = mu.create_container_mock()
+        mu.load_mock_resources([
+            dict(rt='Observatory', _id='Obs_1', attr={}),
+            dict(rt='PlatformSite', _id='PS_1', attr={}),
+            dict(rt='InstrumentSite', _id='IS_1', attr={}),
+            dict(rt='InstrumentSite', _id='IS_2', attr={}),
+            dict(rt='InstrumentDevice', _id='ID_2', attr={}),
+        ])
+        mu.load_mock_associations([
+            ['Obs_1', 'hasSite', 'PS_1'],
+            ['PS_1', 'hasSite', 'IS_1'],
+        ])
+
+        # The registry keeps the associations created through the service
+        rr_mock = container_mock.resource_registry
+        def create_association(subject, predicate, obj, *args, **kwargs):
+            assoc = IonObject('Association', s=subject, st=mu.res_objs[subject]._get_type(), p=predicate,
+                              o=obj, ot=mu.res_objs[obj]._get_type())
+            assoc._id = '%s_%s_%s' % (subject, predicate, obj)
+            mu.associations.append(assoc)
+        rr_mock.create_association.side_effect = create_association
+        rr_mock.find_objects_mult.side_effect = lambda subjects, **kwargs: ([], [a for a in mu.associations if a.s in subjects])
+        rr_mock.find_subjects_mult.side_effect = lambda objects, **kwargs: ([], [a for a in mu.associations if a.o in objects])
+
+        oms = self.observatory_mgmt_service
+        oms.RR2 = EnhancedResourceRegistryClient(rr_mock)
+        oms.outil = ObservatoryUtil(process_mock, container_mock)
+        oms.outil.track_topology()
+
+        self.assertEquals(set(oms.outil.get_child_sites(parent_site_id='Obs_1', include_parents=False)[0]), set(['PS_1', 'IS_1']))
+
+        oms.assign_site_to_site('IS_2', 'PS_1')
+        oms.assign_device_to_site('ID_2', 'IS_2')
+
+        self.assertEquals(set(oms.outil.get_child_sites(parent_site_id='Obs_1', include_parents=False)[0]), set(['PS_1', 'IS_1', 'IS_2']))
+        self.assertEquals(oms.outil.get_site_devices(['IS_2']), {'IS_2': [('InstrumentSite', 'ID_2', 'InstrumentDevice')]})
+        # Updated from the changed resources, not reloaded
+        self.assertEquals(rr_mock.find_associations.call_count, 3)
+
 utg = UnitTestGenerator(TestObservatoryManagement,
                         ObservatoryManagementService)
 
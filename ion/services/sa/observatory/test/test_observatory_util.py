@@ -5,7 +5,7 @@ __author__ = 'Michael Meisinger'
 import unittest
 from nose.plugins.attrib import attr
 
-from pyon.public import RT, log
+from pyon.public import RT, IonObject, log
 from pyon.util.unit_test import IonUnitTestCase
 
 from ion.services.sa.observatory.mockutil import MockUtil
@@ -254,3 +254,37 @@ class TestObservatoryUtil(IonUnitTestCase):
         #import pprint
         #pprint.pprint(res_dict)
 
+
+    def test_topology_updates(self):
+        self.mu.load_mock_resources(self.res_list + self.res_list1)
+        self.mu.load_mock_associations(self.assoc_list + self.assoc_list2 + self.assoc_list3)
+        rr_mock = self.container_mock.resource_registry
+
+        self.obs_util = ObservatoryUtil(self.process_mock, self.container_mock)
+        self.obs_util.track_topology()
+        self.assertEquals(len(self.obs_util.get_child_sites(parent_site_id='Obs_1', include_parents=False)[0]), 3)
+        self.assertEquals(self.obs_util.get_child_devices('PD_1')['PD_1'][0][1], 'ID_1')
+        self.assertEquals(len(self.obs_util.get_device_data_products(['PD_1'])['PD_1']), 3)
+        # All of the above from one load of each predicate
+        self.assertEquals(rr_mock.find_associations.call_count, 3)
+
+        # PS_1 loses its instrument site and its device
+        ps_assocs = [a for a in self.mu.associations if a.s == 'PS_1' or a.o == 'PS_1']
+        remaining = [a for a in ps_assocs if a.o not in ('IS_1', 'PD_1')]
+        rr_mock.find_objects_mult.return_value = ([], [a for a in remaining if a.s == 'PS_1'])
+        rr_mock.find_subjects_mult.return_value = ([], [a for a in remaining if a.o == 'PS_1'])
+        self.obs_util._topology_event_callback(IonObject('ResourceModifiedEvent', origin='PS_1', origin_type=RT.PlatformSite))
+        # Events about other resources are ignored
+        self.obs_util._topology_event_callback(IonObject('ResourceModifiedEvent', origin='XXX', origin_type=RT.Org))
+
+        site_resources, site_children = self.obs_util.get_child_sites(parent_site_id='Obs_1', include_parents=False)
+        self.assertEquals(len(site_resources), 2)
+        self.assertNotIn('IS_1', site_resources)
+        self.assertEquals(self.obs_util.get_site_devices(['PS_1', 'IS_1']), {'PS_1': [], 'IS_1': [('InstrumentSite', 'ID_1', 'InstrumentDevice')]})
+        rr_mock.find_objects_mult.assert_called_once_with(subjects=['PS_1'], id_only=True)
+        self.assertEquals(rr_mock.find_associations.call_count, 3)
+
+        # Associations changed by other services without an event are seen once the topology is reloaded
+        self.obs_util._topology_loaded -= ObservatoryUtil.TOPOLOGY_MAX_AGE + 1
+        self.assertEquals(len(self.obs_util.get_child_sites(parent_site_id='Obs_1', include_parents=False)[0]), 3)
+        self.assertEquals(rr_mock.find_associations.call_count, 6)
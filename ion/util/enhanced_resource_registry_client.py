@@ -95,6 +95,10 @@ class EnhancedResourceRegistryClient(object):
         self._cached_predicates = {}
         self._cached_resources  = {}
 
+        # predicate -> {subject or object id: [associations]}, built along with _cached_predicates
+        self._cached_subject_index = {}
+        self._cached_object_index  = {}
+
         self.console_mode = False
 
         log.debug("done init")
@@ -347,18 +351,12 @@ class EnhancedResourceRegistryClient(object):
         log.info("Using %s cached results for 'find (%s) subjects'", len(self._cached_predicates[predicate]), predicate)
 
         def filter_fn(assoc):
-            if object != assoc.o:
-                return False
-
-            if "" != subject_type and subject_type != assoc.st:
-                return False
-
-            return True
+            return "" == subject_type or subject_type == assoc.st
 
         log.debug("Checking object_id=%s, subject_type=%s", object_id, subject_type)
         preds = self._cached_predicates[predicate]
         time_search_start = get_ion_ts()
-        subject_ids = [a.s for a in self.filter_cached_associations(predicate, filter_fn)]
+        subject_ids = [a.s for a in self.filter_cached_associations(predicate, filter_fn, object_id=object_id)]
         time_search_stop = get_ion_ts()
         total_time = int(time_search_stop) - int(time_search_start)
         log.debug("Processed %s %s predicates for %s subjects in %s seconds",
@@ -388,18 +386,12 @@ class EnhancedResourceRegistryClient(object):
         log.info("Using %s cached results for 'find (%s) objects'", len(self._cached_predicates[predicate]), predicate)
 
         def filter_fn(assoc):
-            if subject_id != assoc.s:
-                return False
-
-            if "" != object_type and object_type != assoc.ot:
-                return False
-
-            return True
+            return "" == object_type or object_type == assoc.ot
 
         log.debug("Checking subject_id=%s, object_type=%s", subject_id, object_type)
         preds = self._cached_predicates[predicate]
         time_search_start = get_ion_ts()
-        object_ids = [a.o for a in self.filter_cached_associations(predicate, filter_fn)]
+        object_ids = [a.o for a in self.filter_cached_associations(predicate, filter_fn, subject_id=subject_id)]
         time_search_stop = get_ion_ts()
         total_time = int(time_search_stop) - int(time_search_start)
         log.debug("Processed %s %s predicates for %s objects in %s seconds",
@@ -528,12 +520,14 @@ class EnhancedResourceRegistryClient(object):
         return ret
 
 
-    def cache_predicate(self, predicate):
+    def cache_predicate(self, predicate, associations=None):
         """
         Save all associations of a given predicate type to memory, for in-memory find_subjects/objects ops
 
         This is a PREFETCH operation, and EnhancedResourceRegistryClient objects that use the cache functionality
         should NOT be persisted across service calls.
+
+        The associations can be given if they were already fetched, otherwise they are fetched from the RR.
         """
         log.info("Caching predicates: %s", predicate)
         log.debug("This cache is %s", self)
@@ -542,7 +536,10 @@ class EnhancedResourceRegistryClient(object):
             return
 
         time_caching_start = get_ion_ts()
-        preds = self.RR.find_associations(predicate=predicate, id_only=False)
+        if None is associations:
+            preds = self.RR.find_associations(predicate=predicate, id_only=False)
+        else:
+            preds = list(associations)
         time_caching_stop = get_ion_ts()
 
         total_time = int(time_caching_stop) - int(time_caching_start)
@@ -550,12 +547,33 @@ class EnhancedResourceRegistryClient(object):
         log.info("Cached %s %s predicates in %s seconds", len(preds), predicate, total_time / 1000.0)
         self._cached_predicates[predicate] = preds
 
+        by_subject = {}
+        by_object  = {}
+        for a in preds:
+            by_subject.setdefault(a.s, []).append(a)
+            by_object.setdefault(a.o, []).append(a)
+        self._cached_subject_index[predicate] = by_subject
+        self._cached_object_index[predicate]  = by_object
+
 
-    def filter_cached_associations(self, predicate, is_match_fn):
+    def filter_cached_associations(self, predicate, is_match_fn, subject_id=None, object_id=None):
+        """
+        Return the cached associations of a predicate that match the function.  Giving the subject
+        and/or object id of the associations only checks the associations of that subject or object.
+        """
         if not self.has_cached_predicate(predicate):
             raise BadRequest("Attempted to filter cached associations of uncached predicate '%s'" % predicate)
 
-        return [a for a in self._cached_predicates[predicate] if is_match_fn(a)]
+        if None is not subject_id:
+            assocs = self._cached_subject_index[predicate].get(subject_id, [])
+            if None is not object_id:
+                assocs = [a for a in assocs if object_id == a.o]
+        elif None is not object_id:
+            assocs = self._cached_object_index[predicate].get(object_id, [])
+        else:
+            assocs = self._cached_predicates[predicate]
+
+        return [a for a in assocs if is_match_fn(a)]
 
     def get_cached_associations(self, predicate):
         return self.filter_cached_associations(predicate, lambda x: True)
@@ -613,8 +631,12 @@ class EnhancedResourceRegistryClient(object):
     def clear_cached_predicate(self, predicate=None):
         if None is predicate:
             self._cached_predicates = {}
+            self._cached_subject_index = {}
+            self._cached_object_index  = {}
         elif predicate in self._cached_predicates:
             del self._cached_predicates[predicate]
+            del self._cached_subject_index[predicate]
+            del self._cached_object_index[predicate]
 
 
     def clear_cached_resource(self, resource_type=None):
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+@package  ion.util.memoizing_resource_registry_client
+@description Request scoped memo of resource registry reads
+"""
+
+from ooi.logging import log
+
+from contextlib import contextmanager
+import collections
+
+
+class MemoizingResourceRegistryClient(object):
+    """
+    Wraps a resource registry client for the duration of one request (e.g. building an extended resource),
+    answering repeated reads and finds from a memo instead of going back to the resource registry.
+
+     * read/read_mult share one memo of resource objects, read_mult only fetches the resources not seen yet
+     * finds are memoized by their arguments, the objects they return are added to the resource memo
+     * the associations of the resources given to prefetch_objects/prefetch_subjects are fetched with a single
+       find_objects_mult/find_subjects_mult the first time one of them is searched, and the plain
+       find_objects/find_subjects calls on those resources are answered from it
+     * any other operation is passed along and clears the memo, since it may change the registry
+
+    The memo returns the same resource objects to every caller, it is only meant for read-only assembly
+    of a response.  The number of resource registry round trips and of calls answered from the memo are
+    counted, see stats() and totals().
+    """
+
+    MEMO_OPS = ('find_objects', 'find_subjects', 'find_associations', 'find_objects_mult', 'find_subjects_mult',
+                'find_resources', 'find_resources_ext', 'get_association')
+
+    _totals = collections.Counter()
+
+    def __init__(self, rr_client):
+        self.RR = rr_client
+        self._stats = collections.Counter()
+        self._pending_subjects = set()
+        self._pending_objects  = set()
+        self._clear_memo()
+
+    def __getattr__(self, item):
+        """
+        anything that isn't memoized goes to the real RR client
+        """
+        attr = getattr(self.RR, item)
+        if not callable(attr):
+            return attr
+        if item in self.MEMO_OPS:
+            return lambda *args, **kwargs: self._memo_call(item, args, kwargs)
+
+        def call_through(*args, **kwargs):
+            self._clear_memo()
+            return self._round_trip(attr, *args, **kwargs)
+        return call_through
+
+    #--------------------------------------------------------------------------------
+    # Reads
+    #--------------------------------------------------------------------------------
+
+    def read(self, object_id='', rev_id=''):
+        if rev_id:
+            return self._round_trip(self.RR.read, object_id, rev_id)
+        if object_id in self._resources:
+            self._hit()
+            return self._resources[object_id]
+        obj = self._round_trip(self.RR.read, object_id)
+        self._resources[object_id] = obj
+        return obj
+
+    def read_mult(self, object_ids=None):
+        object_ids = list(object_ids or [])
+        misses = list(set(oid for oid in object_ids if oid not in self._resources))
+        if misses:
+            self._add_resources(self._round_trip(self.RR.read_mult, misses))
+        if len(misses) < len(object_ids):
+            self._hit()
+        return [self._resources[oid] for oid in object_ids]
+
+    #--------------------------------------------------------------------------------
+    # Association prefetch
+    #--------------------------------------------------------------------------------
+
+    def prefetch_objects(self, subject_ids):
+        """
+        Fetch all the objects of these subjects, together, the first time one of them is searched
+        """
+        self._pending_subjects.update(sid for sid in subject_ids if sid not in self._objects_of)
+
+    def prefetch_subjects(self, object_ids):
+        """
+        Fetch all the subjects of these objects, together, the first time one of them is searched
+        """
+        self._pending_objects.update(oid for oid in object_ids if oid not in self._subjects_of)
+
+    def find_objects(self, subject='', predicate='', object_type='', id_only=False, **kwargs):
+        subject_id = getattr(subject, '_id', subject)
+        if not kwargs and self._prefetched(subject_id, self._pending_subjects, self._objects_of,
+                                           self.RR.find_objects_mult, 'subjects'):
+            self._hit()
+            return self._filter(self._objects_of[subject_id], predicate, 'ot', object_type, id_only)
+        return self._memo_call('find_objects', (subject, predicate, object_type, id_only), kwargs)
+
+    def find_subjects(self, subject_type='', predicate='', object='', id_only=False, **kwargs):
+        object_id = getattr(object, '_id', object)
+        if not kwargs and self._prefetched(object_id, self._pending_objects, self._subjects_of,
+                                           self.RR.find_subjects_mult, 'objects'):
+            self._hit()
+            return self._filter(self._subjects_of[object_id], predicate, 'st', subject_type, id_only)
+        return self._memo_call('find_subjects', (subject_type, predicate, object, id_only), kwargs)
+
+    def _prefetched(self, resource_id, pending, related, find_mult_fn, arg_name):
+        if resource_id in related:
+            return True
+        if resource_id not in pending:
+            return False
+
+        resource_ids = sorted(pending)
+        pending.clear()
+        objs, assocs = self._round_trip(find_mult_fn, **{arg_name: resource_ids, 'id_only': False})
+        for rid in resource_ids:
+            related[rid] = []
+        for obj, assoc in zip(objs, assocs):
+            self._resources[obj._id] = obj
+            related[assoc.s if arg_name == 'subjects' else assoc.o].append((obj, assoc))
+        return True
+
+    def _filter(self, related, predicate, type_attr, restype, id_only):
+        matches = [(obj, assoc) for obj, assoc in related
+                   if (not predicate or assoc.p == predicate) and (not restype or getattr(assoc, type_attr) == restype)]
+        return ([obj._id if id_only else obj for obj, _ in matches], [assoc for _, assoc in matches])
+
+    #--------------------------------------------------------------------------------
+    # Memo
+    #--------------------------------------------------------------------------------
+
+    def _memo_call(self, op, args, kwargs):
+        key = (op, self._freeze(args), self._freeze(kwargs))
+        if key in self._results:
+            self._hit()
+        else:
+            result = self._round_trip(getattr(self.RR, op), *args, **kwargs)
+            self._results[key] = result
+            if op.startswith('find_') and not (kwargs.get('id_only') or (len(args) > 3 and args[3])):
+                self._add_found_resources(result)
+        return self._copy(self._results[key])
+
+    def _add_found_resources(self, result):
+        if isinstance(result, tuple) and result and isinstance(result[0], list):
+            self._add_resources(result[0])
+
+    def _add_resources(self, objs):
+        for obj in objs:
+            if getattr(obj, '_id', None) and getattr(obj, 'type_', None):
+                self._resources[obj._id] = obj
+
+    def _clear_memo(self):
+        self._resources   = {} # resource id -> resource object
+        self._results     = {} # (operation, args, kwargs) -> result
+        self._objects_of  = {} # subject id -> [(object, association)], from prefetch_objects
+        self._subjects_of = {} # object id -> [(subject, association)], from prefetch_subjects
+
+    @classmethod
+    def _freeze(cls, value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, cls._freeze(v)) for k, v in value.iteritems()))
+        if isinstance(value, (list, tuple, set)):
+            return tuple(cls._freeze(v) for v in value)
+        if hasattr(value, '_id'):
+            return ('_id', value._id)
+        return value
+
+    @classmethod
+    def _copy(cls, result):
+        # the callers get their own lists, the objects in them are shared
+        if isinstance(result, tuple):
+            return tuple(cls._copy(r) for r in result)
+        if isinstance(result, list):
+            return list(result)
+        return result
+
+    def _round_trip(self, fn, *args, **kwargs):
+        self._stats['round_trips'] += 1
+        self._totals['round_trips'] += 1
+        return fn(*args, **kwargs)
+
+    def _hit(self):
+        self._stats['hits'] += 1
+        self._totals['hits'] += 1
+
+    def stats(self):
+        """
+        Resource registry round trips and memo hits of this request
+        """
+        return {'round_trips': self._stats['round_trips'], 'hits': self._stats['hits']}
+
+    @classmethod
+    def totals(cls):
+        """
+        Resource registry round trips and memo hits of all the memoized requests of the process
+        """
+        return {'round_trips': cls._totals['round_trips'], 'hits': cls._totals['hits']}
+
+
+@contextmanager
+def memoized_resource_registry(process, name='request'):
+    """
+    Route the resource registry calls a service makes while building one response through a
+    MemoizingResourceRegistryClient, which is yielded.
+
+    The process's resource registry client is replaced where the service keeps it (process.clients,
+    process.RR and the RR2 enhanced clients of the process and its agent status builder) and restored
+    on exit.  Service operations of a process are executed one at a time, so no other request sees the memo.
+    """
+    rr_client = process.clients.resource_registry
+    memo = MemoizingResourceRegistryClient(rr_client)
+
+    holders = [(process.clients, 'resource_registry'), (process, 'RR'), (getattr(process, 'RR2', None), 'RR')]
+    status_builder = getattr(process, 'agent_status_builder', None)
+    if status_builder is not None:
+        holders.append((getattr(status_builder, 'RR2', None), 'RR'))
+    # only swap the places that actually hold this client
+    swapped = [(holder, attr) for holder, attr in holders
+               if holder is not None and getattr(holder, attr, None) is rr_client]
+
+    for holder, attr in swapped:
+        setattr(holder, attr, memo)
+    try:
+        yield memo
+    finally:
+        for holder, attr in swapped:
+            setattr(holder, attr, rr_client)
+        log.debug("%s: %s resource registry round trips, %s calls answered from the memo",
+                  name, memo._stats['round_trips'], memo._stats['hits'])
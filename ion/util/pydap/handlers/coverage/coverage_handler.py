@@ -6,7 +6,7 @@ from pyon.util.log import log
 from email.utils import formatdate
 from stat import ST_MTIME
 
-from coverage_model.coverage import AbstractCoverage
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from coverage_model.parameter_types import QuantityType,ConstantRangeType,ArrayType, ConstantType, RecordType, CategoryType, BooleanType, ParameterFunctionType
 from coverage_model.parameter_functions import ParameterFunctionException
 from pydap.model import DatasetType,BaseType, GridType
@@ -14,7 +14,6 @@ from pydap.handlers.lib import BaseHandler
 from pyon.public import CFG
 import time
 import simplejson as json
-import collections
 import functools
 
 numpy_boolean = '?'
@@ -49,10 +48,6 @@ def request_profile(enabled=False):
 
 
 class Handler(BaseHandler):
-    CACHE_LIMIT = CFG.get_safe('server.pydap.cache_limit', 5)
-    CACHE_EXPIRATION = CFG.get_safe('server.pydap.cache_expiration', 5)
-    _coverages = collections.OrderedDict() # Cache has to be a class var because each handler is initialized per request
-
     extensions = re.compile(r'^.*[0-9A-Za-z\-]{32}',re.IGNORECASE)
 
     def __init__(self, filepath):
@@ -85,29 +80,12 @@ class Handler(BaseHandler):
     @classmethod
     def get_coverage(cls, root_path, dataset_id):
         '''
-        Memoization (LRU) of _get_coverage
+        Acquires the coverage from the container's coverage pool, it must be released with CoveragePool.release.
+        Coverages under the datasets directory share their handle with the other readers of the dataset.
         '''
         if root_path is None or dataset_id is None:
             return None
-        try:
-            result, ts = cls._coverages.pop(dataset_id)
-            if (time.time() - ts) > cls.CACHE_EXPIRATION:
-                result.close()
-                raise KeyError(dataset_id)
-        except KeyError:
-            if dataset_id is None:
-                return None
-            result = AbstractCoverage.load(root_path, dataset_id,mode='r')
-            result.value_caching = False
-            ts = time.time()
-            if result is None:
-                return None
-            if len(cls._coverages) >= cls.CACHE_LIMIT:
-                key, value = cls._coverages.popitem(0)
-                coverage, ts = value
-                coverage.close(timeout=5)
-        cls._coverages[dataset_id] = result, ts
-        return result
+        return CoveragePool.acquire(dataset_id, mode='r', root_path=root_path)
 
     def get_attrs(self, cov, name):
         pc = cov.get_parameter_context(name)
@@ -307,7 +285,12 @@ class Handler(BaseHandler):
     def parse_constraints(self, environ):
         base = os.path.split(self.filepath)
         coverage = self.get_coverage(base[0], base[1])
+        try:
+            return self._parse_constraints(environ, coverage)
+        finally:
+            CoveragePool.release(coverage)
 
+    def _parse_constraints(self, environ, coverage):
         last_modified = formatdate(time.mktime(time.localtime(os.stat(self.filepath)[ST_MTIME])))
         environ['pydap.headers'].append(('Last-modified', last_modified))
 
@@ -7,8 +7,49 @@
 from ion.util.enhanced_resource_registry_client import EnhancedResourceRegistryClient
 
 from ooi.logging import log
+from pyon.public import CFG
+
+import time
 
 class RelatedResourcesCrawler(object):
+    """
+    Finds the resources related to a resource by crawling the associations of a set of predicates.
+
+    The associations of each predicate can be kept in a snapshot shared by every crawler of the process, so that
+    repeated crawls (e.g. during one request) don't load them again.  A snapshot is only used while it is younger
+    than snapshot_max_age seconds; 0 (the default) never uses snapshots.
+    """
+
+    SNAPSHOT_MAX_AGE = CFG.get_safe('container.related_resources_crawler.snapshot_max_age', 0)
+
+    _snapshots = {} # predicate -> (time loaded, associations)
+
+    def __init__(self, snapshot_max_age=None):
+        self.snapshot_max_age = self.SNAPSHOT_MAX_AGE if snapshot_max_age is None else snapshot_max_age
+
+    def _cache_predicate(self, RR2, predicate):
+        """
+        Cache the associations of a predicate in RR2, from the snapshot if it is recent enough
+        """
+        if not self.snapshot_max_age:
+            RR2.cache_predicate(predicate)
+            return
+
+        loaded, assns = self._snapshots.get(predicate, (None, None))
+        if None is not loaded and time.time() - loaded <= self.snapshot_max_age:
+            log.debug("Using the %s snapshot from %.3f seconds ago", predicate, time.time() - loaded)
+            RR2.cache_predicate(predicate, assns)
+            return
+
+        RR2.cache_predicate(predicate)
+        self._snapshots[predicate] = (time.time(), RR2.get_cached_associations(predicate))
+
+    @classmethod
+    def clear_snapshots(cls, predicate=None):
+        if None is predicate:
+            cls._snapshots.clear()
+        else:
+            cls._snapshots.pop(predicate, None)
 
 
     def generate_related_resources_partial(self,
@@ -37,7 +78,7 @@ class RelatedResourcesCrawler(object):
 
             for p in predicate_list:
                 if not RR2.has_cached_predicate(p):
-                    RR2.cache_predicate(p)
+                    self._cache_predicate(RR2, p)
 
 
             def get_related_resources_partial_fn(predicate_dictionary, resource_whitelist):
@@ -67,28 +108,33 @@ class RelatedResourcesCrawler(object):
                 for rt in resource_whitelist:
                     RR2.cache_resources(rt)
 
+                # adjacency map of the crawl, built once from the cached associations:
+                #  resource id -> [(next resource id to crawl, association), ...] in predicate and association order
+                adjacency = {}
+                for p, (search_sto, search_ots) in predicate_dictionary.iteritems():
+                    assns = RR2.get_cached_associations(p)
+                    if search_sto:
+                        for a in assns:
+                            if a.ot in resource_whitelist:
+                                adjacency.setdefault(a.s, []).append((a.o, a))
+                    if search_ots:
+                        for a in assns:
+                            if a.st in resource_whitelist:
+                                adjacency.setdefault(a.o, []).append((a.s, a))
+
+                lookups = {}
+
                 def lookup_fn(resource_id):
                     """
                     return a dict of related resources as dictated by the pred dict and whitelist
                      - the key is the next resource id to crawl
                      - the value is the entire association
-                    """
-                    retval = {}
-
-                    sto_match = lambda assn: assn.s == resource_id and assn.ot in resource_whitelist
-                    ots_match = lambda assn: assn.o == resource_id and assn.st in resource_whitelist
-                    for p, (search_sto, search_ots) in predicate_dictionary.iteritems():
-                        if search_sto:
-                            for a in RR2.filter_cached_associations(p, sto_match):
-                                log.trace("lookup_fn matched %s object", a.ot)
-                                retval[a.o] = a
-                        if search_ots:
-                            for a in RR2.filter_cached_associations(p, ots_match):
-                                log.trace("lookup_fn matched %s subject", a.st)
-                                retval[a.s] = a
 
-
-                    return retval
+                    results are memoized, the returned dict must not be modified
+                    """
+                    if resource_id not in lookups:
+                        lookups[resource_id] = dict(adjacency.get(resource_id, []))
+                    return lookups[resource_id]
 
 
                 def get_related_resources_h(accum, input_resource_id, recursion_limit):
@@ -118,7 +164,7 @@ class RelatedResourcesCrawler(object):
 
                     unseen = set(matches.keys()) - seen
                     seen.add(input_resource_id)
-                    acc  = acc  | set(matches.values())
+                    acc.update(matches.itervalues())
 
                     #if log.isEnabledFor(logging.TRACE):
                     #    summary = {}
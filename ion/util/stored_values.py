@@ -6,7 +6,12 @@
 '''
 
 from pyon.core.exception import NotFound
+from pyon.public import CFG, OT
+from pyon.util.log import log
+import collections
 import gevent
+import gevent.coros
+import time
 
 
 
@@ -31,6 +36,7 @@ class StoredValueManager(object):
         for k,v in document_updates.iteritems():
             doc[k] = v
         doc_id, rev = self.store.update_doc(doc)
+        StoredValueCache.eject([doc_key])
         return doc_id, rev
 
     def read_value(self, doc_key):
@@ -39,5 +45,110 @@ class StoredValueManager(object):
 
     def delete_stored_value(self, doc_key):
         self.store.delete_doc(doc_key)
+        StoredValueCache.eject([doc_key])
+
+
+class CachedStoredValueManager(StoredValueManager):
+    '''
+    StoredValueManager which reads the lookup documents through the process
+    wide StoredValueCache.
+    '''
+    def read_value(self, doc_key):
+        return StoredValueCache.read_value(self.store, doc_key)
+
+
+class StoredValueCache(object):
+    '''
+    Process wide cache of the lookup documents read from the object store.
+
+    Documents are ejected when an ExternalReferencesUpdatedEvent names them
+    or when they're updated through a StoredValueManager in this process. As
+    documents can also be updated by other processes without an event, an
+    entry is only served for _ttl seconds.
+    Documents which don't exist are not cached. The object store is read
+    outside of the cache lock, a document read while documents were ejected
+    is returned without being cached.
+    '''
+    _ttl          = CFG.get_safe('container.stored_value_cache.ttl', 60)
+    _cache_limit  = CFG.get_safe('container.stored_value_cache.size', 100)
+    _cache        = collections.OrderedDict()
+    _cache_lock   = gevent.coros.RLock()
+    _ejections    = 0
+    _key_stats    = {}
+    _subscriber   = None
+
+    @classmethod
+    def read_value(cls, store, doc_key):
+        cls._monitor_references()
+        with cls._cache_lock:
+            stats = cls._key_stats.setdefault(doc_key, {'hits':0, 'misses':0})
+            entry = cls._cache.pop(doc_key, None)
+            if entry is not None and (time.time() - entry[1]) <= cls._ttl:
+                stats['hits'] += 1
+                cls._cache[doc_key] = entry
+                return entry[0]
+            stats['misses'] += 1
+            ejections = cls._ejections
+
+        doc = store.read_doc(doc_key) # NotFound is raised to the caller
+        age = time.time()
+
+        with cls._cache_lock:
+            if cls._ejections == ejections:
+                cls._cache.pop(doc_key, None)
+                if len(cls._cache) >= cls._cache_limit:
+                    cls._cache.popitem(0)
+                cls._cache[doc_key] = (doc, age)
+        return doc
+
+    @classmethod
+    def eject(cls, doc_keys):
+        with cls._cache_lock:
+            cls._ejections += 1
+            for doc_key in doc_keys:
+                cls._cache.pop(doc_key, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._cache_lock:
+            cls._ejections += 1
+            cls._cache.clear()
+            cls._key_stats.clear()
+
+    @classmethod
+    def stats(cls):
+        '''
+        Hits, misses and hit ratio for every document key read through the cache
+        '''
+        with cls._cache_lock:
+            retval = {}
+            for doc_key, stats in cls._key_stats.iteritems():
+                total = stats['hits'] + stats['misses']
+                retval[doc_key] = dict(stats, hit_ratio=float(stats['hits']) / total if total else 0.)
+            return retval
+
+    @classmethod
+    def _references_updated(cls, event, *args, **kwargs):
+        if isinstance(event.reference_keys, list):
+            log.debug('Ejecting updated lookup documents %s', event.reference_keys)
+            cls.eject(event.reference_keys)
+
+    @classmethod
+    def _monitor_references(cls):
+        '''
+        Starts listening for ExternalReferencesUpdatedEvent the first time the
+        cache is used inside a container.
+        '''
+        if cls._subscriber is not None:
+            return
+        from pyon.container.cc import Container
+        from pyon.ion.event import EventSubscriber
+        if Container.instance is None:
+            return
+        with cls._cache_lock:
+            if cls._subscriber is not None:
+                return
+            cls._subscriber = EventSubscriber(event_type=OT.ExternalReferencesUpdatedEvent, callback=cls._references_updated, auto_delete=True)
+            cls._subscriber.start()
 
 
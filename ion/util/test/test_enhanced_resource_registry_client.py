@@ -631,3 +631,28 @@ class TestEnhancedResourceRegistryClient(PyonTestCase):
         self.assertEqual([d], results)
 
         self.assertEqual(0, self.rr.find_subjects.call_count)
+
+
+    def test_cached_association_index(self):
+        assns = [DotDict(s="d%d" % (i % 5), st=RT.InstrumentDevice, p=PRED.hasModel, o="m%d" % (i % 3), ot=RT.InstrumentModel)
+                 for i in range(30)]
+        self.rr.find_associations.return_value = assns
+        self.RR2.cache_predicate(PRED.hasModel)
+
+        any_assn = lambda a: True
+        for s in ["d0", "d4", "x"]:
+            self.assertEqual([a for a in assns if s == a.s],
+                             self.RR2.filter_cached_associations(PRED.hasModel, any_assn, subject_id=s))
+            for o in ["m0", "m2", "x"]:
+                self.assertEqual([a for a in assns if s == a.s and o == a.o],
+                                 self.RR2.filter_cached_associations(PRED.hasModel, any_assn, subject_id=s, object_id=o))
+        for o in ["m0", "m2", "x"]:
+            self.assertEqual([a for a in assns if o == a.o],
+                             self.RR2.filter_cached_associations(PRED.hasModel, any_assn, object_id=o))
+
+        # the match function still applies
+        results = self.RR2.filter_cached_associations(PRED.hasModel, lambda a: "m1" == a.o, subject_id="d1")
+        self.assertEqual([a for a in assns if "d1" == a.s and "m1" == a.o], results)
+
+        self.RR2.clear_cached_predicate(PRED.hasModel)
+        self.assertRaises(BadRequest, self.RR2.filter_cached_associations, PRED.hasModel, any_assn, subject_id="d0")
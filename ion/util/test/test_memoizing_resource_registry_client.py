@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""
+@file ion/util/test/test_memoizing_resource_registry_client.py
+@test ion.util.memoizing_resource_registry_client Unit test suite
+"""
+from mock import Mock
+from nose.plugins.attrib import attr
+
+from ion.util.memoizing_resource_registry_client import MemoizingResourceRegistryClient, memoized_resource_registry
+from pyon.ion.resource import RT, PRED
+from pyon.util.unit_test import PyonTestCase
+
+
+@attr('UNIT', group='sa')
+class TestMemoizingResourceRegistryClient(PyonTestCase):
+
+    def setUp(self):
+        self.resources = dict((rid, Mock(_id=rid, type_=rtype)) for rid, rtype in [("dev", RT.InstrumentDevice),
+                                                                                   ("model", RT.InstrumentModel),
+                                                                                   ("site", RT.InstrumentSite)])
+        self.assns = [Mock(s="dev", st=RT.InstrumentDevice, p=PRED.hasModel, o="model", ot=RT.InstrumentModel),
+                      Mock(s="site", st=RT.InstrumentSite, p=PRED.hasDevice, o="dev", ot=RT.InstrumentDevice)]
+
+        self.rr = Mock()
+        self.rr.read.side_effect = lambda rid: self.resources[rid]
+        self.rr.read_mult.side_effect = lambda rids: [self.resources[rid] for rid in rids]
+        self.rr.find_objects_mult.side_effect = lambda subjects, id_only: self._find_mult("s", "o", subjects)
+        self.rr.find_subjects_mult.side_effect = lambda objects, id_only: self._find_mult("o", "s", objects)
+        self.rr.find_objects.return_value = ([self.resources["model"]], self.assns[:1])
+
+        self.memo = MemoizingResourceRegistryClient(self.rr)
+
+    def _find_mult(self, side, other_side, resource_ids):
+        assns = [a for a in self.assns if getattr(a, side) in resource_ids]
+        return [self.resources[getattr(a, other_side)] for a in assns], assns
+
+    def test_reads(self):
+        self.assertEqual(self.resources["dev"], self.memo.read("dev"))
+        self.assertEqual(self.resources["dev"], self.memo.read("dev"))
+        self.assertEqual(1, self.rr.read.call_count)
+
+        objs = self.memo.read_mult(["model", "dev", "site"])
+        self.assertEqual(["model", "dev", "site"], [o._id for o in objs])
+        # only the resources not read yet are fetched
+        self.assertEqual(["model", "site"], sorted(self.rr.read_mult.call_args[0][0]))
+        self.memo.read_mult(["site", "model"])
+        self.assertEqual(1, self.rr.read_mult.call_count)
+        self.assertEqual({'round_trips': 2, 'hits': 3}, self.memo.stats())
+
+    def test_memoized_finds(self):
+        objs, assns = self.memo.find_objects("dev", PRED.hasModel, RT.InstrumentModel, False)
+        objs.append("junk")
+        self.assertEqual(([self.resources["model"]], self.assns[:1]),
+                         self.memo.find_objects(subject="dev", predicate=PRED.hasModel, object_type=RT.InstrumentModel))
+        self.assertEqual(1, self.rr.find_objects.call_count)
+        # found objects are read from the memo
+        self.memo.read("model")
+        self.assertFalse(self.rr.read.called)
+
+        # anything else may change the registry
+        self.memo.create_association("dev", PRED.hasModel, "model")
+        self.memo.find_objects("dev", PRED.hasModel, RT.InstrumentModel, False)
+        self.assertEqual(2, self.rr.find_objects.call_count)
+
+    def test_prefetch(self):
+        self.memo.prefetch_objects(["dev", "site"])
+        self.memo.prefetch_subjects(["dev"])
+        self.assertFalse(self.rr.find_objects_mult.called)
+
+        self.assertEqual((["model"], self.assns[:1]), self.memo.find_objects("dev", PRED.hasModel, id_only=True))
+        self.assertEqual(([], []), self.memo.find_objects("dev", PRED.hasDevice))
+        self.assertEqual(([self.resources["dev"]], self.assns[1:]),
+                         self.memo.find_objects(subject="site", object_type=RT.InstrumentDevice))
+        self.assertEqual(([self.resources["site"]], self.assns[1:]),
+                         self.memo.find_subjects(RT.InstrumentSite, PRED.hasDevice, "dev"))
+        self.rr.find_objects_mult.assert_called_once_with(subjects=["dev", "site"], id_only=False)
+        self.assertEqual(1, self.rr.find_subjects_mult.call_count)
+        self.assertFalse(self.rr.find_objects.called)
+        self.assertFalse(self.rr.find_subjects.called)
+        self.assertEqual({'round_trips': 2, 'hits': 4}, self.memo.stats())
+
+    def test_swap_clients(self):
+        process = Mock()
+        process.clients.resource_registry = process.RR = process.RR2.RR = self.rr
+        with memoized_resource_registry(process) as memo:
+            self.assertTrue(process.clients.resource_registry is memo)
+            self.assertTrue(process.RR is memo)
+            self.assertTrue(process.RR2.RR is memo)
+            # holders of other clients are left alone
+            self.assertFalse(process.agent_status_builder.RR2.RR is memo)
+        self.assertTrue(process.clients.resource_registry is self.rr)
+        self.assertTrue(process.RR2.RR is self.rr)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+@file ion/util/test/test_related_resources_crawler.py
+@test ion.util.related_resources_crawler Unit test suite
+"""
+from mock import Mock
+from nose.plugins.attrib import attr
+
+from ion.util.related_resources_crawler import RelatedResourcesCrawler
+from pyon.ion.resource import RT, PRED
+from pyon.util.unit_test import PyonTestCase
+
+
+@attr('UNIT', group='sa')
+class TestRelatedResourcesCrawler(PyonTestCase):
+
+    def setUp(self):
+        def assn(s, st, p, o, ot):
+            return Mock(s=s, st=st, p=p, o=o, ot=ot)
+
+        self.assns = [assn("obs",   RT.Observatory,  PRED.hasSite,  "site",  RT.Subsite),
+                      assn("site",  RT.Subsite,      PRED.hasSite,  "psite", RT.PlatformSite),
+                      assn("psite", RT.PlatformSite, PRED.hasSite,  "isite", RT.InstrumentSite),
+                      assn("obs",   RT.Observatory,  PRED.hasSite,  "osite", RT.Subsite),
+                      assn("isite", RT.InstrumentSite, PRED.hasDevice, "dev", RT.InstrumentDevice)]
+
+        self.rr = Mock()
+        self.rr.find_resources.return_value = ([], [])
+        self.rr.find_associations.side_effect = lambda predicate, id_only: [a for a in self.assns if predicate == a.p]
+
+        RelatedResourcesCrawler.clear_snapshots()
+        self.addCleanup(RelatedResourcesCrawler.clear_snapshots)
+
+    def test_crawl(self):
+        sites = [RT.Observatory, RT.Subsite, RT.PlatformSite, RT.InstrumentSite]
+        get_assns = RelatedResourcesCrawler().generate_related_resources_partial(self.rr, [PRED.hasSite, PRED.hasDevice])
+
+        search_down = get_assns({PRED.hasSite: (True, False)}, sites)
+        self.assertEqual(set(self.assns[:4]), set(search_down("obs")))
+        self.assertEqual(set([self.assns[0], self.assns[3]]), set(search_down("obs", 1)))
+
+        search_up = get_assns({PRED.hasSite: (False, True)}, sites)
+        self.assertEqual(set(self.assns[:3]), set(search_up("isite")))
+
+        # the device is not in the whitelist
+        search_both = get_assns({PRED.hasSite: (False, True), PRED.hasDevice: (True, False)}, sites)
+        self.assertEqual(set(self.assns[:3]), set(search_both("isite")))
+        self.assertEqual([], search_both("dev"))
+
+    def test_snapshot(self):
+        RelatedResourcesCrawler(snapshot_max_age=60).generate_related_resources_partial(self.rr, [PRED.hasSite])
+        RelatedResourcesCrawler(snapshot_max_age=60).generate_related_resources_partial(self.rr, [PRED.hasSite])
+        self.assertEqual(1, self.rr.find_associations.call_count)
+
+        get_assns = RelatedResourcesCrawler(snapshot_max_age=60).generate_related_resources_partial(self.rr, [PRED.hasSite])
+        search_down = get_assns({PRED.hasSite: (True, False)}, [RT.Subsite, RT.PlatformSite, RT.InstrumentSite])
+        self.assertEqual(set(self.assns[:4]), set(search_down("obs")))
+
+        # crawlers without snapshots always load the associations
+        RelatedResourcesCrawler().generate_related_resources_partial(self.rr, [PRED.hasSite])
+        self.assertEqual(2, self.rr.find_associations.call_count)
+
+        RelatedResourcesCrawler.clear_snapshots()
+        RelatedResourcesCrawler(snapshot_max_age=60).generate_related_resources_partial(self.rr, [PRED.hasSite])
+        self.assertEqual(3, self.rr.find_associations.call_count)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+'''
+@file ion/util/test/test_stored_values.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.core.exception import NotFound
+from nose.plugins.attrib import attr
+from mock import Mock
+
+from ion.util.stored_values import CachedStoredValueManager, StoredValueCache
+
+import gevent
+
+
+@attr('UNIT',group='dm')
+class StoredValueCacheTest(PyonTestCase):
+    def setUp(self):
+        StoredValueCache.clear()
+        self.addCleanup(StoredValueCache.clear)
+        container = Mock()
+        self.store = container.object_store
+        self.store.read_doc.side_effect = lambda key: {'offset_a': 2.0, 'key': key}
+        self.svm = CachedStoredValueManager(container)
+
+    def test_cached_reads(self):
+        for i in xrange(4):
+            self.assertEquals(self.svm.read_value('coefficients'), {'offset_a':2.0, 'key':'coefficients'})
+        self.assertEquals(self.store.read_doc.call_count, 1)
+
+        stats = StoredValueCache.stats()
+        self.assertEquals(stats['coefficients']['hits'], 3)
+        self.assertEquals(stats['coefficients']['misses'], 1)
+        self.assertEquals(stats['coefficients']['hit_ratio'], 0.75)
+
+    def test_invalidation(self):
+        self.svm.read_value('coefficients')
+        self.svm.read_value('other')
+
+        event = Mock()
+        event.reference_keys = ['coefficients']
+        StoredValueCache._references_updated(event)
+
+        self.svm.read_value('coefficients')
+        self.svm.read_value('other')
+        self.assertEquals(self.store.read_doc.call_count, 3)
+
+        # Updates through the manager eject the document
+        self.svm.stored_value_cas('other', {'offset_a':3.0})
+        self.svm.read_value('other')
+        self.assertEquals(self.store.read_doc.call_count, 5)
+
+    def test_ttl(self):
+        StoredValueCache._ttl = -1
+        self.addCleanup(setattr, StoredValueCache, '_ttl', 60)
+        self.svm.read_value('coefficients')
+        self.svm.read_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 2)
+
+    def test_not_found(self):
+        self.store.read_doc.side_effect = NotFound('missing')
+        with self.assertRaises(NotFound):
+            self.svm.read_value('missing')
+        with self.assertRaises(NotFound):
+            self.svm.read_value('missing')
+        self.assertEquals(self.store.read_doc.call_count, 2)
+
+    def test_read_outside_lock(self):
+        def read_doc(key):
+            # Other greenlets use the cache while the store is read
+            self.assertTrue(gevent.spawn(StoredValueCache.stats).get(timeout=1) is not None)
+            StoredValueCache.eject([key])
+            return {'key': key}
+        self.store.read_doc.side_effect = read_doc
+        self.svm.read_value('coefficients')
+        # The document was ejected while it was read, it isn't cached
+        self.svm.read_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 2)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''
+@file ion/util/test/test_time_index.py
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from nose.plugins.attrib import attr
+from mock import Mock
+
+from ion.util.time_index import TimeIndex
+from ion.util.time_utils import TimeUtils
+from coverage_model import SimplexCoverage
+
+import numpy as np
+import tempfile
+import shutil
+import os
+
+
+@attr('UNIT')
+class TestTimeIndex(PyonTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def mock_coverage(self, values):
+        coverage = Mock(spec=SimplexCoverage)
+        coverage.persistence_dir = os.path.join(self.tmp_dir, 'coverage')
+        coverage.temporal_parameter_name = 'time'
+        coverage.get_parameter_context.return_value.uom = 'seconds'
+        coverage.values = values
+        coverage.num_timesteps = len(values)
+        coverage.get_parameter_values.side_effect = lambda name, tdoa=None: coverage.values if tdoa is None else coverage.values[tdoa]
+        return coverage
+
+    def test_incremental_update(self):
+        values = np.cumsum(np.random.randint(0, 3, 1000)).astype(np.float64)
+        coverage = self.mock_coverage(values[:0])
+
+        for start in xrange(0, 1000, 37):
+            coverage.values = values[:start+37]
+            coverage.num_timesteps = len(coverage.values)
+            TimeIndex.update(coverage, values[start:start+37], start)
+
+        index = TimeIndex.for_coverage(coverage)
+        rebuilt = TimeIndex.rebuild(coverage)
+        np.testing.assert_array_equal(index.mins, rebuilt.mins)
+        np.testing.assert_array_equal(index.maxs, rebuilt.maxs)
+        np.testing.assert_array_equal(index.samples, rebuilt.samples)
+        self.assertEquals(index.bounds(), (values.min(), values.max()))
+
+    def test_find_nearest(self):
+        TimeIndex.BLOCK_SIZE = 64
+        self.addCleanup(setattr, TimeIndex, 'BLOCK_SIZE', 4096)
+
+        values = np.cumsum(np.random.randint(0, 3, 1000)).astype(np.float64)
+        coverage = self.mock_coverage(values)
+        index = TimeIndex.rebuild(coverage)
+
+        for val in np.random.uniform(-10, values[-1] + 10, 100):
+            coverage.get_parameter_values.reset_mock()
+            self.assertEquals(index.find_nearest(coverage, val), TimeUtils.find_nearest(values, val))
+            # Only the candidate blocks are read
+            self.assertLess(coverage.get_parameter_values.call_count, len(index.mins))
+
+        np.random.shuffle(values)
+        coverage = self.mock_coverage(values)
+        index = TimeIndex.rebuild(coverage)
+        for val in np.random.uniform(-10, values.max() + 10, 100):
+            self.assertEquals(index.find_nearest(coverage, val), TimeUtils.find_nearest(values, val))
+
+    def test_stale_index(self):
+        coverage = self.mock_coverage(np.arange(100.))
+        TimeIndex.rebuild(coverage)
+
+        coverage.values = np.arange(200.)
+        coverage.num_timesteps = 200
+        # Readers don't rebuild a stale index
+        self.assertIsNone(TimeIndex.for_coverage(coverage))
+        self.assertEquals(TimeIndex.read(TimeIndex.index_path(coverage)).num_timesteps, 100)
+        self.assertEquals(TimeUtils.get_relative_time(coverage, 150.), 150)
+
+        # An update that doesn't follow the index rebuilds it
+        coverage.values = np.arange(300.)
+        coverage.num_timesteps = 300
+        index = TimeIndex.update(coverage, np.arange(250., 300.), 250)
+        self.assertEquals(index.num_timesteps, 300)
+
+    def test_read_only_coverage(self):
+        coverage = self.mock_coverage(np.arange(100.))
+        os.chmod(self.tmp_dir, 0555)
+        self.addCleanup(os.chmod, self.tmp_dir, 0755)
+
+        # A missing index isn't written by readers
+        self.assertIsNone(TimeIndex.for_coverage(coverage))
+        self.assertFalse(os.path.exists(TimeIndex.index_path(coverage)))
+        self.assertEquals(TimeUtils.get_relative_time(coverage, 42.2), 42)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+'''
+@file ion/util/time_index.py
+@description Persistent block index of a coverage's time values
+'''
+
+from pyon.util.log import log
+
+from coverage_model import SimplexCoverage, ViewCoverage
+
+import numpy as np
+import os
+import uuid
+
+class TimeIndex(object):
+    '''
+    Sidecar index of the temporal parameter of a simplex coverage, stored next
+    to the coverage's persistence directory.
+
+    The time values are split in blocks of BLOCK_SIZE records and for each
+    block the index holds the minimum, the maximum and the first value (a
+    sparse sample of the time axis). It lets the temporal bounds and the
+    nearest time index be found by reading only the candidate blocks instead
+    of the complete time parameter.
+
+    The index is always validated against the coverage it was loaded for.
+    Only the ingestion worker writes it (update), rebuilding it when it is
+    missing or stale; readers fall back to the time values meanwhile.
+    '''
+    BLOCK_SIZE = 4096
+    SUFFIX     = '.time_index.npz'
+
+    def __init__(self, path, block_size=None):
+        self.path          = path
+        self.block_size    = block_size or self.BLOCK_SIZE
+        self.num_timesteps = 0
+        self.mins          = np.empty(0, dtype=np.float64)
+        self.maxs          = np.empty(0, dtype=np.float64)
+        self.samples       = np.empty(0, dtype=np.float64)
+
+    #--------------------------------------------------------------------------------
+    # Loading and persistence
+    #--------------------------------------------------------------------------------
+
+    @classmethod
+    def index_path(cls, coverage):
+        '''
+        Returns the path of the index for a coverage, None when the coverage
+        isn't backed by a single simplex coverage.
+        '''
+        if isinstance(coverage, SimplexCoverage):
+            persistence_dir = coverage.persistence_dir
+        elif isinstance(coverage, ViewCoverage) and isinstance(coverage.reference_coverage, SimplexCoverage):
+            persistence_dir = coverage.head_coverage_path
+        else:
+            return None
+        return os.path.normpath(persistence_dir) + cls.SUFFIX
+
+    @classmethod
+    def read(cls, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                npz = np.load(f)
+                index = cls(path, int(npz['block_size']))
+                index.num_timesteps = int(npz['num_timesteps'])
+                index.mins = npz['mins']
+                index.maxs = npz['maxs']
+                index.samples = npz['samples']
+            return index
+        except Exception:
+            log.warning('Unable to read time index %s', path, exc_info=True)
+            return None
+
+    def save(self):
+        # Written to a temporary file first so readers never see a partial index
+        tmp_path = '%s.%s.tmp' % (self.path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, block_size=self.block_size, num_timesteps=self.num_timesteps, mins=self.mins, maxs=self.maxs, samples=self.samples)
+        os.rename(tmp_path, self.path)
+
+    @classmethod
+    def rebuild(cls, coverage, path=None):
+        '''
+        Builds the index from the coverage's time values and persists it
+        '''
+        path = path or cls.index_path(coverage)
+        if path is None:
+            return None
+        index = cls(path)
+        if coverage.num_timesteps:
+            values = coverage.get_parameter_values(coverage.temporal_parameter_name)
+            index.append(values, 0)
+        index.save()
+        return index
+
+    @classmethod
+    def for_coverage(cls, coverage):
+        '''
+        Returns the index for the coverage, None if the coverage can't be
+        indexed or its index is missing or stale. The index isn't written,
+        the coverage directory may not be writable by readers.
+        '''
+        path = cls.index_path(coverage)
+        if path is None or not coverage.num_timesteps:
+            return None
+        index = cls.read(path)
+        if index is None or not index.valid_for(coverage):
+            log.debug('Time index %s is missing or stale', path)
+            return None
+        if index.has_nan():
+            return None
+        return index
+
+    @classmethod
+    def update(cls, coverage, values, start_index):
+        '''
+        Updates the index of a coverage after the values were written to the
+        coverage starting at start_index.
+        '''
+        path = cls.index_path(coverage)
+        if path is None:
+            return None
+        index = cls.read(path)
+        if index is None or index.num_timesteps != start_index:
+            return cls.rebuild(coverage, path)
+        index.append(values, start_index)
+        index.save()
+        return index
+
+    def valid_for(self, coverage):
+        if self.num_timesteps != coverage.num_timesteps:
+            return False
+        if not self.samples.shape[0]:
+            return True
+        # Verify that the coverage still holds the indexed values
+        block = self.samples.shape[0] - 1
+        value = coverage.get_parameter_values(coverage.temporal_parameter_name, tdoa=slice(block * self.block_size, block * self.block_size + 1))
+        return np.array_equal(np.atleast_1d(value)[:1], self.samples[-1:])
+
+    #--------------------------------------------------------------------------------
+    # Index maintenance
+    #--------------------------------------------------------------------------------
+
+    def append(self, values, start_index):
+        '''
+        Adds the time values written at start_index (which must be the number
+        of indexed values) to the index.
+        '''
+        values = np.atleast_1d(np.asanyarray(values, dtype=np.float64))
+        if start_index != self.num_timesteps:
+            raise ValueError('Time index holds %s values, can not append at %s' % (self.num_timesteps, start_index))
+        mins, maxs, samples = list(self.mins), list(self.maxs), list(self.samples)
+        offset = 0
+        while offset < values.shape[0]:
+            position = self.num_timesteps + offset
+            block, block_offset = divmod(position, self.block_size)
+            chunk = values[offset:offset + self.block_size - block_offset]
+            if block_offset:
+                # Partially filled block
+                mins[block] = np.minimum(mins[block], chunk.min())
+                maxs[block] = np.maximum(maxs[block], chunk.max())
+            else:
+                mins.append(np.min(chunk))
+                maxs.append(np.max(chunk))
+                samples.append(chunk[0])
+            offset += chunk.shape[0]
+        self.num_timesteps += values.shape[0]
+        self.mins = np.array(mins, dtype=np.float64)
+        self.maxs = np.array(maxs, dtype=np.float64)
+        self.samples = np.array(samples, dtype=np.float64)
+
+    def has_nan(self):
+        return np.isnan(self.mins).any() or np.isnan(self.maxs).any()
+
+    #--------------------------------------------------------------------------------
+    # Queries
+    #--------------------------------------------------------------------------------
+
+    def bounds(self):
+        return (self.mins.min(), self.maxs.max())
+
+    def block_slice(self, block):
+        return slice(block * self.block_size, min((block + 1) * self.block_size, self.num_timesteps))
+
+    def find_nearest(self, coverage, val):
+        '''
+        Returns the index of the time value nearest to val, same as
+        TimeUtils.find_nearest over the complete time values (ties go to the
+        lowest index), reading only the blocks that can contain it.
+        '''
+        # The distance to the nearest value of a block is at least the distance to
+        # the block's range and at most the distance to its min or max
+        lower = np.maximum(np.maximum(self.mins - val, val - self.maxs), 0)
+        upper = np.minimum(np.abs(self.mins - val), np.abs(self.maxs - val))
+        candidates = np.where(lower <= upper.min())[0]
+
+        time_name = coverage.temporal_parameter_name
+        best_idx, best_dist = None, None
+        for block in candidates:
+            slice_ = self.block_slice(block)
+            values = np.atleast_1d(coverage.get_parameter_values(time_name, tdoa=slice_))
+            distances = np.abs(values - val)
+            idx = distances.argmin()
+            if best_dist is None or distances[idx] < best_dist:
+                best_idx, best_dist = slice_.start + idx, distances[idx]
+        return best_idx
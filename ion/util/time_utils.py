@@ -5,6 +5,8 @@ import time
 import netCDF4
 import numpy as np
 
+from ion.util.time_index import TimeIndex
+
 class TimeUtils(object):
 
     @classmethod
@@ -18,9 +20,27 @@ class TimeUtils(object):
         units = pc.uom
         if 'iso' in units:
             return None # Not sure how to implement this....  How do you compare iso strings effectively?
+        index = TimeIndex.for_coverage(coverage)
+        if index is not None:
+            return index.find_nearest(coverage, time)
         values = coverage.get_parameter_values(time_name)
         return cls.find_nearest(values,time)
 
+    @classmethod
+    def get_relative_times(cls, coverage, times):
+        '''
+        Determines the relative times in the coverage model for an array of times,
+        reading the coverage's time values only once.
+        Returns the same indices as calling get_relative_time for each time.
+        '''
+        time_name = coverage.temporal_parameter_name
+        pc = coverage.get_parameter_context(time_name)
+        units = pc.uom
+        if 'iso' in units:
+            return [None] * len(times)
+        values = coverage.get_parameter_values(time_name)
+        return cls.find_nearest_all(values, times)
+
     @classmethod
     def ts_to_units(cls,units, val):
         '''
@@ -64,3 +84,30 @@ class TimeUtils(object):
         '''
         idx = np.abs(arr-val).argmin()
         return idx
+
+    @classmethod
+    def find_nearest_all(cls, arr, vals):
+        '''
+        Vectorized find_nearest, returns the index of the best matching value in
+        arr for each value in vals.  Sorted arrays are resolved with a binary
+        search, ties go to the lowest index just like find_nearest.
+        '''
+        arr = np.atleast_1d(np.asanyarray(arr))
+        vals = np.atleast_1d(np.asanyarray(vals))
+        if not arr.size or not vals.size:
+            return np.array([cls.find_nearest(arr, v) for v in vals], dtype=np.intp)
+        if arr.shape[0] > 1 and not (arr[1:] >= arr[:-1]).all():
+            # Unsorted (or contains NaN), only the time values read is saved
+            return np.array([cls.find_nearest(arr, v) for v in vals], dtype=np.intp)
+
+        right = np.searchsorted(arr, vals, side='left')
+        left = right - 1
+        # The first index of the left candidate's value, arr[right] is already the first of its value
+        left_first = np.searchsorted(arr, arr[np.maximum(left, 0)], side='left')
+
+        right_clipped = np.minimum(right, arr.shape[0]-1)
+        left_dist = np.abs(arr[np.maximum(left, 0)] - vals)
+        right_dist = np.abs(arr[right_clipped] - vals)
+
+        use_left = (left >= 0) & ((right >= arr.shape[0]) | (left_dist <= right_dist))
+        return np.where(use_left, left_first, right_clipped)